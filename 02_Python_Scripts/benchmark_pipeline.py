@@ -0,0 +1,298 @@
+# -----------------------------
+# IMPORTS
+# -----------------------------
+## Standard libraries
+import time
+import json
+import argparse
+import platform
+import resource
+import tempfile
+import warnings
+import tracemalloc
+import multiprocessing as mp
+from pathlib import Path
+import pandas as pd
+import numpy as np
+## Third-party libraries
+import matplotlib
+matplotlib.use("Agg")  # the plotting stage must not open windows
+import matplotlib.pyplot as plt
+## Custom libraries
+import io_smash
+import quality_of_life as qol
+import smash_output_functions as sof
+import plotting as plot
+import synthetic_dileptons as synth
+
+# -----------------------------
+# CONSTANTS AND SETTINGS
+# -----------------------------
+# Parent particles of the synthetic dilepton blocks: (PDG ID, outgoing PDG IDs)
+SYNTHETIC_DECAYS = [
+    (111, [22, 11, -11]),   # pi0 Dalitz
+    (221, [22, 11, -11]),   # eta Dalitz
+    (2214, [2212, 11, -11]),  # Delta+ Dalitz
+    (113, [11, -11]),       # rho0 direct decay
+]
+
+# Benchmark suite: default file with the stored baseline timings, number of runs of the synthetic dataset and binning
+BENCHMARK_BASELINE_FILE = Path(__file__).resolve().parent / "benchmark_baseline.json"
+SUITE_N_RUNS = 4
+SUITE_BIN_EDGES = np.linspace(0, 0.7, 36)
+SUITE_FILE_NAME = "Dileptons.oscar"
+
+# -----------------------------
+# CLASSES AND FUNCTIONS
+# -----------------------------
+## Function to build a synthetic DataFrame in the layout of io_smash.read_smash_dilepton_output
+def make_parsed_frame(n_blocks: int, blocks_per_event: int = 3, seed: int = 0) -> pd.DataFrame:
+    '''
+    Builds a DataFrame with n_blocks decay blocks (one "in" row plus two or three "out" rows each),
+    laid out like the output of io_smash.read_smash_dilepton_output. Used to benchmark the pipeline
+    functions without SMASH output files.
+    '''
+    rng = np.random.default_rng(seed)
+    decay = rng.integers(len(SYNTHETIC_DECAYS), size=n_blocks)
+    n_out = np.array([len(out) for _, out in SYNTHETIC_DECAYS])[decay]
+    block_len = 1 + n_out
+    block_no = np.repeat(np.arange(n_blocks), block_len)
+    n_rows = block_no.size
+    # Position of each row within its block: 0 is the "in" particle, 1.. the decay products
+    pos = np.arange(n_rows) - np.repeat(np.cumsum(block_len) - block_len, block_len)
+    pdg_table = np.array([[parent] + out + [0] * (3 - len(out)) for parent, out in SYNTHETIC_DECAYS])
+    pdg = pdg_table[decay[block_no], pos]
+
+    df = pd.DataFrame({
+        "t": np.repeat(np.round(rng.uniform(0, 30, n_blocks), 3), block_len),
+        "x": rng.normal(size=n_rows), "y": rng.normal(size=n_rows), "z": rng.normal(size=n_rows),
+        "mass": np.full(n_rows, 0.1),
+        "p0": rng.uniform(0.1, 2.0, n_rows),
+        "px": rng.normal(scale=0.5, size=n_rows),
+        "py": rng.normal(scale=0.5, size=n_rows),
+        "pz": rng.normal(scale=0.5, size=n_rows),
+        "pdg": pdg.astype(np.float64),
+        "ID": np.arange(n_rows, dtype=np.float64),
+        "charge": np.sign(-pdg * (np.abs(pdg) == 11)).astype(np.float64),
+        "block_no": block_no,
+        "in_particles": np.ones(n_rows, dtype=np.int64),
+        "out_particles": n_out[block_no],
+        "block_weight": np.repeat(rng.uniform(1e-8, 1e-5, n_blocks), block_len),
+        "block_partial": np.repeat(rng.uniform(1e-7, 1e-4, n_blocks), block_len),
+        "block_type": np.full(n_rows, 5, dtype=np.int64),
+        "event": block_no // blocks_per_event,
+        "ensemble": np.zeros(n_rows, dtype=np.int64),
+        "io_role": np.where(pos == 0, "in", "out").astype(object),
+    })
+    return qol.apply_data_types(df, io_smash.OSCAR_DATA_TYPES)
+
+## Function to time a callable (best of repeat runs)
+def time_call(func, *args, repeat: int = 1) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+## Function to benchmark the vectorized pair aggregation against the groupby reference implementation
+def benchmark_aggregate_dilepton_pairs(n_rows: int, repeat: int = 1) -> dict:
+    df = make_parsed_frame(n_blocks=max(n_rows // 4, 1))
+    # Check both implementations agree before timing them
+    expected = io_smash._aggregate_dilepton_pairs_groupby(df)
+    result = io_smash.aggregate_dilepton_pairs(df)
+    sort_keys = ["event", "t", "block_no", "io_role", "p_pdg_id"]
+    pd.testing.assert_frame_equal(expected.sort_values(sort_keys).reset_index(drop=True),
+                                  result.sort_values(sort_keys).reset_index(drop=True))
+
+    t_groupby = time_call(io_smash._aggregate_dilepton_pairs_groupby, df, repeat=repeat)
+    t_vector = time_call(io_smash.aggregate_dilepton_pairs, df, repeat=repeat)
+    return {"rows": len(df), "groupby_s": t_groupby, "vectorized_s": t_vector, "speedup": t_groupby / t_vector}
+
+## Helper function to get the size of a parsed frame in the previous layout (float64 numbers, io_role as Python strings)
+def float64_object_layout_bytes(df: pd.DataFrame) -> int:
+    wide = {col: df[col].to_numpy(dtype=np.float64) for col in df.columns if col != "io_role"}
+    wide["io_role"] = df["io_role"].astype(object)
+    return int(pd.DataFrame(wide).memory_usage(deep=True).sum())
+
+## Worker function run in a fresh process: reads a file (engine None: imports only) and reports peak RSS and frame size
+def _peak_rss_worker(path: str, engine: str | None, queue) -> None:
+    frame_bytes = old_layout_bytes = 0
+    if engine is not None:
+        df = io_smash.read_smash_dilepton_output(path, engine=engine)
+        frame_bytes = int(df.memory_usage(deep=True).sum())
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        old_layout_bytes = float64_object_layout_bytes(df)
+    else:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in kB on Linux
+    queue.put((peak * 1024, frame_bytes, old_layout_bytes))
+
+## Function to measure the peak memory of reading a Dileptons.oscar file with both parser engines
+def benchmark_parser_memory(path: str) -> list[dict]:
+    '''
+    Every measurement runs in a freshly spawned process, so the peak resident set size (RSS) only contains the
+    interpreter, the imported modules (measured separately as "baseline") and the parse itself.
+    '''
+    ctx = mp.get_context("spawn")
+    results = []
+    for engine in (None, "legacy", "fast"):
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_peak_rss_worker, args=(str(path), engine, queue))
+        proc.start()
+        peak, frame_bytes, old_layout_bytes = queue.get()
+        proc.join()
+        results.append({"engine": engine or "baseline", "peak_rss": peak, "frame_bytes": frame_bytes,
+                        "old_layout_bytes": old_layout_bytes})
+    return results
+
+## Function to time a callable (best of repeat runs) and measure its peak memory allocation (one extra traced run)
+def measure_call(func, repeat: int = 1) -> tuple[float, int, object]:
+    '''
+    Returns the best wall time of repeat untraced runs, the peak memory allocated during one run traced with
+    tracemalloc (numpy and pandas buffers included) and the result of the last run.
+    '''
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak, result
+
+## Helper function to plot the spectra without showing or saving the figure
+def _plot_spectra(df: pd.DataFrame) -> None:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # plt.show() warns about the non-interactive Agg backend
+        plot.plot_hist_multiple(df, "m_inv", "block_weight_adj", SUITE_BIN_EDGES)
+    plt.close("all")
+
+## Function to benchmark the pipeline stages on a synthetic dataset of one scale
+def benchmark_pipeline_stages(work_dir: str | Path, n_events: int, n_runs: int = SUITE_N_RUNS, repeat: int = 1,
+                              seed: int = 0) -> list[dict]:
+    '''
+    Writes n_runs synthetic Dileptons.oscar files with n_events events each (synthetic_dileptons) below work_dir and
+    times read_smash_dilepton_output, aggregate_dilepton_pairs, enrich_dilepton_with_parent, adjust_shining_weights
+    (on the first run), aggregate_runs (all runs, serial) and plot_hist_multiple (all runs).
+
+    :return: One record per stage with rows in/out, bytes read, best wall time, throughput (rows/s, MB/s)
+     and peak allocated memory
+    :rtype: list[dict]
+    '''
+    data_dir = f"synthetic_{n_events}"
+    summaries = synth.write_synthetic_dataset(work_dir, data_dir, n_runs, filename=SUITE_FILE_NAME,
+                                              n_events=n_events, seed=seed)
+    first_file = summaries[0]["path"]
+
+    # Inputs of the stages: the output of the previous stage (enrich and adjust modify their input, hence the copies)
+    parsed = io_smash.read_smash_dilepton_output(first_file)
+    aggregated = io_smash.aggregate_dilepton_pairs(parsed)
+    with_m_inv = sof.calculate_invariant_mass(aggregated.copy(), col_energy="p0", col_px="px", col_py="py", col_pz="pz")
+    enriched = sof.enrich_dilepton_with_parent(with_m_inv.copy())
+    all_runs = sof.aggregate_runs(work_dir, data_dir, SUITE_FILE_NAME)
+
+    stages = [
+        ("read_smash_dilepton_output", lambda: io_smash.read_smash_dilepton_output(first_file),
+         summaries[0]["n_rows"], summaries[0]["n_bytes"]),
+        ("aggregate_dilepton_pairs", lambda: io_smash.aggregate_dilepton_pairs(parsed), len(parsed), 0),
+        ("enrich_dilepton_with_parent", lambda: sof.enrich_dilepton_with_parent(with_m_inv.copy()), len(with_m_inv), 0),
+        ("adjust_shining_weights", lambda: sof.adjust_shining_weights(enriched.copy()), len(enriched), 0),
+        ("aggregate_runs", lambda: sof.aggregate_runs(work_dir, data_dir, SUITE_FILE_NAME),
+         sum(summary["n_rows"] for summary in summaries), sum(summary["n_bytes"] for summary in summaries)),
+        ("plot_hist_multiple", lambda: _plot_spectra(all_runs), len(all_runs), 0),
+    ]
+    results = []
+    for stage, func, rows_in, n_bytes in stages:
+        seconds, peak, result = measure_call(func, repeat=repeat)
+        results.append({
+            "stage": stage, "n_events": n_events, "n_runs": n_runs if stage == "aggregate_runs" else 1,
+            "rows_in": int(rows_in), "rows_out": len(result) if isinstance(result, pd.DataFrame) else 0,
+            "bytes_read": int(n_bytes), "seconds": seconds,
+            "rows_per_s": rows_in / seconds if seconds > 0 else float("nan"),
+            "mb_per_s": n_bytes / 1024**2 / seconds if n_bytes and seconds > 0 else float("nan"),
+            "peak_mb": peak / 1024**2,
+        })
+    return results
+
+## Function to run the benchmark suite at several scales
+def run_benchmark_suite(scales: list[int], n_runs: int = SUITE_N_RUNS, repeat: int = 1,
+                        work_dir: str | Path | None = None) -> dict:
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        results = [res for n_events in scales for res in benchmark_pipeline_stages(tmp_dir, n_events, n_runs, repeat)]
+    return {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+            "numpy": np.__version__, "pandas": pd.__version__, "host": platform.node(), "results": results}
+
+## Function to compare suite results with a stored baseline (ratio of wall times, > 1 means slower than the baseline)
+def compare_with_baseline(suite: dict, baseline: dict) -> list[dict]:
+    reference = {(res["stage"], res["n_events"]): res for res in baseline["results"]}
+    comparison = []
+    for res in suite["results"]:
+        base = reference.get((res["stage"], res["n_events"]))
+        if base is None:
+            continue
+        comparison.append({"stage": res["stage"], "n_events": res["n_events"], "seconds": res["seconds"],
+                           "baseline_seconds": base["seconds"], "time_ratio": res["seconds"] / base["seconds"],
+                           "peak_mb": res["peak_mb"], "baseline_peak_mb": base["peak_mb"]})
+    return comparison
+
+## Function to print the suite results (and the comparison with the baseline, if given)
+def print_suite(suite: dict, comparison: list[dict] | None = None) -> None:
+    print(f"{'stage':<28} {'events':>8} {'rows in':>10} {'rows out':>10} {'time [s]':>9} {'rows/s':>11} "
+          f"{'MB/s':>7} {'peak [MB]':>10}")
+    for res in suite["results"]:
+        print(f"{res['stage']:<28} {res['n_events']:>8,} {res['rows_in']:>10,} {res['rows_out']:>10,} "
+              f"{res['seconds']:>9.3f} {res['rows_per_s']:>11,.0f} {res['mb_per_s']:>7.1f} {res['peak_mb']:>10.1f}")
+    if comparison:
+        print(f"\n{'stage':<28} {'events':>8} {'time [s]':>9} {'baseline [s]':>13} {'ratio':>7} "
+              f"{'peak [MB]':>10} {'baseline [MB]':>14}")
+        for cmp in comparison:
+            print(f"{cmp['stage']:<28} {cmp['n_events']:>8,} {cmp['seconds']:>9.3f} {cmp['baseline_seconds']:>13.3f} "
+                  f"{cmp['time_ratio']:>6.2f}x {cmp['peak_mb']:>10.1f} {cmp['baseline_peak_mb']:>14.1f}")
+
+# -----------------------------
+# MAIN SCRIPT
+# -----------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the dilepton analysis pipeline on synthetic data.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000, 3_000_000],
+                        help="numbers of parsed rows to benchmark")
+    parser.add_argument("--repeat", type=int, default=1, help="repetitions per timing (best is reported)")
+    parser.add_argument("--oscar-file", default=None, help="Dileptons.oscar file for the parser peak memory comparison")
+    parser.add_argument("--suite", action="store_true",
+                        help="run the pipeline benchmark suite on synthetic Dileptons.oscar files instead")
+    parser.add_argument("--events", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                        help="events per run file at which the suite is run")
+    parser.add_argument("--runs", type=int, default=SUITE_N_RUNS, help="number of run files for aggregate_runs")
+    parser.add_argument("--baseline", default=BENCHMARK_BASELINE_FILE, help="baseline file (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="store the suite results as new baseline")
+    parser.add_argument("--work-dir", default=None, help="directory for the synthetic files (default: system temp)")
+    args = parser.parse_args()
+
+    if args.suite:
+        suite = run_benchmark_suite(args.events, n_runs=args.runs, repeat=args.repeat, work_dir=args.work_dir)
+        baseline_file = Path(args.baseline)
+        comparison = None
+        if args.save_baseline:
+            baseline_file.write_text(json.dumps(suite, indent=2))
+            print(f"Baseline saved to {baseline_file}")
+        elif baseline_file.exists():
+            comparison = compare_with_baseline(suite, json.loads(baseline_file.read_text()))
+        print_suite(suite, comparison)
+    else:
+        if args.oscar_file is not None:
+            mb = 1024**2
+            print(f"{'engine':>10} {'peak RSS [MB]':>14} {'frame [MB]':>11} {'float64/object layout [MB]':>27}")
+            for res in benchmark_parser_memory(args.oscar_file):
+                print(f"{res['engine']:>10} {res['peak_rss'] / mb:>14.1f} {res['frame_bytes'] / mb:>11.1f} "
+                      f"{res['old_layout_bytes'] / mb:>27.1f}")
+
+        print(f"{'rows':>12} {'groupby [s]':>12} {'vectorized [s]':>15} {'speedup':>8}")
+        for n_rows in args.rows:
+            res = benchmark_aggregate_dilepton_pairs(n_rows, repeat=args.repeat)
+            print(f"{res['rows']:>12,} {res['groupby_s']:>12.3f} {res['vectorized_s']:>15.3f} {res['speedup']:>7.1f}x")
+# End of script
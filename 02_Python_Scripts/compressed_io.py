@@ -0,0 +1,173 @@
+# -----------------------------
+# IMPORTS
+# -----------------------------
+## Standard libraries
+import io
+import gzip
+import lzma
+import queue
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+## Third-party libraries
+try:
+    import zstandard  # optional, only needed for .zst files
+except ImportError:
+    zstandard = None
+## Custom libraries
+
+# -----------------------------
+# CONSTANTS AND SETTINGS
+# -----------------------------
+# Supported compressions: file name suffix and magic bytes at the start of the file
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst", "xz": ".xz"}
+COMPRESSION_MAGIC = {"gzip": b"\x1f\x8b", "zstd": b"\x28\xb5\x2f\xfd", "xz": b"\xfd7zXZ\x00"}
+# Size of the decompressed blocks handed from the decompression thread to the parser and number of blocks buffered
+DECOMPRESS_CHUNK_BYTES = 1024**2
+DECOMPRESS_QUEUE_CHUNKS = 8
+
+# -----------------------------
+# CLASSES AND FUNCTIONS
+# -----------------------------
+## Function to detect the compression of a file from its suffix, otherwise from its magic bytes (None: plain file)
+def detect_compression(path: str | Path) -> Optional[str]:
+    path = Path(path)
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if path.name.endswith(suffix):
+            return compression
+    with open(path, "rb") as f:
+        head = f.read(max(len(magic) for magic in COMPRESSION_MAGIC.values()))
+    for compression, magic in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+## Function to remove a compression suffix from a path (Dileptons.oscar.gz -> Dileptons.oscar)
+def strip_compression_suffix(path: str | Path) -> Path:
+    path = Path(path)
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if path.name.endswith(suffix):
+            return path.with_name(path.name[: -len(suffix)])
+    return path
+
+## Function to find a file or, if it does not exist, a compressed variant of it (path + .gz/.zst/.xz)
+def find_existing_variant(path: str | Path) -> Optional[Path]:
+    path = Path(path)
+    if path.exists():
+        return path
+    for suffix in COMPRESSION_SUFFIXES.values():
+        candidate = path.with_name(path.name + suffix)
+        if candidate.exists():
+            return candidate
+    return None
+
+## Helper function to get the function opening a compressed file as binary stream of decompressed bytes
+def _decompressing_opener(compression: str) -> Callable[[Path], io.IOBase]:
+    if compression == "gzip":
+        return lambda path: gzip.open(path, "rb")
+    if compression == "xz":
+        return lambda path: lzma.open(path, "rb")
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("Reading .zst files needs the 'zstandard' package (pip install zstandard).")
+        return lambda path: zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True,
+                                                                       closefd=True)
+    raise ValueError(f"Unknown compression: {compression!r}")
+
+## Class streaming the decompressed bytes of a file, decompressed in a background thread
+class ThreadedDecompressor(io.RawIOBase):
+    '''
+    Raw binary stream whose data is decompressed by a separate thread in blocks of chunk_bytes. At most max_chunks
+    blocks are buffered, so the memory stays bounded and the decompression (which releases the GIL in zlib, lzma and
+    zstandard) overlaps with the parsing in the consuming thread. Errors of the decompression thread are raised by read.
+    '''
+    def __init__(self, path: str | Path, compression: str, chunk_bytes: int = DECOMPRESS_CHUNK_BYTES,
+                 max_chunks: int = DECOMPRESS_QUEUE_CHUNKS):
+        super().__init__()
+        opener = _decompressing_opener(compression)
+        self._queue: queue.Queue = queue.Queue(maxsize=max_chunks)
+        self._stop = threading.Event()
+        self._pending = memoryview(b"")
+        self._eof = False
+        self._thread = threading.Thread(target=self._decompress, args=(opener, Path(path), chunk_bytes), daemon=True)
+        self._thread.start()
+
+    ## Body of the decompression thread
+    def _decompress(self, opener, path: Path, chunk_bytes: int) -> None:
+        try:
+            with opener(path) as f:
+                while not self._stop.is_set():
+                    data = f.read(chunk_bytes)
+                    if not data:
+                        break
+                    self._put(data)
+            self._put(None)  # end of file
+        except BaseException as e:
+            self._put(e)
+
+    ## Put a block into the queue unless the stream was closed in the meantime
+    def _put(self, item) -> None:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self._pending:
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if item is None:
+                self._eof = True
+                return 0
+            if isinstance(item, BaseException):
+                self._eof = True
+                raise item
+            self._pending = memoryview(item)
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self._stop.set()
+            # Unblock the thread if it waits for a free slot in the queue
+            while self._thread.is_alive():
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+                self._thread.join(timeout=0.05)
+        super().close()
+
+## Function to open a plain or compressed file as binary stream (compressed files are decompressed in a thread)
+def open_binary(path: str | Path) -> io.IOBase:
+    compression = detect_compression(path)
+    if compression is None:
+        return open(path, "rb")
+    return io.BufferedReader(ThreadedDecompressor(path, compression), buffer_size=DECOMPRESS_CHUNK_BYTES)
+
+## Function to open a plain or compressed file as text stream (compressed files are decompressed in a thread)
+def open_text(path: str | Path, encoding: str = "utf-8", errors: str = "replace") -> io.TextIOBase:
+    compression = detect_compression(path)
+    if compression is None:
+        return open(path, "r", encoding=encoding, errors=errors)
+    return io.TextIOWrapper(open_binary(path), encoding=encoding, errors=errors)
+
+# -----------------------------
+# MAIN SCRIPT
+# -----------------------------
+if __name__ == "__main__":
+    import sys
+    # Example: python compressed_io.py Dileptons.oscar.gz (prints compression and number of lines)
+    for file_path in sys.argv[1:]:
+        with open_text(file_path) as f:
+            n_lines = sum(1 for _ in f)
+        print(f"{file_path}: compression {detect_compression(file_path)}, {n_lines:,} lines")
+# End of script
@@ -0,0 +1,137 @@
+# -----------------------------
+# IMPORTS
+# -----------------------------
+## Standard libraries
+from __future__ import annotations
+import time
+import numpy as np
+## Third-party libraries
+## Custom libraries
+
+# -----------------------------
+# CONSTANTS AND SETTINGS
+# -----------------------------
+# Number of grid points of the binned KDE (its cost grows with this number, not with the number of samples)
+KDE_GRID_SIZE = 2048
+# The grid (and the kernel) extends this many bandwidths beyond the data
+KDE_CUT = 3.0
+# Bandwidth rules (same definitions as scipy.stats.gaussian_kde, so both engines give the same curves)
+BANDWIDTH_METHODS = ("scott", "silverman")
+
+# -----------------------------
+# CLASSES AND FUNCTIONS
+# -----------------------------
+## Helper function to get finite values and their weights as float64 arrays
+def _clean_samples(values, weights=None) -> tuple[np.ndarray, np.ndarray]:
+    values = np.asarray(values, dtype=np.float64).ravel()
+    weights = np.ones_like(values) if weights is None else np.asarray(weights, dtype=np.float64).ravel()
+    if weights.shape != values.shape:
+        raise ValueError("values and weights must have the same length")
+    keep = np.isfinite(values) & np.isfinite(weights) & (weights > 0)
+    if not keep.any():
+        raise ValueError("No finite samples with positive weight to estimate a density from")
+    return values[keep], weights[keep]
+
+## Function to get the bandwidth (standard deviation of the Gaussian kernel) of weighted samples
+def kde_bandwidth(values, weights=None, method: str | float = "scott") -> float:
+    '''
+    :param values: Samples
+    :param (optional, default = None) weights: Weight of every sample (e.g. block_weight_adj), None: unweighted
+    :param (optional, default = "scott") method: "scott" (n_eff^(-1/5)), "silverman" ((3 n_eff / 4)^(-1/5)) or a number;
+     the result is this factor times the weighted standard deviation, like bw_method of scipy.stats.gaussian_kde.
+     n_eff = (sum w)^2 / sum w^2 is the effective number of samples
+    :type method: str | float
+    :return: Bandwidth in units of the samples
+    :rtype: float
+    '''
+    values, weights = _clean_samples(values, weights)
+    n_eff = weights.sum() ** 2 / (weights**2).sum()
+    if method == "scott":
+        factor = n_eff ** (-1 / 5)
+    elif method == "silverman":
+        factor = (n_eff * 3 / 4) ** (-1 / 5)
+    elif isinstance(method, (int, float)) and not isinstance(method, bool) and method > 0:
+        factor = float(method)
+    else:
+        raise ValueError(f"Unknown bandwidth method: {method!r} (expected one of {BANDWIDTH_METHODS} or a positive number)")
+    # Weighted standard deviation with the same (unbiased) normalisation as np.cov(values, aweights=weights)
+    mean = np.average(values, weights=weights)
+    variance = np.sum(weights * (values - mean) ** 2) / (weights.sum() * (1 - 1 / n_eff)) if n_eff > 1 else 0.0
+    std = np.sqrt(variance)
+    if std == 0:
+        # All samples at one point: fall back to a bandwidth relative to its magnitude
+        std = max(abs(mean), 1.0) * 1e-3
+    return float(factor * std)
+
+## Function to estimate a (weighted) Gaussian KDE by binning the samples onto a grid and convolving with the kernel via FFT
+def binned_kde(values, weights=None, bandwidth: str | float = "scott", grid_size: int = KDE_GRID_SIZE,
+               cut: float = KDE_CUT, x=None) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    The samples are distributed linearly onto the two neighbouring points of an equidistant grid (one bincount),
+    the grid counts are convolved with the sampled Gaussian kernel by FFT (zero padded, no wrap-around) and the
+    result is normalised to unit area. Apart from the single binning pass the cost is O(grid_size log grid_size);
+    with grid spacings well below the bandwidth the result agrees with the exact KDE to a fraction of a percent.
+
+    :param values: Samples
+    :param (optional, default = None) weights: Weight of every sample (e.g. block_weight_adj), None: unweighted
+    :param (optional, default = "scott") bandwidth: Bandwidth rule or factor (see kde_bandwidth)
+    :type bandwidth: str | float
+    :param (optional, default = KDE_GRID_SIZE) grid_size: Number of grid points
+    :type grid_size: int
+    :param (optional, default = KDE_CUT) cut: Extension of the grid beyond the data in bandwidths
+    :type cut: float
+    :param (optional, default = None) x: Points to evaluate the density at (interpolated linearly between grid points);
+     None returns the density on the grid
+    :return: Evaluation points (grid or x) and the density at these points
+    :rtype: tuple[np.ndarray, np.ndarray]
+    '''
+    values, weights = _clean_samples(values, weights)
+    h = kde_bandwidth(values, weights, bandwidth)
+    lo, hi = values.min() - cut * h, values.max() + cut * h
+    grid = np.linspace(lo, hi, grid_size)
+    delta = grid[1] - grid[0]
+
+    # Linear binning: every sample splits its weight between the grid points left and right of it
+    pos = (values - lo) / delta
+    left = np.minimum(pos.astype(np.int64), grid_size - 2)
+    frac = pos - left
+    counts = (np.bincount(left, weights=weights * (1 - frac), minlength=grid_size)
+              + np.bincount(left + 1, weights=weights * frac, minlength=grid_size))
+    counts /= weights.sum()
+
+    # Kernel sampled on the grid spacing up to cut bandwidths (at most the grid length)
+    half = min(int(np.ceil(cut * h / delta)), grid_size - 1)
+    offsets = np.arange(-half, half + 1) * delta
+    kernel = np.exp(-0.5 * (offsets / h) ** 2) / (h * np.sqrt(2 * np.pi))
+    # Linear convolution via FFT: padded to a power of two of at least the full output length
+    n_fft = 1 << int(np.ceil(np.log2(grid_size + 2 * half)))
+    density = np.fft.irfft(np.fft.rfft(counts, n_fft) * np.fft.rfft(kernel, n_fft), n_fft)[half:half + grid_size]
+    # Round-off of the FFT can leave tiny negative values far from the data
+    np.maximum(density, 0, out=density)
+
+    if x is None:
+        return grid, density
+    x = np.asarray(x, dtype=np.float64)
+    return x, np.interp(x, grid, density, left=0.0, right=0.0)
+
+# -----------------------------
+# MAIN SCRIPT
+# -----------------------------
+if __name__ == "__main__":
+    # Comparison with scipy.stats.gaussian_kde on weighted samples and timing on 2 million samples
+    from scipy.stats import gaussian_kde
+    rng = np.random.default_rng(0)
+    samples = np.concatenate([rng.normal(0.14, 0.02, 5000), rng.exponential(0.2, 15000)])
+    sample_weights = rng.uniform(1e-7, 1e-5, samples.size)
+    x_vals = np.linspace(samples.min(), samples.max(), 500)
+    for method in BANDWIDTH_METHODS:
+        exact = gaussian_kde(samples, weights=sample_weights, bw_method=method)(x_vals)
+        _, binned = binned_kde(samples, sample_weights, bandwidth=method, x=x_vals)
+        print(f"{method:>9}: max deviation from gaussian_kde {np.max(np.abs(binned - exact)) / exact.max():.2e} (relative to peak)")
+
+    samples = rng.exponential(0.2, 2_000_000)
+    sample_weights = rng.uniform(1e-7, 1e-5, samples.size)
+    start = time.perf_counter()
+    binned_kde(samples, sample_weights)
+    print(f"binned_kde: {samples.size:,} weighted samples in {time.perf_counter() - start:.3f} s")
+# End of script
@@ -0,0 +1,209 @@
+# -----------------------------
+# IMPORTS
+# -----------------------------
+## Standard libraries
+import time
+import argparse
+from pathlib import Path
+import pandas as pd
+import numpy as np
+## Third-party libraries
+## Custom libraries
+import io_smash
+import run_cache
+import compressed_io
+
+# -----------------------------
+# CONSTANTS AND SETTINGS
+# -----------------------------
+# File name suffix of a shard, written next to the source file (Dileptons.oscar -> Dileptons.shard.npz)
+SHARD_SUFFIX = ".shard.npz"
+# Version of the shard layout (stored in the shard metadata)
+SHARD_VERSION = 1
+# Columns of the parsed frame kept in a shard: everything the dilepton pipeline (pair aggregation, invariant mass,
+# parent enrichment, weight adjustment) needs; positions, masses, IDs and charges are dropped
+SHARD_COLUMNS = ["t", "p0", "px", "py", "pz", "pdg", "event", "block_no", "io_role", "block_weight", "block_type"]
+# Columns needed for the per-run metadata (see _chunk_summary)
+SUMMARY_COLUMNS = ["pdg", "event", "block_no", "io_role", "block_weight", "block_type"]
+# Number of events parsed at once while writing a shard (only one chunk is held in memory, see write_dilepton_shard,
+# so this bounds the memory of the post-step in the SMASH job)
+SHARD_EVENTS_PER_CHUNK = 20000
+
+# -----------------------------
+# CLASSES AND FUNCTIONS
+# -----------------------------
+## Function to get the shard path belonging to a SMASH output file
+def shard_path_for(source_path: str | Path) -> Path:
+    # A compressed source shares the shard of the plain file (Dileptons.oscar.gz -> Dileptons.shard.npz)
+    source_path = compressed_io.strip_compression_suffix(source_path)
+    return source_path.with_name(source_path.stem + SHARD_SUFFIX)
+
+## Function to check whether a path is a shard
+def is_shard(path: str | Path) -> bool:
+    return str(path).endswith(SHARD_SUFFIX)
+
+## Function to check whether a shard was written from the current source file (size and mtime as stored in the shard)
+def is_current(shard_path: str | Path, source_path: str | Path) -> bool:
+    # Without the source file (e.g. deleted after the conversion) the shard is the only copy of the run and is used
+    source_path = Path(source_path)
+    if not source_path.exists():
+        return True
+    meta = read_shard_metadata(shard_path)
+    stat = source_path.stat()
+    return (meta.get("source_file") == source_path.name and meta.get("source_size") == stat.st_size
+            and meta.get("source_mtime_ns") == stat.st_mtime_ns)
+
+## Helper function to sum up the block structure of one parsed chunk
+def _chunk_summary(chunk: pd.DataFrame) -> dict:
+    # Empty-event rows (io_role "NA") and rows before the first interaction line do not belong to a block
+    in_block = ((chunk["io_role"] != "NA") & (chunk["block_no"] >= 0)).to_numpy()
+    block_no = chunk["block_no"].to_numpy()[in_block]
+    # Blocks are never split between chunks, the first row of a block carries its weight and type
+    block_ids, first = np.unique(block_no, return_index=True)
+    weights = chunk["block_weight"].to_numpy(dtype=np.float64)[in_block][first]
+    types = chunk["block_type"].to_numpy()[in_block][first]
+    weight_sum_per_type = {str(t): float(weights[types == t].sum()) for t in np.unique(types)}
+    # Dileptons as counted by the pipeline: one per block and io_role with leptons, rows without event number dropped
+    # (see io_smash.aggregate_dilepton_pairs); their pseudo-parent is the first "in" particle of the block
+    # (see smash_output_functions.enrich_dilepton_with_parent)
+    pdg = chunk["pdg"].to_numpy()[in_block]
+    io_role = chunk["io_role"].to_numpy()[in_block]
+    leptons = (np.abs(pdg) == 11) & (chunk["event"].to_numpy()[in_block] >= 0)
+    dilepton_blocks, dilepton_roles = block_no[leptons], io_role[leptons].astype(str)
+    n_dileptons = len(set(zip(dilepton_blocks.tolist(), dilepton_roles.tolist())))
+    is_in = io_role == "in"
+    in_blocks, in_first = np.unique(block_no[is_in], return_index=True)
+    parent = dict(zip(in_blocks.tolist(), pdg[is_in][in_first].tolist()))
+    weight_of_block = dict(zip(block_ids.tolist(), weights.tolist()))
+    weight_sum_per_parent: dict[str, float] = {}
+    for block in np.unique(dilepton_blocks).tolist():
+        key = str(parent.get(block, 0))
+        weight_sum_per_parent[key] = weight_sum_per_parent.get(key, 0.0) + weight_of_block[block]
+    return {
+        "n_rows": int(in_block.sum()),
+        "n_blocks": int(first.size),
+        "n_leptons": int((np.abs(pdg) == 11).sum()),
+        "n_dileptons": n_dileptons,
+        "n_empty_events": int((chunk["io_role"] == "NA").sum()),
+        "weight_sum": float(weights.sum()),
+        "weight_sum_per_type": weight_sum_per_type,
+        "weight_sum_per_parent": weight_sum_per_parent,
+        "max_event": int(chunk["event"].max()) if len(chunk) else -1,
+    }
+
+## Helper function to add the summary of one chunk to the summary of a whole file
+def _merge_summary(summary: dict, chunk_summary: dict) -> dict:
+    for key, value in chunk_summary.items():
+        if key == "max_event":
+            summary[key] = max(summary.get(key, -1), value)
+        elif isinstance(value, dict):
+            merged = summary.setdefault(key, {})
+            for sub_key, sub_value in value.items():
+                merged[sub_key] = merged.get(sub_key, 0.0) + sub_value
+        else:
+            summary[key] = summary.get(key, 0) + value
+    return summary
+
+## Function to get the per-run summary (events, empty events, blocks, dileptons, weight sums) of a Dileptons.oscar file
+def summarize_dilepton_file(source_path: str | Path, events_per_chunk: int = SHARD_EVENTS_PER_CHUNK) -> dict:
+    '''
+    Streams the file with io_smash.iter_smash_dilepton_chunks, parsing only SUMMARY_COLUMNS, and returns the same
+    summary as stored in the metadata of a shard (without writing one).
+    '''
+    summary = {}
+    for chunk in io_smash.iter_smash_dilepton_chunks(source_path, events_per_chunk=events_per_chunk, columns=SUMMARY_COLUMNS):
+        _merge_summary(summary, _chunk_summary(chunk))
+    if not summary:
+        summary = _chunk_summary(pd.DataFrame({col: pd.Series(dtype="int64") for col in SUMMARY_COLUMNS}))
+    # The file ends with an event line, whose end of file row carries the last event number (see io_smash)
+    summary["n_events"] = summary.pop("max_event") + 1
+    return summary
+
+## Function to get the per-run summary of an existing shard from its columns (e.g. for shards written without some of its keys)
+def summarize_dilepton_shard(shard_path: str | Path) -> dict:
+    summary = _chunk_summary(read_dilepton_shard(shard_path))
+    summary["n_events"] = summary.pop("max_event") + 1
+    return summary
+
+## Function to convert a Dileptons.oscar file into a compressed, typed columnar shard with per-run metadata
+def write_dilepton_shard(source_path: str | Path, shard_path: str | Path | None = None, columns: list[str] = SHARD_COLUMNS,
+                         events_per_chunk: int = SHARD_EVENTS_PER_CHUNK) -> Path:
+    '''
+    Streams the file with io_smash.iter_smash_dilepton_chunks, keeps the given columns in their compact dtypes
+    and writes them chunk by chunk (run_cache.FrameWriter, same format as run_cache.save_frame, no pickle) to
+    shard_path (default: next to the source file, see shard_path_for), so only one chunk is held in memory. The metadata stored in the shard contains the numbers of events, blocks, rows and leptons,
+    the sum of the block weights (in total, per process type and per pseudo-parent of the dileptons), the numbers of
+    empty events and dileptons and the size/mtime of the source file.
+
+    :param source_path: Path to the Dileptons.oscar file
+    :type source_path: str | Path
+    :param (optional, default = None) shard_path: Path of the shard to write
+    :type shard_path: str | Path | None
+    :param (optional, default = SHARD_COLUMNS) columns: Columns of the parsed frame to keep
+    :type columns: list[str]
+    :param (optional, default = SHARD_EVENTS_PER_CHUNK) events_per_chunk: Number of events parsed at once
+    :type events_per_chunk: int
+    :return: Path of the written shard
+    :rtype: Path
+    '''
+    source_path = Path(source_path)
+    shard_path = Path(shard_path) if shard_path is not None else shard_path_for(source_path)
+    summary = {}
+    # Only the kept columns and the columns needed for the summary are parsed
+    parse_columns = list(dict.fromkeys(list(columns) + SUMMARY_COLUMNS))
+    with run_cache.FrameWriter(shard_path, compressed=True) as writer:
+        for chunk in io_smash.iter_smash_dilepton_chunks(source_path, events_per_chunk=events_per_chunk, columns=parse_columns):
+            _merge_summary(summary, _chunk_summary(chunk))
+            writer.append(chunk[columns])
+        if not summary:
+            summary = _chunk_summary(pd.DataFrame({col: pd.Series(dtype="int64") for col in SUMMARY_COLUMNS}))
+
+        stat = source_path.stat()
+        attrs = {
+            "shard_version": SHARD_VERSION, "parser_version": io_smash.PARSER_VERSION,
+            "source_file": source_path.name, "source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns,
+            "run_dir": source_path.parent.name, "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            # The file ends with an event line, whose end of file row carries the last event number (see io_smash)
+            "n_events": summary.pop("max_event") + 1, **summary,
+        }
+        if writer.columns is not None:
+            writer.finish(attrs)
+        else:
+            # No chunk at all (file without data lines): empty frame with the kept columns
+            run_cache.save_frame(pd.DataFrame(columns=columns), shard_path, compressed=True, attrs=attrs)
+    return shard_path
+
+## Function to read a shard written by write_dilepton_shard
+def read_dilepton_shard(shard_path: str | Path) -> pd.DataFrame:
+    return run_cache.load_frame(shard_path)
+
+## Function to read only the per-run metadata of a shard
+def read_shard_metadata(shard_path: str | Path) -> dict:
+    return run_cache.load_attrs(shard_path)
+
+# -----------------------------
+# MAIN SCRIPT
+# -----------------------------
+if __name__ == "__main__":
+    # Post-step of a SMASH array task (see 03_Shell_Scripts/run_smash_basic.sh), e.g.
+    # python dilepton_shards.py <run_dir>/Dileptons.oscar --delete-source
+    parser = argparse.ArgumentParser(description="Convert Dileptons.oscar files into compressed columnar shards.")
+    parser.add_argument("paths", nargs="+", help="Dileptons.oscar files to convert (or shards with --info)")
+    parser.add_argument("--events-per-chunk", type=int, default=SHARD_EVENTS_PER_CHUNK, help="events parsed at once")
+    parser.add_argument("--delete-source", action="store_true", help="delete the text file after a successful conversion")
+    parser.add_argument("--info", action="store_true", help="only print the metadata of existing shards")
+    args = parser.parse_args()
+
+    for path in map(Path, args.paths):
+        if args.info:
+            print(f"{path}: {read_shard_metadata(path)}")
+            continue
+        start = time.perf_counter()
+        shard = write_dilepton_shard(path, events_per_chunk=args.events_per_chunk)
+        meta = read_shard_metadata(shard)
+        print(f"{path} -> {shard}: {meta['n_events']:,} events, {meta['n_blocks']:,} blocks, "
+              f"{meta['source_size'] / 1024**2:.1f} MB -> {shard.stat().st_size / 1024**2:.1f} MB "
+              f"in {time.perf_counter() - start:.1f} s")
+        if args.delete_source:
+            path.unlink()
+# End of script
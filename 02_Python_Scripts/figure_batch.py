@@ -0,0 +1,183 @@
+# -----------------------------
+# IMPORTS
+# -----------------------------
+## Standard libraries
+from __future__ import annotations
+import time
+from pathlib import Path
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+## Third-party libraries
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+## Custom libraries
+import quality_of_life as qol
+import plotting
+
+# -----------------------------
+# CONSTANTS AND SETTINGS
+# -----------------------------
+# Drawing functions of the plot kinds (each draws onto given axes, see plotting.py)
+PLOT_KINDS = {
+    "hist_multiple": plotting.draw_hist_multiple,
+    "hist_accumulated": plotting.draw_hist_accumulated,
+    "histogram": plotting.draw_histogram,
+    "dataset_comparison": plotting.draw_dataset_comparison,
+}
+# Resolution of the written figures
+BATCH_DPI = 100
+
+# Data sets of the current batch (set in every worker process by _init_worker, so they are sent once per worker
+# and not once per figure)
+_BATCH_DATA: dict = {}
+
+# -----------------------------
+# CLASSES AND FUNCTIONS
+# -----------------------------
+## Dataclass to describe one figure of a batch
+@dataclass
+class PlotSpec:
+    # Plot kind (key of PLOT_KINDS), output file name (below the figure directory) and name of the data set
+    kind: str
+    file_name: str
+    data: str = "default"
+    # Keyword arguments of the drawing function (e.g. col_bin_axis, col_weight, bin_edges for "hist_multiple")
+    options: dict = field(default_factory=dict)
+    figsize: tuple = (8, 5)
+
+## Helper function to store the data sets of a batch in a worker process
+def _init_worker(data: dict) -> None:
+    global _BATCH_DATA
+    _BATCH_DATA = data
+
+## Worker function rendering a list of figures into one reused Agg figure; errors are returned per figure
+def _render_specs(specs: list[tuple[int, PlotSpec]], figure_dir: str, dpi: int) -> list[tuple[int, str, float, str | None]]:
+    # A plain Figure with an Agg canvas: no pyplot state, no GUI backend and nothing to close
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    results = []
+    for index, spec in specs:
+        start = time.perf_counter()
+        try:
+            if len(fig.axes) != 1:
+                # A previous figure added axes (e.g. a twin axis): start from a fresh single axes
+                fig.clear()
+                ax = fig.add_subplot()
+            else:
+                ax.clear()
+                ax.set_xscale("linear")
+                ax.set_yscale("linear")
+            fig.set_size_inches(spec.figsize)
+            PLOT_KINDS[spec.kind](ax, _BATCH_DATA[spec.data], **spec.options)
+            # tight_layout already fits the labels, so savefig does not need a second (bbox_inches="tight") draw
+            fig.tight_layout()
+            fig.savefig(qol.get_save_path(figure_dir, spec.file_name), dpi=dpi)
+            results.append((index, spec.file_name, time.perf_counter() - start, None))
+        except Exception as e:
+            results.append((index, spec.file_name, time.perf_counter() - start, f"{type(e).__name__}: {e}"))
+    return results
+
+## Function to render a batch of figures headless (Agg) in a process pool and write them to the figure directory
+def render_figures(specs: list[PlotSpec], data, figure_dir: str | Path = plotting.FIGURE_DIR, n_workers: int | None = None,
+                   dpi: int = BATCH_DPI) -> list[Path]:
+    '''
+    The figures are split round-robin between the workers; every worker reuses one figure and axes object for all
+    its figures (cleared between them) and writes them with savefig, so nothing is shown and no pyplot figures pile
+    up. The data sets are handed to each worker once when the pool starts. Failed figures are reported and skipped.
+
+    :param specs: Figures to render
+    :type specs: list[PlotSpec]
+    :param data: Data set name -> DataFrame (DileptonHistogram for "hist_accumulated", dict label -> DileptonHistogram
+     for "dataset_comparison"); a single object is used as data set "default"
+    :param (optional, default = plotting.FIGURE_DIR) figure_dir: Directory the figures are written to
+    :type figure_dir: str | Path
+    :param (optional, default = None) n_workers: Number of worker processes. If None, SLURM_CPUS_PER_TASK or the
+     number of CPUs is used (see qol.get_default_workers); 1 renders in this process
+    :type n_workers: int | None
+    :param (optional, default = BATCH_DPI) dpi: Resolution of the figures
+    :type dpi: int
+    :return: Paths of the written figures, in the order of specs
+    :rtype: list[Path]
+    '''
+    data = data if isinstance(data, dict) else {"default": data}
+    unknown = sorted({spec.kind for spec in specs if spec.kind not in PLOT_KINDS})
+    if unknown:
+        raise ValueError(f"Unknown plot kinds {unknown} (expected one of {sorted(PLOT_KINDS)})")
+    missing = sorted({spec.data for spec in specs if spec.data not in data})
+    if missing:
+        raise ValueError(f"Data sets {missing} are missing (given: {sorted(data)})")
+
+    start = time.perf_counter()
+    n_workers = min(n_workers or qol.get_default_workers(), len(specs))
+    figure_dir = str(figure_dir)
+    # The specs carry their position, so the results can be put back into the order of specs
+    indexed_specs = list(enumerate(specs))
+    if n_workers > 1:
+        batches = [indexed_specs[i::n_workers] for i in range(n_workers)]
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(data,)) as pool:
+            results = [r for batch in pool.map(_render_specs, batches, [figure_dir] * n_workers, [dpi] * n_workers)
+                       for r in batch]
+    else:
+        _init_worker(data)
+        results = _render_specs(indexed_specs, figure_dir, dpi)
+        _init_worker({})
+    results.sort(key=lambda result: result[0])
+
+    written = []
+    for _, file_name, _, message in results:
+        if message is not None:
+            print(f"skip failed figure: {file_name} ({message})")
+            continue
+        written.append(Path(figure_dir) / file_name)
+    render_time = sum(seconds for _, _, seconds, _ in results)
+    print(f"Rendered {len(written)}/{len(specs)} figures to {figure_dir} in {time.perf_counter() - start:.2f} s "
+          f"wall time ({render_time:.2f} s rendering, {max(n_workers, 1)} workers)")
+    return written
+
+## Function to build the specs of dilepton spectra for several observables and binnings (all channels and one figure per channel)
+def spectrum_specs(observables: dict, col_weight: str = "block_weight_adj", channels: list[int] | tuple = (),
+                   data: str = "default", prefix: str = "Hist", **options) -> list[PlotSpec]:
+    '''
+    :param observables: Column -> list of bin edge arrays (e.g. {"m_inv": [np.linspace(0, 0.7, 36), ...]})
+    :type observables: dict
+    :param (optional, default = "block_weight_adj") col_weight: Weight column
+    :type col_weight: str
+    :param (optional, default = ()) channels: Pseudo-parent PDG IDs that get a figure of their own (next to the
+     figure with all channels)
+    :type channels: list[int] | tuple
+    :param (optional, default = "Hist") prefix: Prefix of the file names <prefix>_<column>_<n_bins>bins[_<channel>].png
+    :type prefix: str
+    :return: Specs of kind "hist_multiple" (further keyword arguments are passed to plotting.draw_hist_multiple)
+    :rtype: list[PlotSpec]
+    '''
+    specs = []
+    for col, binnings in observables.items():
+        x_label = None if col == "m_inv" else col
+        for bin_edges in binnings:
+            bin_edges = np.asarray(bin_edges)
+            base = f"{prefix}_{col}_{len(bin_edges) - 1}bins"
+            for channel in [None, *channels]:
+                specs.append(PlotSpec(
+                    kind="hist_multiple", data=data,
+                    file_name=f"{base}.png" if channel is None else f"{base}_{channel}.png",
+                    options={"col_bin_axis": col, "col_weight": col_weight, "bin_edges": bin_edges,
+                             "channels": None if channel is None else [channel], "x_label": x_label, **options},
+                ))
+    return specs
+
+# -----------------------------
+# MAIN SCRIPT
+# -----------------------------
+if __name__ == "__main__":
+    # Example: python figure_batch.py <root_dir> <data_dir> (renders m_inv and pT spectra of all runs in several binnings)
+    import sys
+    import smash_output_functions as sof
+    df = sof.aggregate_runs(sys.argv[1], sys.argv[2], "Dileptons.oscar")
+    df["pt"] = np.hypot(df["px"], df["py"])
+    channel_ids = sorted(int(id) for id in df.loc[df["p_pdg_id"] == -1111, "p_parent_pdg_id"].unique() if id != 0)
+    specs = spectrum_specs({"m_inv": [np.linspace(0, 0.7, n + 1) for n in (35, 70, 140)],
+                            "pt": [np.linspace(0, 1.0, n + 1) for n in (25, 50)]}, channels=channel_ids)
+    render_figures(specs, df, figure_dir=sys.argv[3] if len(sys.argv) > 3 else plotting.FIGURE_DIR)
+# End of script
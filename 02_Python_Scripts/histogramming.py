@@ -0,0 +1,434 @@
+# -----------------------------
+# IMPORTS
+# -----------------------------
+## Standard libraries
+from __future__ import annotations
+import json
+import time
+from pathlib import Path
+import pandas as pd
+import numpy as np
+## Third-party libraries
+## Custom libraries
+
+# -----------------------------
+# CONSTANTS AND SETTINGS
+# -----------------------------
+# Pseudo PDG ID of aggregated dileptons (see io_smash.aggregate_dilepton_pairs)
+DILEPTON_PDG_ID = -1111
+# Normalisations of the spectra: "per_run" divides the weights of every run by the dilepton events of that run and
+# sums over the runs (as summing block_weight_adj of smash_output_functions.adjust_shining_weights does, e.g. in
+# plotting.plot_hist_multiple); "total" divides the summed weights by the dilepton events of all runs (the average
+# over the runs, i.e. smaller by about the number of runs)
+NORMALIZATIONS = ("per_run", "total")
+
+# -----------------------------
+# CLASSES AND FUNCTIONS
+# -----------------------------
+## Helper function to get the bin index of every value (np.histogram convention: last bin includes the right edge, -1 outside)
+def bin_indices(values: np.ndarray, bin_edges: np.ndarray) -> np.ndarray:
+    n_bins = len(bin_edges) - 1
+    idx = np.searchsorted(bin_edges, values, side="right") - 1
+    idx[values == bin_edges[-1]] = n_bins - 1
+    idx[(idx < 0) | (idx >= n_bins) | np.isnan(values)] = -1
+    return idx
+
+## Function to histogram values of several groups at once with one weighted bincount over the combined (group, bin) index
+def grouped_bincount(values: np.ndarray, groups: np.ndarray, bin_edges: np.ndarray,
+                     weights: np.ndarray | None = None, squared: bool = False) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+    '''
+    :param values: Values to histogram (digitized once)
+    :param groups: Group label of every value (e.g. p_parent_pdg_id)
+    :param bin_edges: Bin edges (np.histogram convention)
+    :param (optional) weights: Weight of every value (None: unweighted)
+    :param (optional, default = False) squared: If True, the sums of squared weights are returned as well
+    :return: Sorted unique group labels, weighted counts with shape (n_groups, n_bins) and (if squared) the sums of squared weights
+    '''
+    n_bins = len(bin_edges) - 1
+    idx = bin_indices(np.asarray(values, dtype=np.float64), bin_edges)
+    inside = idx >= 0
+    group_ids, group_idx = np.unique(np.asarray(groups)[inside], return_inverse=True)
+    flat = group_idx * n_bins + idx[inside]
+    size = len(group_ids) * n_bins
+    w = None if weights is None else np.asarray(weights, dtype=np.float64)[inside]
+    sumw = np.bincount(flat, weights=w, minlength=size).reshape(-1, n_bins)
+    sumw2 = None
+    if squared:
+        sumw2 = np.bincount(flat, weights=(w ** 2 if w is not None else None), minlength=size).reshape(-1, n_bins)
+    return group_ids, sumw, sumw2
+
+## Class to accumulate weighted dilepton histograms per parent channel, run by run or chunk by chunk
+class DileptonHistogram:
+    '''
+    Streaming histogram of dilepton entries (p_pdg_id == -1111) split per pseudo-parent PDG ID (p_parent_pdg_id).
+    Per channel and bin the sum of weights and the sum of squared weights are kept, together with the number of events
+    used for the normalisation and the same sums with every fill normalised by its own events (for the "per_run"
+    normalisation, see NORMALIZATIONS; every fill has to be a complete run then), so the memory needed does not
+    depend on the number of filled runs. Histograms with the
+    same binning can be merged (e.g. results of different worker processes) and stored to / loaded from disk.
+    '''
+    def __init__(self, bin_edges, col_bin_axis: str = "m_inv", col_weight: str = "block_weight"):
+        self.bin_edges = np.asarray(bin_edges, dtype=np.float64)
+        self.col_bin_axis = col_bin_axis
+        self.col_weight = col_weight
+        self.sumw: dict[int, np.ndarray] = {}
+        self.sumw2: dict[int, np.ndarray] = {}
+        # Sums of the weights divided by the events of their fill (and of their squares)
+        self.sumw_run: dict[int, np.ndarray] = {}
+        self.sumw2_run: dict[int, np.ndarray] = {}
+        self.n_events = 0
+        self.n_fills = 0
+
+    @property
+    def n_bins(self) -> int:
+        return len(self.bin_edges) - 1
+
+    @property
+    def centers(self) -> np.ndarray:
+        return 0.5 * (self.bin_edges[1:] + self.bin_edges[:-1])
+
+    @property
+    def channels(self) -> list[int]:
+        return sorted(self.sumw)
+
+    ## Add weighted counts of one channel
+    def _add(self, channel: int, sumw: np.ndarray, sumw2: np.ndarray, sumw_run: np.ndarray, sumw2_run: np.ndarray) -> None:
+        if channel not in self.sumw:
+            for sums in (self.sumw, self.sumw2, self.sumw_run, self.sumw2_run):
+                sums[channel] = np.zeros(self.n_bins)
+        self.sumw[channel] += sumw
+        self.sumw2[channel] += sumw2
+        self.sumw_run[channel] += sumw_run
+        self.sumw2_run[channel] += sumw2_run
+
+    ## Fill the histogram with one run or chunk of enriched dilepton data
+    def fill(self, df: pd.DataFrame, n_events: int | None = None) -> DileptonHistogram:
+        '''
+        :param df: DataFrame with columns "p_pdg_id", "p_parent_pdg_id", col_bin_axis and col_weight
+         (e.g. the output of smash_output_functions.process_dilepton_file)
+        :type df: pd.DataFrame
+        :param (optional, default = None) n_events: Number of events added to the normalisation. If None, the number of
+         dileptons in df is used, like smash_output_functions.adjust_shining_weights does. For the "per_run"
+         normalisation df has to be a complete run
+        :type n_events: int | None
+        :return: The histogram itself
+        :rtype: DileptonHistogram
+        '''
+        dileptons = (df["p_pdg_id"] == DILEPTON_PDG_ID).to_numpy()
+        values = df[self.col_bin_axis].to_numpy(dtype=np.float64)[dileptons]
+        weights = df[self.col_weight].to_numpy(dtype=np.float64)[dileptons]
+        parents = df["p_parent_pdg_id"].to_numpy()[dileptons]
+
+        # One weighted bincount over the combined (channel, bin) index for all channels
+        channels, sumw, sumw2 = grouped_bincount(values, parents, self.bin_edges, weights=weights, squared=True)
+        n_events = int(dileptons.sum()) if n_events is None else int(n_events)
+        norm = max(n_events, 1)
+        for i, channel in enumerate(channels):
+            self._add(int(channel), sumw[i], sumw2[i], sumw[i] / norm, sumw2[i] / norm**2)
+
+        self.n_events += n_events
+        self.n_fills += 1
+        return self
+
+    ## Merge another histogram with the same binning into this one
+    def merge(self, other: DileptonHistogram) -> DileptonHistogram:
+        if not np.array_equal(self.bin_edges, other.bin_edges):
+            raise ValueError("Cannot merge histograms with different bin edges.")
+        for channel in other.channels:
+            self._add(channel, other.sumw[channel], other.sumw2[channel], other.sumw_run[channel], other.sumw2_run[channel])
+        self.n_events += other.n_events
+        self.n_fills += other.n_fills
+        return self
+
+    def __iadd__(self, other: DileptonHistogram) -> DileptonHistogram:
+        return self.merge(other)
+
+    ## Normalised spectrum of one channel (or all dileptons if channel is None) with statistical errors
+    def spectrum(self, channel: int | None = None, per_bin_width: bool = True,
+                 normalization: str = "per_run") -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''
+        :param (optional, default = None) channel: Pseudo-parent PDG ID; None gives the sum over all channels ("all dileptons")
+        :type channel: int | None
+        :param (optional, default = True) per_bin_width: If True, dN/dm_inv is returned (divided by the bin width),
+         otherwise the normalised yield per bin
+        :type per_bin_width: bool
+        :param (optional, default = "per_run") normalization: "per_run" (every run by its own dilepton events, summed
+         over the runs like block_weight_adj in plotting.plot_hist_multiple) or "total" (by the dilepton events of
+         all runs), see NORMALIZATIONS
+        :type normalization: str
+        :return: Bin centers, normalised yield and its statistical error sqrt(sum w^2) with the same normalisation
+        :rtype: tuple[np.ndarray, np.ndarray, np.ndarray]
+        '''
+        if normalization == "per_run":
+            sums, sums2, norm = self.sumw_run, self.sumw2_run, 1.0
+        elif normalization == "total":
+            sums, sums2, norm = self.sumw, self.sumw2, max(self.n_events, 1)
+        else:
+            raise ValueError(f"Unknown normalization: {normalization!r} (expected one of {NORMALIZATIONS})")
+        if channel is None:
+            sumw = np.sum([sums[c] for c in self.channels], axis=0) if sums else np.zeros(self.n_bins)
+            sumw2 = np.sum([sums2[c] for c in self.channels], axis=0) if sums2 else np.zeros(self.n_bins)
+        else:
+            sumw = sums.get(channel, np.zeros(self.n_bins))
+            sumw2 = sums2.get(channel, np.zeros(self.n_bins))
+        norm = norm * (np.diff(self.bin_edges) if per_bin_width else 1.0)
+        return self.centers, sumw / norm, np.sqrt(sumw2) / norm
+
+    ## Store the histogram as .npz file
+    def save(self, file_path: str | Path) -> None:
+        channels = self.channels
+        meta = {"col_bin_axis": self.col_bin_axis, "col_weight": self.col_weight,
+                "n_events": self.n_events, "n_fills": self.n_fills}
+        np.savez(
+            file_path,
+            bin_edges=self.bin_edges,
+            channels=np.asarray(channels, dtype=np.int64),
+            sumw=np.asarray([self.sumw[c] for c in channels]).reshape(-1, self.n_bins),
+            sumw2=np.asarray([self.sumw2[c] for c in channels]).reshape(-1, self.n_bins),
+            sumw_run=np.asarray([self.sumw_run[c] for c in channels]).reshape(-1, self.n_bins),
+            sumw2_run=np.asarray([self.sumw2_run[c] for c in channels]).reshape(-1, self.n_bins),
+            meta=np.array(json.dumps(meta)),
+        )
+
+    ## Load a histogram stored with save
+    @classmethod
+    def load(cls, file_path: str | Path) -> DileptonHistogram:
+        with np.load(file_path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            hist = cls(data["bin_edges"], col_bin_axis=meta["col_bin_axis"], col_weight=meta["col_weight"])
+            if "sumw_run" not in data.files:
+                raise ValueError(f"{file_path} was written without the per-run sums (older version), fill it again.")
+            for i, channel in enumerate(data["channels"]):
+                hist._add(int(channel), data["sumw"][i], data["sumw2"][i], data["sumw_run"][i], data["sumw2_run"][i])
+        hist.n_events = meta["n_events"]
+        hist.n_fills = meta["n_fills"]
+        return hist
+
+## Class to hold the weighted counts per run, channel and bin for resampling over runs (bootstrap, jackknife)
+class RunHistogramTensor:
+    '''
+    Tensor sumw[run, channel, bin] of weighted dilepton counts (p_pdg_id == -1111) of every run and pseudo-parent
+    channel, plus the number of dilepton events of every run (normalisation like DileptonHistogram.fill). It is filled
+    once; a resampling of the runs is then a weight per run (how often the run is drawn), so all replicas follow
+    from one matrix product of the (n_replicas, n_runs) weights with the tensor.
+    '''
+    def __init__(self, bin_edges, run_ids, channels, sumw: np.ndarray, n_events: np.ndarray,
+                 col_bin_axis: str = "m_inv", col_weight: str = "block_weight"):
+        self.bin_edges = np.asarray(bin_edges, dtype=np.float64)
+        self.run_ids = np.asarray(run_ids)
+        if self.run_ids.dtype == object:
+            # Run folder names as unicode array, so the tensor can be stored without pickle
+            self.run_ids = self.run_ids.astype(str)
+        self.channels = [int(channel) for channel in channels]
+        self.sumw = np.asarray(sumw, dtype=np.float64).reshape(len(self.run_ids), len(self.channels), len(self.bin_edges) - 1)
+        self.n_events = np.asarray(n_events, dtype=np.float64)
+        self.col_bin_axis = col_bin_axis
+        self.col_weight = col_weight
+
+    @property
+    def n_runs(self) -> int:
+        return len(self.run_ids)
+
+    @property
+    def n_bins(self) -> int:
+        return len(self.bin_edges) - 1
+
+    @property
+    def centers(self) -> np.ndarray:
+        return 0.5 * (self.bin_edges[1:] + self.bin_edges[:-1])
+
+    ## Build the tensor from a concatenated DataFrame of several runs (e.g. output of smash_output_functions.aggregate_runs)
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, bin_edges, col_bin_axis: str = "m_inv", col_weight: str = "block_weight",
+                   col_run: str | list[str] | tuple = ("run_id", "task_id")) -> RunHistogramTensor:
+        '''
+        One weighted bincount over the combined (run, channel, bin) index. The runs are told apart by the column(s)
+        col_run; the default (run_id, task_id) of aggregate_runs identifies every run_<run_id>_<task_id> folder
+        (run_id alone is the SLURM array job id, shared by all tasks of the job). Several columns give run ids
+        joined with "_" (e.g. "1000_3").
+        '''
+        col_run = [col_run] if isinstance(col_run, str) else list(col_run)
+        missing = [col for col in col_run if col not in df.columns]
+        if missing:
+            raise ValueError(f"Columns {missing} are needed to tell the runs apart (see smash_output_functions.aggregate_runs).")
+        bin_edges = np.asarray(bin_edges, dtype=np.float64)
+        n_bins = len(bin_edges) - 1
+        dileptons = (df["p_pdg_id"] == DILEPTON_PDG_ID).to_numpy()
+        if len(col_run) == 1:
+            run_ids, run_idx = np.unique(df[col_run[0]].to_numpy()[dileptons], return_inverse=True)
+        else:
+            keys = df.loc[dileptons, col_run]
+            run_idx = keys.groupby(col_run, sort=True).ngroup().to_numpy()
+            unique_keys = keys.drop_duplicates().sort_values(col_run)
+            run_ids = np.array(["_".join(map(str, key)) for key in unique_keys.itertuples(index=False)], dtype=str)
+        channels, channel_idx = np.unique(df["p_parent_pdg_id"].to_numpy()[dileptons], return_inverse=True)
+        # The bin index combined with the channel index serves as group of grouped_bincount, split again afterwards
+        groups = run_idx * len(channels) + channel_idx
+        group_ids, counts, _ = grouped_bincount(df[col_bin_axis].to_numpy(dtype=np.float64)[dileptons], groups, bin_edges,
+                                                weights=df[col_weight].to_numpy(dtype=np.float64)[dileptons])
+        sumw = np.zeros((len(run_ids) * len(channels), n_bins))
+        sumw[group_ids] = counts
+        n_events = np.bincount(run_idx, minlength=len(run_ids))
+        return cls(bin_edges, run_ids, channels, sumw, n_events, col_bin_axis=col_bin_axis, col_weight=col_weight)
+
+    ## Build the tensor from one DileptonHistogram per run (e.g. filled by workers of smash_output_functions)
+    @classmethod
+    def from_histograms(cls, histograms: dict) -> RunHistogramTensor:
+        '''
+        :param histograms: Run ID -> DileptonHistogram of this run (all with the same binning)
+        :type histograms: dict
+        '''
+        hists = list(histograms.values())
+        if not hists:
+            raise ValueError("No run histograms given.")
+        first = hists[0]
+        if any(not np.array_equal(first.bin_edges, hist.bin_edges) for hist in hists):
+            raise ValueError("Cannot combine histograms with different bin edges.")
+        channels = sorted(set().union(*(hist.channels for hist in hists)))
+        sumw = np.zeros((len(hists), len(channels), first.n_bins))
+        for i, hist in enumerate(hists):
+            for j, channel in enumerate(channels):
+                if channel in hist.sumw:
+                    sumw[i, j] = hist.sumw[channel]
+        return cls(first.bin_edges, list(histograms), channels, sumw, [hist.n_events for hist in hists],
+                   col_bin_axis=first.col_bin_axis, col_weight=first.col_weight)
+
+    ## Run weights of bootstrap replicas: how often each run is drawn (with replacement) per replica
+    def bootstrap_weights(self, n_replicas: int = 1000, seed: int | None = 0) -> np.ndarray:
+        rng = np.random.default_rng(seed)
+        return rng.multinomial(self.n_runs, np.full(self.n_runs, 1.0 / self.n_runs), size=n_replicas).astype(np.float64)
+
+    ## Run weights of the jackknife replicas (replica i leaves out run i)
+    def jackknife_weights(self) -> np.ndarray:
+        return 1.0 - np.eye(self.n_runs)
+
+    ## Spectra of all channels for given run weights
+    def replicas(self, run_weights: np.ndarray, normalize: bool = True, per_bin_width: bool = True,
+                 normalization: str = "per_run") -> np.ndarray:
+        '''
+        :param run_weights: Weight of every run per replica, shape (n_replicas, n_runs) (a 1-D array gives one replica)
+        :type run_weights: np.ndarray
+        :param (optional, default = True) normalize: If True, the counts are normalised by the number of dilepton events
+         (like DileptonHistogram.spectrum), otherwise the summed weighted counts are returned
+        :type normalize: bool
+        :param (optional, default = "per_run") normalization: With normalize: "per_run" (every drawn run by its own
+         events) or "total" (by the events of all drawn runs), see NORMALIZATIONS
+        :type normalization: str
+        :param (optional, default = True) per_bin_width: If True, the values are divided by the bin widths
+        :type per_bin_width: bool
+        :return: Array of shape (n_replicas, n_channels + 1, n_bins); the last channel is the sum of all channels
+        :rtype: np.ndarray
+        '''
+        if normalization not in NORMALIZATIONS:
+            raise ValueError(f"Unknown normalization: {normalization!r} (expected one of {NORMALIZATIONS})")
+        run_weights = np.atleast_2d(np.asarray(run_weights, dtype=np.float64))
+        flat = self.sumw.reshape(self.n_runs, -1)
+        if normalize and normalization == "per_run":
+            flat = flat / np.maximum(self.n_events, 1.0)[:, None]
+        values = (run_weights @ flat).reshape(len(run_weights), len(self.channels), self.n_bins)
+        values = np.concatenate([values, values.sum(axis=1, keepdims=True)], axis=1)
+        if normalize and normalization == "total":
+            values /= np.maximum(run_weights @ self.n_events, 1.0)[:, None, None]
+        if per_bin_width:
+            values /= np.diff(self.bin_edges)
+        return values
+
+    ## Central values and uncertainty band of every channel from resampling the runs
+    def uncertainty_bands(self, method: str = "bootstrap", n_replicas: int = 1000, level: float = 0.68,
+                          seed: int | None = 0, normalize: bool = True, per_bin_width: bool = True,
+                          normalization: str = "per_run") -> dict:
+        '''
+        :param (optional, default = "bootstrap") method: "bootstrap" (central interval with probability level of the
+         replica distribution) or "jackknife" (central value +- jackknife standard error)
+        :type method: str
+        :param (optional, default = 1000) n_replicas: Number of bootstrap replicas
+        :type n_replicas: int
+        :param (optional, default = 0.68) level: Probability content of the bootstrap band
+        :type level: float
+        :param (optional, default = "per_run") normalization: see replicas
+        :type normalization: str
+        :return: Channel (pseudo-parent PDG ID, None for the sum of all channels) -> (central, lower, upper)
+        :rtype: dict
+        '''
+        if self.n_runs < 2:
+            raise ValueError(f"Resampling over runs needs at least 2 runs, the tensor has {self.n_runs} "
+                             f"(run ids: {self.run_ids.tolist()}).")
+        central = self.replicas(np.ones(self.n_runs), normalize=normalize, per_bin_width=per_bin_width,
+                                normalization=normalization)[0]
+        if method == "bootstrap":
+            values = self.replicas(self.bootstrap_weights(n_replicas, seed), normalize=normalize,
+                                   per_bin_width=per_bin_width, normalization=normalization)
+            lower, upper = np.quantile(values, [0.5 - level / 2, 0.5 + level / 2], axis=0)
+        elif method == "jackknife":
+            values = self.replicas(self.jackknife_weights(), normalize=normalize, per_bin_width=per_bin_width,
+                                   normalization=normalization)
+            if not normalize or normalization == "per_run":
+                # Leave-one-out sums estimate the total of n - 1 runs: rescale to the total of all runs
+                values *= self.n_runs / max(self.n_runs - 1, 1)
+            error = np.sqrt((self.n_runs - 1) / self.n_runs * ((values - values.mean(axis=0)) ** 2).sum(axis=0))
+            lower, upper = central - error, central + error
+        else:
+            raise ValueError(f"Unknown resampling method: {method!r} (expected 'bootstrap' or 'jackknife')")
+        keys = self.channels + [None]
+        return {key: (central[i], lower[i], upper[i]) for i, key in enumerate(keys)}
+
+    ## Store the tensor as .npz file
+    def save(self, file_path: str | Path) -> None:
+        meta = {"col_bin_axis": self.col_bin_axis, "col_weight": self.col_weight}
+        np.savez(file_path, bin_edges=self.bin_edges, run_ids=self.run_ids,
+                 channels=np.asarray(self.channels, dtype=np.int64), sumw=self.sumw, n_events=self.n_events,
+                 meta=np.array(json.dumps(meta)))
+
+    ## Load a tensor stored with save
+    @classmethod
+    def load(cls, file_path: str | Path) -> RunHistogramTensor:
+        with np.load(file_path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(data["bin_edges"], data["run_ids"], data["channels"], data["sumw"], data["n_events"],
+                       col_bin_axis=meta["col_bin_axis"], col_weight=meta["col_weight"])
+
+# -----------------------------
+# MAIN SCRIPT
+# -----------------------------
+if __name__ == "__main__":
+    # Example: merging two filled histograms gives the same result as filling both parts into one histogram
+    # (the parts are chunks of one run here, so the "total" normalisation applies)
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "p_pdg_id": np.full(1000, DILEPTON_PDG_ID),
+        "p_parent_pdg_id": rng.choice([111, 221, 2214], size=1000),
+        "m_inv": rng.uniform(0, 0.7, size=1000),
+        "block_weight": rng.uniform(1e-7, 1e-5, size=1000),
+    })
+    edges = np.linspace(0, 0.7, 36)
+    full = DileptonHistogram(edges).fill(df)
+    merged = DileptonHistogram(edges).fill(df.iloc[:400]).merge(DileptonHistogram(edges).fill(df.iloc[400:]))
+    assert np.allclose(full.spectrum(normalization="total")[1], merged.spectrum(normalization="total")[1])
+    print(f"{full.n_events} events in channels {full.channels}, merge check passed")
+
+    # Example: run tensor of 200 runs; the full-sample replica reproduces the merged histogram and thousands of
+    # bootstrap replicas take one matrix product
+    # (200 tasks of one SLURM array job, as written by aggregate_runs: same run_id, different task_id)
+    df = pd.concat([df.assign(run_id=1000, task_id=task) for task in range(200)], ignore_index=True)
+    df["block_weight"] *= rng.uniform(0.5, 1.5, size=len(df))
+    tensor = RunHistogramTensor.from_frame(df, edges)
+    assert tensor.n_runs == 200
+    per_run = {f"1000_{task}": DileptonHistogram(edges).fill(part) for task, part in df.groupby("task_id")}
+    assert np.allclose(tensor.sumw, RunHistogramTensor.from_histograms(per_run).sumw)
+    merged = DileptonHistogram(edges)
+    for hist in per_run.values():
+        merged.merge(hist)
+    for normalization in NORMALIZATIONS:
+        bands = tensor.uncertainty_bands(n_replicas=5000, normalization=normalization)
+        assert np.allclose(bands[None][0], merged.spectrum(normalization=normalization)[1])
+        assert np.allclose(bands[221][0], merged.spectrum(221, normalization=normalization)[1])
+    # "per_run" equals the per-bin sum of block_weight_adj (block_weight / dileptons of the run) of plot_hist_multiple
+    df["block_weight_adj"] = df["block_weight"] / df.groupby("task_id")["block_weight"].transform("size")
+    adj_counts = np.histogram(df["m_inv"], bins=edges, weights=df["block_weight_adj"])[0]
+    assert np.allclose(merged.spectrum(per_bin_width=False)[1], adj_counts)
+    start = time.perf_counter()
+    tensor.uncertainty_bands(n_replicas=5000)
+    print(f"{tensor.n_runs} runs, 5000 bootstrap replicas in {time.perf_counter() - start:.3f} s")
+    central, lower, upper = tensor.uncertainty_bands(method="jackknife")[None]
+    print(f"relative jackknife error of the total (median over bins): {np.median((upper - central) / central):.2e}")
+# End of script
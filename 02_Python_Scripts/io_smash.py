@@ -5,14 +5,20 @@
 from __future__ import annotations
 import sys
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+import io # for parsing byte ranges of a file from memory
 import re # for regular expressions
-from typing import Optional, List, Any
+import struct # for the block headers of SMASH binary output
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, List, Any, Iterator
 import pandas as pd
 import numpy as np
 ## Third-party libraries
 ## Custom libraries
 import quality_of_life as qol
+import run_cache
+import compressed_io # transparent reading of .gz/.zst/.xz output files
 
 # -----------------------------
 # CONSTANTS AND SETTINGS
@@ -20,6 +26,12 @@ import quality_of_life as qol
 ## CONSTANTS
 BASE_PATH_TO_DATA = '/home/sebastian/dev/python/bachelor-thesis-physics/05_Files_from_Virgo/'
 
+# Categories of the io_role column (stored as pandas categorical, i.e. int8 codes instead of Python strings)
+IO_ROLES = ["in", "out", "unknown", "NA"]
+IO_ROLE_DTYPE = pd.CategoricalDtype(IO_ROLES)
+# Value of the integer block metadata columns (block_no, event, ...) for rows before the first interaction/event line
+MISSING_META = -1
+
 OSCAR_DATA_TYPES = {
     "t": "float32",
     "x": "float32",
@@ -33,7 +45,7 @@ OSCAR_DATA_TYPES = {
     "pdg": "int32",
     "ID": "int32",
     "p_pdg_id": "int32",
-    "io_role": "string",
+    "io_role": IO_ROLE_DTYPE,
     "charge": "int8",
     "ncoll": "int16",
     "form_time": "float32",
@@ -49,8 +61,44 @@ OSCAR_DATA_TYPES = {
     "partial": "float32",
     "p_parent_pdg_id": "int32",
     "block_weight_adj": "float32",
+    "block_no": "int32",
+    "in_particles": "int16",
+    "out_particles": "int16",
+    "block_weight": "float64",
+    "block_partial": "float32",
+    "block_type": "int16",
+    "event": "int32",
+    "ensemble": "int16",
 }
 
+# Version tag of the parsed DataFrame layout (part of the cache key, bump when the parser output changes)
+PARSER_VERSION = "3"
+
+# Block metadata columns appended by read_smash_dilepton_output to every data row (in this order)
+BLOCK_META_COLUMNS = ["block_no", "in_particles", "out_particles", "block_weight", "block_partial",
+                      "block_type", "event", "ensemble", "io_role"]
+# Integer block metadata columns (MISSING_META instead of NaN before the first interaction/event line)
+_INT_META_COLUMNS = ["block_no", "in_particles", "out_particles", "block_type", "event", "ensemble"]
+
+# SMASH binary output (see SMASH user guide, "Binary format"): magic number, oldest supported format version and
+# the fields of one particle record (default variant, followed by the fields of the extended variant), little endian and packed
+BINARY_MAGIC = b"SMSH"
+BINARY_MIN_FORMAT_VERSION = 9
+BINARY_PARTICLE_FIELDS = [
+    ("t", "<f8"), ("x", "<f8"), ("y", "<f8"), ("z", "<f8"), ("mass", "<f8"),
+    ("p0", "<f8"), ("px", "<f8"), ("py", "<f8"), ("pz", "<f8"),
+    ("pdg", "<i4"), ("ID", "<i4"), ("charge", "<i4"),
+]
+BINARY_EXTENDED_FIELDS = [
+    ("ncoll", "<i4"), ("form_time", "<f8"), ("xsecfac", "<f8"), ("proc_id_origin", "<i4"), ("proc_type_origin", "<i4"),
+    ("time_last_coll", "<f8"), ("pdg_mother1", "<i4"), ("pdg_mother2", "<i4"), ("baryon_number", "<i4"), ("strangeness", "<i4"),
+]
+
+# Number of data lines converted per np.loadtxt call (_parse_data_lines) in the fast parser engine (and held as strings at most)
+FAST_PARSE_SLAB_LINES = 65536
+# Minimum file size for splitting a file between several worker processes (smaller files are parsed serially)
+PARALLEL_PARSE_MIN_BYTES = 16 * 1024**2
+
 # -----------------------------
 # CLASSES AND FUNCTIONS
 # -----------------------------
@@ -67,9 +115,148 @@ class BlockContext:
     ensemble: Optional[int] = None
     in_left: int = 0
     out_left: int = 0
+    seen_event: bool = False
+    had_data_in_event: bool = False
+
+## Dataclass to hold the filters of read_smash_dilepton_output, applied to whole interaction blocks (None: no filter)
+@dataclass(frozen=True)
+class BlockFilter:
+    '''
+    block_types: process types of the '# interaction' line to keep (e.g. {5}: decays)
+    event_range: (first, last) value of the event column to keep, inclusive. As in the parsed frame, the rows of a
+        block carry the number of the preceding '# event' line (MISSING_META before the first one); the event
+        numbers are expected to be ascending, so reading stops after an event line beyond last.
+    in_pdgs: PDG IDs of incoming particles; a block is kept if one of its incoming particles is in the set
+        (e.g. {2214, 2114} for Delta Dalitz decays)
+    min_weight: minimum shining weight of a block
+    Rows of empty events (io_role "NA") and rows outside any block are only subject to event_range.
+    '''
+    block_types: Optional[frozenset] = None
+    event_range: Optional[tuple] = None
+    in_pdgs: Optional[frozenset] = None
+    min_weight: Optional[float] = None
+
+    def __post_init__(self):
+        # Accept any iterables, store hashable and ordered values (the repr is part of cache keys)
+        for name in ("block_types", "in_pdgs"):
+            values = getattr(self, name)
+            if values is not None:
+                object.__setattr__(self, name, frozenset(int(value) for value in values))
+        if self.event_range is not None:
+            first, last = self.event_range
+            object.__setattr__(self, "event_range", (int(first), int(last)))
+
+    ## Check whether a value of the event column lies in event_range
+    def event_ok(self, event: Optional[int]) -> bool:
+        if self.event_range is None:
+            return True
+        event = MISSING_META if event is None else event
+        return self.event_range[0] <= event <= self.event_range[1]
+
+    ## Deterministic description of the filter (part of the cache key)
+    def cache_tag(self) -> str:
+        return "|".join(f"{name}={sorted(value) if isinstance(value, frozenset) else value}"
+                        for name, value in (("types", self.block_types), ("events", self.event_range),
+                                            ("in_pdgs", self.in_pdgs), ("min_weight", self.min_weight)))
+
+## Class applying a BlockFilter to the lines of a Dilepton output file while scanning (state carries over between chunks)
+class _BlockSelector:
+    '''
+    Decides on the '# interaction' line whether the data lines of a block are kept (block type, weight, event), so
+    the lines of rejected blocks are never converted. With in_pdgs the incoming lines of a block are held back until
+    all of them were read (or the next comment line follows) and the block is decided on their pdg field.
+    '''
+    def __init__(self, block_filter: BlockFilter):
+        self.filter = block_filter
+        self.event: Optional[int] = None
+        self.in_block = False
+        self.accept = block_filter.event_ok(None)
+        self.pdg_index: Optional[int] = None
+        self.in_left = 0
+        self.held: List[str] = []
+
+    def set_colnames(self, colnames: List[str]) -> None:
+        if self.filter.in_pdgs is not None:
+            if "pdg" not in colnames:
+                raise ValueError("Filtering on incoming PDG IDs needs a 'pdg' column in the '#!' header line.")
+            self.pdg_index = colnames.index("pdg")
+
+    ## Decide on a new block (finish has to be called for the previous block first)
+    def start_block(self, n_in: int, weight: float, itype: int) -> None:
+        f = self.filter
+        self.in_block = True
+        self.accept = ((f.block_types is None or itype in f.block_types)
+                       and (f.min_weight is None or weight >= f.min_weight) and f.event_ok(self.event))
+        if self.accept and f.in_pdgs is not None:
+            self.in_left = n_in
+            self.accept = False  # decided once the incoming lines are read
+
+    ## New event line: outside any block the rows follow the event filter
+    def set_event(self, event: int) -> None:
+        self.event = event
+        if not self.in_block:
+            self.accept = self.filter.event_ok(event)
+
+    ## Whether no later row can pass the event filter (ascending event numbers)
+    def past_last_event(self) -> bool:
+        return self.filter.event_range is not None and self.event is not None and self.event > self.filter.event_range[1]
+
+    ## Data line: returns the lines to keep (none, this line, or the held incoming lines of the block)
+    def take(self, line: str) -> List[str]:
+        if self.in_left:
+            self.held.append(line)
+            self.in_left -= 1
+            return self._decide() if self.in_left == 0 else []
+        return [line] if self.accept else []
+
+    ## Comment line: decide on incoming lines still held back (block with fewer lines than announced)
+    def finish(self) -> List[str]:
+        return self._decide() if self.in_left or self.held else []
+
+    def _decide(self) -> List[str]:
+        held, self.held, self.in_left = self.held, [], 0
+        self.accept = any(int(line.split()[self.pdg_index]) in self.filter.in_pdgs for line in held)
+        return held if self.accept else []
+
+## Function to get the rows of a fully parsed Dilepton frame that pass a BlockFilter (reference for the scanning filter)
+def block_filter_mask(df: pd.DataFrame, block_filter: BlockFilter) -> np.ndarray:
+    '''
+    Row mask with the semantics of BlockFilter: the rows of a block are kept or dropped together, decided on the
+    first row of the block (event, weight, type) and on its "in" rows (pdg); other rows only follow event_range.
+    '''
+    f = block_filter
+    event = df["event"].to_numpy()
+    block_no = df["block_no"].to_numpy()
+    in_block = (df["io_role"] != "NA").to_numpy() & (block_no >= 0)
+    keep = np.ones(len(df), dtype=bool)
+    if f.event_range is not None:
+        keep &= (event >= f.event_range[0]) & (event <= f.event_range[1])
+    block_rows = np.flatnonzero(in_block)
+    _, first, inverse = np.unique(block_no[block_rows], return_index=True, return_inverse=True)
+    block_ok = keep[block_rows][first]
+    if f.block_types is not None:
+        block_ok &= np.isin(df["block_type"].to_numpy()[block_rows][first], list(f.block_types))
+    if f.min_weight is not None:
+        block_ok &= df["block_weight"].to_numpy()[block_rows][first] >= f.min_weight
+    if f.in_pdgs is not None:
+        matches = (df["io_role"] == "in").to_numpy()[block_rows] & np.isin(df["pdg"].to_numpy()[block_rows], list(f.in_pdgs))
+        block_ok &= np.bincount(inverse, weights=matches, minlength=first.size) > 0
+    keep[block_rows] = block_ok[inverse]
+    return keep
+
+## Helper function to get the column names of the '#!' header line of a SMASH particle_lists file
+def _particle_file_colnames(file_path) -> List[str]:
+    with compressed_io.open_text(file_path) as f:
+        for line in f:
+            if line.startswith("#!"):
+                # '#!OSCAR2013 particle_lists t x y z ...'
+                return line.split()[2:]
+            if line.strip() and not line.startswith("#"):
+                break
+    raise ValueError(f"No column names found in {file_path} (missing '#!' header line?)")
 
 ## Function to read SMASH particle_list file in .oscar format
-def read_smash_particle_file(file_path)-> pd.DataFrame:
+def read_smash_particle_file(file_path, columns=None)-> pd.DataFrame:
     '''
     This function reads a SMASH particle_lists.oscar output file and returns its contents as a pandas DataFrame.
     It assumes the file is whitespace-delimited and may contain comment lines starting with '#'.
@@ -77,14 +264,26 @@ def read_smash_particle_file(file_path)-> pd.DataFrame:
     Units per column: fm fm fm fm GeV GeV GeV GeV GeV none none e
     pdg ID corresponds to Particle Data Group identification numbers, see https://pdg.lbl.gov/2020/reviews/rpp2020-rev-monte-carlo-numbering.pdf for reference.
     
+    Compressed files (.gz/.zst/.xz, or detected from their magic bytes) are decompressed while reading.
+    
     Input: 
         file_path (str) - path to the SMASH output file
+        columns (list, optional) - columns to read, given by name of the '#!' header line (e.g. "p0") or by position;
+            the fields of the other columns are skipped while parsing. The columns keep their positional labels.
     Output: 
         pandas DataFrame containing the SMASH data
     '''
+    usecols = None
+    if columns is not None:
+        names = _particle_file_colnames(file_path) if any(isinstance(col, str) for col in columns) else []
+        unknown = [col for col in columns if isinstance(col, str) and col not in names]
+        if unknown:
+            raise ValueError(f"Unknown columns {unknown}: available are {names}")
+        usecols = sorted({names.index(col) if isinstance(col, str) else int(col) for col in columns})
     try:
         # Read the SMASH file using pandas
-        data = pd.read_csv(file_path, sep='\\s+', comment='#', header=None)
+        with compressed_io.open_text(file_path) as f:
+            data = pd.read_csv(f, sep='\\s+', comment='#', header=None, usecols=usecols)
         if data.empty:
             print("WARNING: The Dileptons.oscar file is empty. An empty DataFrame will be returned!")
             return pd.DataFrame()  # Return an empty DataFrame
@@ -101,9 +300,33 @@ _INTERACTION_RE = re.compile(
 )
 
 _EVENT_RE = re.compile(r"#\s*event\s+(?P<event>\d+)\s+ensemble\s+(?P<ensemble>\d+)")
+_EVENT_END_RE = re.compile(r"\bend\b")
 
-## Function to read SMASH/OSCAR-like tables with block metadata
-def read_smash_dilepton_output(path: Path) -> pd.DataFrame:
+## Block types and block headers of SMASH binary output
+_BLOCK_PARTICLES = ord("p")
+_BLOCK_INTERACTION = ord("i")
+_BLOCK_EVENT_END = ord("f")
+# 'p': event number, ensemble number, number of particles
+_BINARY_PARTICLES_HEADER = struct.Struct("<iiI")
+# 'i': number of in/out particles, density, weight, partial weight, process type
+_BINARY_INTERACTION_HEADER = struct.Struct("<IIdddI")
+# 'f': event number, ensemble number, impact parameter, empty event flag
+_BINARY_EVENT_END_HEADER = struct.Struct("<iid?")
+
+## Helper function to extract column names from the '#!' header line
+def _parse_header_colnames(line: str) -> List[str]:
+    # Example: "#!OSCAR... Dileptons t x y z mass ..."
+    parts = line.split()
+    # look for "Dileptons" token to find column names
+    try:
+        idx = parts.index("Dileptons")
+        return parts[idx + 1 :]
+    except ValueError:
+        # Fallback: alles nach dem ersten Token
+        return parts[1:]
+
+## Line-by-line parser engine for SMASH/OSCAR-like tables with block metadata (reference implementation)
+def _read_dilepton_output_legacy(path: Path) -> pd.DataFrame:
     """
     Liest SMASH/OSCAR-ähnliche Tabellen mit Kommentarzeilen und blockweisen Metadaten.
     Hängt Block-Metadaten (number/weight/partial/type + optional event/ensemble) an jede Datenzeile.
@@ -127,7 +350,7 @@ def read_smash_dilepton_output(path: Path) -> pd.DataFrame:
         )
 
     # read the file line by line
-    with open(path, "r", encoding="utf-8", errors="replace") as f:
+    with compressed_io.open_text(path) as f:
         for line in f:
             # clean line and skip empty lines
             line = line.strip()
@@ -137,14 +360,7 @@ def read_smash_dilepton_output(path: Path) -> pd.DataFrame:
             # Header: column names
             if line.startswith("#!"):
                 # Example: "#!OSCAR... Dileptons t x y z mass ..."
-                parts = line.split()
-                # look for "Dileptons" token to find column names
-                try:
-                    idx = parts.index("Dileptons")
-                    colnames = parts[idx + 1 :]
-                except ValueError:
-                    # Fallback: alles nach dem ersten Token
-                    colnames = parts[1:]
+                colnames = _parse_header_colnames(line)
                 continue
 
             # Extract block metadata from comment lines
@@ -215,12 +431,687 @@ def read_smash_dilepton_output(path: Path) -> pd.DataFrame:
 
     df = pd.DataFrame(
         rows,
-        columns=colnames + ["block_no", "in_particles", "out_particles", "block_weight", "block_partial", "block_type", "event", "ensemble", "io_role"],
+        columns=colnames + BLOCK_META_COLUMNS,
     )
-    return df
+    # Compact dtypes like the fast engine (integer metadata of rows without block/event gets MISSING_META instead of NaN)
+    df[_INT_META_COLUMNS] = df[_INT_META_COLUMNS].fillna(MISSING_META)
+    return qol.apply_data_types(df, OSCAR_DATA_TYPES)
 
-## Function to aggregate dilepton pairs from parsed DataFrame
-def aggregate_dilepton_pairs(df: pd.DataFrame) -> pd.DataFrame:
+## Helper function to get the compact dtype of a data column (float64 for columns not listed in OSCAR_DATA_TYPES)
+def _column_dtype(col: str) -> np.dtype:
+    return np.dtype(OSCAR_DATA_TYPES.get(col, "float64"))
+
+## Helper function to turn per-row metadata into a compact column, marking rows before the first interaction/event line
+def _meta_column(values: np.ndarray, valid: np.ndarray, col: str) -> np.ndarray:
+    # The legacy parser stores None before the first interaction/event line: NaN for float columns, MISSING_META for integers
+    dtype = _column_dtype(col)
+    out = values.astype(dtype)
+    if not valid.all():
+        out[~valid] = np.nan if dtype.kind == "f" else MISSING_META
+    return out
+
+## Dataclass to hold the parsed rows of one batch (whole file or chunk of events) for the fast parser engine
+@dataclass
+class _LineBatch:
+    # Data lines not converted yet (at most FAST_PARSE_SLAB_LINES) and typed column arrays of the converted slabs
+    pending: List[str] = field(default_factory=list)
+    pieces: List[dict] = field(default_factory=list)
+    n_data: int = 0
+    # Position of each comment line given as the number of data lines read before it
+    int_pos: List[int] = field(default_factory=list)
+    int_meta: List[tuple] = field(default_factory=list)
+    evt_pos: List[int] = field(default_factory=list)
+    evt_meta: List[tuple] = field(default_factory=list)
+    n_event_ends: int = 0
+    # Number of data lines read including the lines of blocks skipped by a BlockFilter (total and before each event
+    # line); an event is empty only if no data line was read since the previous event line
+    n_read: int = 0
+    evt_read: List[int] = field(default_factory=list)
+
+## Helper function to get the data columns to parse (header order) and check the requested columns
+def _selected_columns(colnames: List[str], keep: Optional[List[str]]) -> List[str]:
+    if keep is None:
+        return colnames
+    unknown = [col for col in keep if col not in colnames and col not in BLOCK_META_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns {unknown}: available are {colnames + BLOCK_META_COLUMNS}")
+    return [col for col in colnames if col in keep]
+
+## Helper function to count the whitespace separated fields of every line of a slab (vectorised over the bytes of the slab)
+def _field_counts(data_lines: List[str]) -> np.ndarray:
+    buf = np.frombuffer("\n".join(data_lines).encode("utf-8", errors="replace"), dtype=np.uint8)
+    # Spaces, tabs, line breaks (and other control bytes) separate the fields
+    is_space = buf <= ord(" ")
+    # A field starts at every non-space byte following a space (or at the start of the slab)
+    field_start = ~is_space
+    field_start[1:] &= is_space[:-1]
+    # The scanner keeps no empty lines, so every line owns at least one byte of buf
+    line_starts = np.concatenate(([0], np.flatnonzero(buf == ord("\n")) + 1))
+    return np.add.reduceat(field_start, line_starts, dtype=np.int32)
+
+## Helper function to convert one slab of data lines into typed column arrays (only the columns in keep, None: all)
+def _parse_data_lines(data_lines: List[str], colnames: List[str], keep: Optional[List[str]] = None) -> dict:
+    n_cols = len(colnames)
+    selected = _selected_columns(colnames, keep)
+    usecols = None if selected == colnames else [colnames.index(col) for col in selected]
+    try:
+        # Every field is converted directly into the compact dtype of its column; fields not selected are skipped
+        # by the tokenizer without being converted
+        records = np.loadtxt(data_lines, dtype=[(col, _column_dtype(col)) for col in selected], usecols=usecols,
+                             comments=None, ndmin=1)
+    except ValueError:
+        records = None
+    # Without usecols loadtxt checks that every line has n_cols fields. With usecols it only needs the selected
+    # fields, so a short or long line (e.g. cut off when a job was killed) would be parsed into shifted columns:
+    # the fields of every line are counted
+    if records is None or (usecols is not None and np.any(_field_counts(data_lines) != n_cols)):
+        # Locate the offending line to report it the same way as the legacy parser
+        for line in data_lines:
+            size = np.fromstring(line, sep=" ").size
+            if size != n_cols:
+                raise ValueError(
+                    f"Number of columns do not fit: got {size}, expected {n_cols}\n"
+                    f"Line: {line}"
+                )
+        if records is None:
+            raise ValueError(f"Data lines could not be converted (columns: {colnames})")
+    return {col: np.ascontiguousarray(records[col]) for col in selected}
+
+## Helper function to convert the pending data lines of a batch into typed column arrays
+def _flush_data_lines(batch: _LineBatch, colnames: List[str], keep: Optional[List[str]] = None) -> None:
+    if not batch.pending:
+        return
+    if not colnames:
+        raise ValueError("No column names found (maybe missing '#!' in header line?).")
+    batch.pieces.append(_parse_data_lines(batch.pending, colnames, keep))
+    batch.pending = []
+
+## Helper function to join the converted slabs of a batch into one array per column
+def _batch_columns(batch: _LineBatch, colnames: List[str]) -> dict:
+    if len(batch.pieces) == 1:
+        return batch.pieces.pop()
+    columns = {}
+    for col in colnames:
+        # Slabs are released column by column, so at most one extra column is held during the concatenation
+        columns[col] = np.concatenate([piece.pop(col) for piece in batch.pieces]) if batch.pieces \
+            else np.empty(0, dtype=_column_dtype(col))
+    batch.pieces = []
+    return columns
+
+## Helper function to add data lines to the pending lines of a batch (converted once a slab is full)
+def _keep_data_lines(batch: _LineBatch, lines: List[str], colnames: List[str], keep: Optional[List[str]]) -> None:
+    batch.pending.extend(lines)
+    batch.n_data += len(lines)
+    if len(batch.pending) >= FAST_PARSE_SLAB_LINES:
+        _flush_data_lines(batch, colnames, keep)
+
+## Helper function to sort the lines of an open Dileptons.oscar file into data rows and block/event metadata
+def _scan_dilepton_lines(f, colnames: List[str], max_events: Optional[int] = None, keep: Optional[List[str]] = None,
+                         selector: Optional[_BlockSelector] = None) -> tuple[List[str], _LineBatch, bool]:
+    '''
+    Reads lines from the open file object f until max_events '# event ... end' lines were consumed
+    (or until the end of file if max_events is None). Data lines are converted in slabs of FAST_PARSE_SLAB_LINES
+    into typed column arrays while reading (only the data columns in keep, None: all). With a selector, the data
+    lines of blocks rejected by its BlockFilter are skipped unconverted (the block is still counted). Returns the
+    (possibly updated) column names of the header, the collected batch and whether the end of file was reached.
+    '''
+    batch = _LineBatch()
+    if selector is not None and colnames:
+        selector.set_colnames(colnames)
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] != "#":
+            batch.n_read += 1
+            if selector is None:
+                batch.pending.append(line)
+                batch.n_data += 1
+                if len(batch.pending) >= FAST_PARSE_SLAB_LINES:
+                    _flush_data_lines(batch, colnames, keep)
+            else:
+                _keep_data_lines(batch, selector.take(line), colnames, keep)
+            continue
+        if selector is not None:
+            _keep_data_lines(batch, selector.finish(), colnames, keep)
+        if line.startswith("#!"):
+            _flush_data_lines(batch, colnames, keep)
+            colnames = _parse_header_colnames(line)
+            _selected_columns(colnames, keep)  # fail early on unknown columns
+            if selector is not None:
+                selector.set_colnames(colnames)
+            continue
+        m_int = _INTERACTION_RE.search(line)
+        if m_int:
+            batch.int_pos.append(batch.n_data)
+            batch.int_meta.append((int(m_int.group("in")), int(m_int.group("out")), float(m_int.group("weight")),
+                                   float(m_int.group("partial")), int(m_int.group("type"))))
+            if selector is not None:
+                selector.start_block(batch.int_meta[-1][0], batch.int_meta[-1][2], batch.int_meta[-1][4])
+            continue
+        m_evt = _EVENT_RE.search(line)
+        if m_evt:
+            batch.evt_pos.append(batch.n_data)
+            batch.evt_read.append(batch.n_read)
+            batch.evt_meta.append((int(m_evt.group("event")), int(m_evt.group("ensemble"))))
+            if selector is not None:
+                selector.set_event(batch.evt_meta[-1][0])
+                if selector.past_last_event():
+                    # No later row can pass the event filter: treat as end of file
+                    break
+            if _EVENT_END_RE.search(line, m_evt.end()):
+                batch.n_event_ends += 1
+                if max_events is not None and batch.n_event_ends >= max_events:
+                    _flush_data_lines(batch, colnames, keep)
+                    return colnames, batch, False
+    if selector is not None:
+        _keep_data_lines(batch, selector.finish(), colnames, keep)
+    _flush_data_lines(batch, colnames, keep)
+    return colnames, batch, True
+
+## Helper function to build the DataFrame of one batch, starting from and updating the carried-over block context
+def _build_dilepton_frame(colnames: List[str], batch: _LineBatch, ctx: BlockContext, final: bool,
+                          keep: Optional[List[str]] = None, block_filter: Optional[BlockFilter] = None) -> pd.DataFrame:
+    '''
+    Joins the typed column arrays of a batch and attaches the block metadata (see _frame_with_block_metadata).
+    '''
+    columns = _batch_columns(batch, _selected_columns(colnames, keep))
+    return _frame_with_block_metadata(columns, colnames, batch, ctx, final, keep, block_filter)
+
+## Helper function to place the data rows and the empty-event rows of one column into a new array
+def _with_empty_rows(values: np.ndarray, data_rows: np.ndarray, empty_rows: np.ndarray, fill) -> np.ndarray:
+    out = np.empty(data_rows.size + empty_rows.size, dtype=values.dtype)
+    out[data_rows] = values
+    out[empty_rows] = fill
+    return out
+
+## Helper function to attach the block metadata to the data rows of one batch
+def _frame_with_block_metadata(columns: dict, colnames: List[str], batch: _LineBatch, ctx: BlockContext,
+                               final: bool, keep: Optional[List[str]] = None,
+                               block_filter: Optional[BlockFilter] = None) -> pd.DataFrame:
+    '''
+    Derives the block metadata vectorized from the positions of the comment lines (given as number of data rows
+    before them) relative to the batch.n_data data rows in columns. The state before the batch is taken from ctx
+    (treated as a pseudo interaction/event line at position 0) and ctx is updated to the state after the batch.
+    If final is True, the end of file rule for a trailing empty event is applied.
+    All columns are created in their compact dtypes (OSCAR_DATA_TYPES), io_role as categorical column.
+    columns holds the parsed data columns (the columns of colnames in keep); of the block metadata only the columns in
+    keep are returned (None: all). If the batch was scanned with a block_filter, only empty events passing its
+    event_range get an empty-event row.
+    '''
+    data_colnames = [col for col in colnames if col in columns]
+    n_data = batch.n_data
+
+    # Block metadata: every data row belongs to the last interaction line before it.
+    # Index 0 is the block carried over from ctx (with its remaining in/out counters), 1.. are the blocks of this batch
+    rows = np.arange(n_data)
+    first_no = ctx.number + 1 if ctx.number is not None else 0
+    int_pos = np.asarray([0] + batch.int_pos, dtype=np.int64)
+    int_arr = np.asarray(
+        [(ctx.in_left, ctx.out_left, ctx.weight or 0.0, ctx.partial or 0.0, ctx.itype or 0)] + batch.int_meta,
+        dtype=np.float64,
+    )
+    block = np.searchsorted(int_pos, rows, side="right") - 1
+    has_block = (block > 0) | (ctx.number is not None)
+    block_no = np.where(block > 0, first_no + block - 1, ctx.number if ctx.number is not None else 0)
+    in_particles = int_arr[block, 0].astype(np.int64)
+    out_particles = int_arr[block, 1].astype(np.int64)
+    # io_role codes (IO_ROLES) from the offset of the row within its block ("in" rows first, then "out", then "unknown")
+    offset = rows - int_pos[block]
+    io_role = np.full(n_data, IO_ROLES.index("unknown"), dtype=np.int8)
+    io_role[offset < in_particles + out_particles] = IO_ROLES.index("out")
+    io_role[offset < in_particles] = IO_ROLES.index("in")
+    if ctx.number is not None:
+        # The carried-over block reports its full in/out multiplicities, not the remaining counters
+        carried = block == 0
+        in_particles[carried] = ctx.in_particles
+        out_particles[carried] = ctx.out_particles
+
+    # Event metadata: every data row belongs to the last event line before it (index 0 is the carried-over event)
+    evt_pos = np.asarray([0] + batch.evt_pos, dtype=np.int64)
+    evt_arr = np.asarray([(ctx.event or 0, ctx.ensemble or 0)] + batch.evt_meta, dtype=np.int64)
+    evt_idx = np.searchsorted(evt_pos, rows, side="right") - 1
+    has_event = (evt_idx > 0) | (ctx.event is not None)
+
+    meta = {
+        "block_no": _meta_column(block_no, has_block, "block_no"),
+        "in_particles": _meta_column(in_particles, has_block, "in_particles"),
+        "out_particles": _meta_column(out_particles, has_block, "out_particles"),
+        "block_weight": _meta_column(int_arr[block, 2], has_block, "block_weight"),
+        "block_partial": _meta_column(int_arr[block, 3], has_block, "block_partial"),
+        "block_type": _meta_column(int_arr[block, 4], has_block, "block_type"),
+        "event": _meta_column(evt_arr[evt_idx, 0], has_event, "event"),
+        "ensemble": _meta_column(evt_arr[evt_idx, 1], has_event, "ensemble"),
+    }
+
+    # Empty events: an event line without data lines since the previous event line (or up to the end of file)
+    # adds one row carrying the event number of that previous event line
+    empty_at: List[int] = []
+    empty_event: List[int] = []
+    # (emptiness is judged on all data lines read, including the lines of blocks skipped by a block filter)
+    prev_seen, prev_read, prev_had_data = ctx.seen_event, 0, ctx.had_data_in_event
+    prev_event = ctx.event
+    boundaries = batch.evt_pos + ([n_data] if final else [])
+    read_boundaries = batch.evt_read + ([batch.n_read] if final else [])
+    for k, (pos, read) in enumerate(zip(boundaries, read_boundaries)):
+        if prev_seen and not prev_had_data and read == prev_read and (block_filter is None or block_filter.event_ok(prev_event)):
+            empty_at.append(pos)
+            empty_event.append(prev_event)
+        if k < len(batch.evt_pos):
+            prev_seen, prev_read, prev_had_data = True, read, False
+            prev_event = batch.evt_meta[k][0]
+    if empty_at:
+        if not colnames:
+            raise ValueError("Keine Spaltennamen gefunden (fehlende '#!' Headerzeile?).")
+        # Output positions of the data rows and of the empty-event rows (each empty row goes before data row empty_at)
+        empty_at_arr = np.asarray(empty_at, dtype=np.int64)
+        data_rows = rows + np.searchsorted(empty_at_arr, rows, side="right")
+        empty_rows = empty_at_arr + np.arange(empty_at_arr.size)
+        columns = {col: _with_empty_rows(columns[col], data_rows, empty_rows, 0) for col in data_colnames}
+        empty_meta = {"block_no": 0, "in_particles": 0, "out_particles": 0, "block_weight": 0.0,
+                      "block_partial": 0.0, "block_type": 0, "ensemble": 0, "event": np.asarray(empty_event)}
+        for key, default in empty_meta.items():
+            meta[key] = _with_empty_rows(meta[key], data_rows, empty_rows, default)
+        io_role = _with_empty_rows(io_role, data_rows, empty_rows, IO_ROLES.index("NA"))
+    meta["io_role"] = pd.Categorical.from_codes(io_role, dtype=IO_ROLE_DTYPE)
+
+    # Carry the block context over to the next batch
+    consumed = n_data - int_pos[-1]
+    if batch.int_meta:
+        ctx.number = first_no + len(batch.int_meta) - 1
+        ctx.in_particles, ctx.out_particles, ctx.weight, ctx.partial, ctx.itype = batch.int_meta[-1]
+        ctx.in_left, ctx.out_left = ctx.in_particles, ctx.out_particles
+    ctx.out_left = max(ctx.out_left - max(consumed - ctx.in_left, 0), 0)
+    ctx.in_left = max(ctx.in_left - consumed, 0)
+    if batch.evt_meta:
+        ctx.event, ctx.ensemble = batch.evt_meta[-1]
+        ctx.seen_event = True
+        ctx.had_data_in_event = batch.n_read > batch.evt_read[-1]
+    else:
+        ctx.had_data_in_event = ctx.had_data_in_event or batch.n_read > 0
+
+    if keep is not None:
+        meta = {key: values for key, values in meta.items() if key in keep}
+    # copy=False: the column arrays are used as they are (no consolidation into 2-D blocks)
+    return pd.DataFrame({**{col: columns[col] for col in data_colnames}, **meta}, copy=False)
+
+## Vectorized, block-aware parser engine for SMASH/OSCAR-like tables with block metadata
+def _read_dilepton_output_fast(path: Path, keep: Optional[List[str]] = None,
+                               block_filter: Optional[BlockFilter] = None) -> pd.DataFrame:
+    """
+    Bulk parser producing the same DataFrame as _read_dilepton_output_legacy.
+    Data lines are converted in slabs directly into typed column arrays (only one slab is held as strings at a time,
+    data columns not in keep are skipped). The block metadata (block_no, event, ensemble, io_role, ...) is derived
+    afterwards from the positions of the comment lines relative to the data lines instead of updating a BlockContext
+    per line. Blocks rejected by block_filter are skipped while scanning.
+    """
+    selector = _BlockSelector(block_filter) if block_filter is not None else None
+    with compressed_io.open_text(path) as f:
+        colnames, batch, _ = _scan_dilepton_lines(f, [], keep=keep, selector=selector)
+    return _build_dilepton_frame(colnames, batch, BlockContext(), final=True, keep=keep, block_filter=block_filter)
+
+## Helper function to find byte offsets splitting a Dileptons.oscar file into n_parts ranges right after '# event' lines
+def _find_event_split_points(path: Path, n_parts: int) -> List[int]:
+    size = Path(path).stat().st_size
+    points = [0]
+    with open(path, "rb") as f:
+        for k in range(1, n_parts):
+            target = max(size * k // n_parts, points[-1])
+            f.seek(target)
+            if target > 0:
+                f.readline()  # skip the (possibly partial) line at the target offset
+            for raw_line in iter(f.readline, b""):
+                if raw_line.lstrip().startswith(b"#") and _EVENT_RE.search(raw_line.decode("utf-8", errors="replace")):
+                    break
+            boundary = f.tell()
+            if boundary >= size:
+                break
+            if boundary > points[-1]:
+                points.append(boundary)
+    points.append(size)
+    return points
+
+## Worker function parsing one byte range of a Dileptons.oscar file into typed columns and block positions (no metadata yet)
+def _parse_byte_range(path: Path, start: int, end: int, colnames: List[str], keep: Optional[List[str]] = None,
+                      block_filter: Optional[BlockFilter] = None) -> tuple[List[str], dict, _LineBatch]:
+    selector = None
+    with open(path, "rb") as f:
+        if block_filter is not None:
+            selector = _BlockSelector(block_filter)
+            if start > 0:
+                # The range starts right after an '# event' line, whose event number the first rows carry
+                f.seek(max(start - 4096, 0))
+                m_evt = _EVENT_RE.search(f.read(start - f.tell()).decode("utf-8", errors="replace").splitlines()[-1])
+                if m_evt:
+                    selector.set_event(int(m_evt.group("event")))
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8", errors="replace")
+    colnames, batch, _ = _scan_dilepton_lines(io.StringIO(text), colnames, keep=keep, selector=selector)
+    del text
+    return colnames, _batch_columns(batch, _selected_columns(colnames, keep)), batch
+
+## Parallel variant of the fast parser engine: byte ranges aligned to event boundaries are parsed in worker processes
+def _read_dilepton_output_parallel(path: Path, n_workers: int, keep: Optional[List[str]] = None,
+                                   block_filter: Optional[BlockFilter] = None) -> pd.DataFrame:
+    '''
+    Splits the file into n_workers byte ranges that each start right after an '# event' line, converts the ranges in a
+    process pool and attaches the block metadata afterwards in file order, carrying the block context from one range
+    to the next. This gives exactly the same block numbering and empty-event rows as the serial parse.
+    '''
+    points = _find_event_split_points(path, n_workers)
+    # Column names from the '#!' header line at the start of the file (needed by all workers)
+    colnames: List[str] = []
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if line.startswith("#!"):
+                colnames = _parse_header_colnames(line.strip())
+                break
+            if line.strip() and not line.startswith("#"):
+                break
+
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = [pool.submit(_parse_byte_range, path, start, end, colnames, keep, block_filter)
+                   for start, end in zip(points[:-1], points[1:])]
+        parts = [future.result() for future in futures]
+
+    ctx = BlockContext()
+    frames = []
+    for i, (part_colnames, columns, batch) in enumerate(parts):
+        frames.append(_frame_with_block_metadata(columns, part_colnames, batch, ctx, final=i == len(parts) - 1, keep=keep,
+                                                 block_filter=block_filter))
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+## Helper function to select the columns in keep (None: all) of a fully parsed frame, in file order
+def _project_frame(df: pd.DataFrame, keep: Optional[List[str]]) -> pd.DataFrame:
+    if keep is None:
+        return df
+    colnames = [col for col in df.columns if col not in BLOCK_META_COLUMNS]
+    selected = _selected_columns(colnames, keep)
+    return df[selected + [col for col in BLOCK_META_COLUMNS if col in keep]]
+
+## Helper function to apply a BlockFilter to a fully parsed frame (None: no filter)
+def _filter_frame(df: pd.DataFrame, block_filter: Optional[BlockFilter]) -> pd.DataFrame:
+    if block_filter is None:
+        return df
+    return df[block_filter_mask(df, block_filter)].reset_index(drop=True)
+
+## Function to read SMASH/OSCAR-like tables with block metadata
+def read_smash_dilepton_output(path: Path, engine: str = "fast", use_cache: bool = False,
+                               rebuild_cache: bool = False, n_workers: int = 1,
+                               columns: Optional[List[str]] = None,
+                               block_filter: Optional[BlockFilter] = None) -> pd.DataFrame:
+    """
+    Reads a SMASH Dileptons.oscar file and attaches the block metadata
+    (block_no/in_particles/out_particles/block_weight/block_partial/block_type/event/ensemble/io_role) to every data row.
+    Inputs:
+    path : Path
+        Path to the Dileptons.oscar file.
+    engine : str
+        "fast" (default) parses all data lines in bulk and derives the block metadata vectorized,
+        "legacy" uses the original line-by-line parser. Both return the same DataFrame.
+        The columns have the compact dtypes of OSCAR_DATA_TYPES (float32 kinematics, int32 IDs, categorical io_role);
+        integer block metadata of rows before the first interaction/event line is MISSING_META, float metadata NaN.
+    use_cache : bool
+        If True, the parsed DataFrame is loaded from / stored in the run_cache (keyed by path, size, mtime and PARSER_VERSION).
+    rebuild_cache : bool
+        If True, an existing cache entry is ignored and rebuilt.
+    n_workers : int
+        Number of worker processes for the "fast" engine. If > 1 and the file is larger than PARALLEL_PARSE_MIN_BYTES,
+        the file is split at event boundaries and the parts are parsed in parallel (same result as the serial parse).
+        Compressed files (.gz/.zst/.xz, see compressed_io) are streamed through a decompression thread instead.
+    columns : list[str] | None
+        Columns to return (data columns of the '#!' header and/or BLOCK_META_COLUMNS), in file order; None returns all.
+        The "fast" engine does not convert or store the fields of the other data columns.
+    block_filter : BlockFilter | None
+        Keeps only the interaction blocks of certain process types, events, incoming PDG IDs or minimum weight.
+        The "fast" engine decides on the '# interaction' line and skips the data lines of rejected blocks without
+        converting them; the result equals the full frame restricted to block_filter_mask (block numbers unchanged).
+    Returns:
+    pd.DataFrame
+        DataFrame with one row per data line (plus one row per empty event)."""
+    if engine not in ("fast", "legacy"):
+        raise ValueError(f"Unknown parser engine: {engine!r} (expected 'fast' or 'legacy')")
+    keep = list(columns) if columns is not None else None
+    # Compressed files cannot be split into byte ranges, they are always parsed serially (decompressed in a thread)
+    if (engine == "fast" and n_workers > 1 and Path(path).stat().st_size >= PARALLEL_PARSE_MIN_BYTES
+            and compressed_io.detect_compression(path) is None):
+        reader = partial(_read_dilepton_output_parallel, n_workers=n_workers, keep=keep, block_filter=block_filter)
+    elif engine == "fast":
+        reader = partial(_read_dilepton_output_fast, keep=keep, block_filter=block_filter)
+    else:
+        # The reference implementation parses everything, filter and projection are applied afterwards
+        reader = lambda path: _project_frame(_filter_frame(_read_dilepton_output_legacy(path), block_filter), keep)
+    if use_cache:
+        # Each projection and filter is cached separately
+        version = PARSER_VERSION if keep is None else f"{PARSER_VERSION}|{','.join(keep)}"
+        if block_filter is not None:
+            version += f"|{block_filter.cache_tag()}"
+        return run_cache.load_or_build(path, "parsed", version, lambda: reader(path), rebuild=rebuild_cache)
+    return reader(path)
+
+## Generator to read SMASH/OSCAR-like tables with block metadata in chunks of whole events
+def iter_smash_dilepton_chunks(path: Path, events_per_chunk: int = 10000, columns: Optional[List[str]] = None,
+                               block_filter: Optional[BlockFilter] = None) -> Iterator[pd.DataFrame]:
+    """
+    Streams a SMASH Dileptons.oscar file as typed DataFrame chunks (OSCAR_DATA_TYPES) with bounded memory.
+    Every chunk ends on an '# event ... end' line, so no interaction block is split between chunks, and the
+    block context (block numbering, event/ensemble, in/out counters) carries over from one chunk to the next.
+    Concatenating all chunks gives the same rows as read_smash_dilepton_output.
+    Compressed files (.gz/.zst/.xz) are decompressed in a background thread while the chunks are parsed.
+    Inputs:
+    path : Path
+        Path to the Dileptons.oscar file.
+    events_per_chunk : int
+        Number of '# event ... end' lines per chunk.
+    columns : list[str] | None
+        Columns to return (see read_smash_dilepton_output); None returns all.
+    block_filter : BlockFilter | None
+        Blocks to keep (see read_smash_dilepton_output); rejected blocks are skipped unconverted.
+    Yields:
+    pd.DataFrame
+        Typed DataFrame with the rows of the next events_per_chunk events."""
+    if events_per_chunk < 1:
+        raise ValueError(f"events_per_chunk must be positive, got {events_per_chunk}")
+    keep = list(columns) if columns is not None else None
+    selector = _BlockSelector(block_filter) if block_filter is not None else None
+    colnames: List[str] = []
+    ctx = BlockContext()
+    with compressed_io.open_text(path) as f:
+        while True:
+            colnames, batch, eof = _scan_dilepton_lines(f, colnames, max_events=events_per_chunk, keep=keep,
+                                                        selector=selector)
+            df = _build_dilepton_frame(colnames, batch, ctx, final=eof, keep=keep, block_filter=block_filter)
+            if not df.empty:
+                yield df
+            if eof:
+                break
+
+## Helper function to build the (packed) numpy structured dtype of one particle record in SMASH binary output
+def _binary_particle_dtype(extended: bool) -> np.dtype:
+    fields = BINARY_PARTICLE_FIELDS + (BINARY_EXTENDED_FIELDS if extended else [])
+    return np.dtype(fields)
+
+## Helper function to read the header of a SMASH binary file (memory-mapped)
+def _read_binary_header(buf: np.ndarray) -> tuple[int, int, str, int]:
+    '''
+    Returns format version, format variant (0: default, 1: extended), SMASH version string and the offset of the first block.
+    '''
+    if bytes(buf[:4]) != BINARY_MAGIC:
+        raise ValueError("Not a SMASH binary file (magic number 'SMSH' missing).")
+    format_version, format_variant, len_version = struct.unpack_from("<HHI", buf, 4)
+    if format_version < BINARY_MIN_FORMAT_VERSION:
+        raise ValueError(f"Unsupported SMASH binary format version {format_version} "
+                         f"(expected >= {BINARY_MIN_FORMAT_VERSION}).")
+    smash_version = bytes(buf[12 : 12 + len_version]).decode("utf-8", errors="replace")
+    return format_version, format_variant, smash_version, 12 + len_version
+
+## Helper function to walk through the blocks of a memory-mapped SMASH binary file
+def _scan_binary_blocks(buf: np.ndarray, offset: int, particle_dtype: np.dtype) -> tuple[np.ndarray, _LineBatch, List[tuple]]:
+    '''
+    Copies the particle records of all 'p' and 'i' blocks into one structured array (the records are decoded by the
+    structured dtype directly from the memory map, without per-field parsing) and records the block headers:
+    interaction ('i') and event end ('f') blocks are stored in a _LineBatch with their position given as number of
+    records before them, exactly like the comment lines of the text output. Particle ('p') blocks are returned as
+    list of (record position, event, ensemble, number of particles).
+    '''
+    rec_size = particle_dtype.itemsize
+    size = buf.size
+    # First pass: block headers only (record data is skipped)
+    spans: List[tuple[int, int]] = []
+    batch = _LineBatch()
+    p_blocks: List[tuple] = []
+    n_records = 0
+    while offset < size:
+        block_type = buf[offset]
+        offset += 1
+        if block_type == _BLOCK_INTERACTION:
+            n_in, n_out, _rho, weight, partial, itype = _BINARY_INTERACTION_HEADER.unpack_from(buf, offset)
+            offset += _BINARY_INTERACTION_HEADER.size
+            batch.int_pos.append(n_records)
+            batch.int_meta.append((n_in, n_out, weight, partial, itype))
+            count = n_in + n_out
+        elif block_type == _BLOCK_PARTICLES:
+            event, ensemble, count = _BINARY_PARTICLES_HEADER.unpack_from(buf, offset)
+            offset += _BINARY_PARTICLES_HEADER.size
+            p_blocks.append((n_records, event, ensemble, count))
+        elif block_type == _BLOCK_EVENT_END:
+            event, ensemble, _impact, _empty = _BINARY_EVENT_END_HEADER.unpack_from(buf, offset)
+            offset += _BINARY_EVENT_END_HEADER.size
+            batch.evt_pos.append(n_records)
+            batch.evt_read.append(n_records)
+            batch.evt_meta.append((event, ensemble))
+            batch.n_event_ends += 1
+            continue
+        else:
+            raise ValueError(f"Unknown block type {chr(block_type)!r} at byte {offset - 1} of SMASH binary file.")
+        if offset + count * rec_size > size:
+            raise ValueError(f"Truncated SMASH binary file: block at byte {offset} exceeds the file size.")
+        spans.append((offset, count))
+        offset += count * rec_size
+        n_records += count
+
+    batch.n_data = batch.n_read = n_records
+    # Second pass: copy the records of all blocks into one preallocated structured array
+    records = np.empty(n_records, dtype=particle_dtype)
+    pos = 0
+    for start, count in spans:
+        records[pos : pos + count] = np.ndarray((count,), dtype=particle_dtype, buffer=buf, offset=start)
+        pos += count
+    return records, batch, p_blocks
+
+## Helper function to get the bytes of a binary output file (memory map, compressed files are decompressed into memory)
+def _binary_buffer(path: Path) -> np.ndarray:
+    if compressed_io.detect_compression(path) is None:
+        return np.memmap(path, dtype=np.uint8, mode="r")
+    # The block scan needs random access, so the decompressed stream is collected once
+    with compressed_io.open_binary(path) as f:
+        return np.frombuffer(f.read(), dtype=np.uint8)
+
+## Helper function to convert structured particle records into typed column arrays (text reader layout)
+def _records_to_columns(records: np.ndarray) -> tuple[dict, List[str]]:
+    colnames = list(records.dtype.names)
+    return {name: records[name].astype(_column_dtype(name)) for name in colnames}, colnames
+
+## Function to read SMASH Dilepton output in binary format with block metadata
+def read_smash_binary_dilepton_output(path: Path, block_filter: Optional[BlockFilter] = None) -> pd.DataFrame:
+    """
+    Reads a SMASH binary Dilepton output file (Format: ["Binary"]) via a memory map (compressed files are decompressed).
+    Returns the same DataFrame as read_smash_dilepton_output for the Oscar2013 text output of the same run:
+    one row per particle record with the block metadata columns block_no/in_particles/out_particles/
+    block_weight/block_partial/block_type/event/ensemble/io_role (plus one row per empty event).
+    Inputs:
+    path : Path
+        Path to the binary Dilepton output file (e.g. Dileptons.bin).
+    block_filter : BlockFilter | None
+        Blocks to keep (see read_smash_dilepton_output), applied after decoding the records.
+    Returns:
+    pd.DataFrame
+        DataFrame with one row per particle record."""
+    buf = _binary_buffer(path)
+    _, format_variant, _, offset = _read_binary_header(buf)
+    records, batch, _ = _scan_binary_blocks(buf, offset, _binary_particle_dtype(extended=format_variant == 1))
+    del buf
+    columns, colnames = _records_to_columns(records)
+    del records
+    return _filter_frame(_frame_with_block_metadata(columns, colnames, batch, BlockContext(), final=True), block_filter)
+
+## Function to read SMASH Particles output in binary format
+def read_smash_binary_particle_file(path: Path) -> pd.DataFrame:
+    """
+    Reads a SMASH binary Particles output file (Format: ["Binary"]) via a memory map (compressed files are decompressed).
+    Inputs:
+    path : Path
+        Path to the binary Particles output file (e.g. particles_binary.bin).
+    Returns:
+    pd.DataFrame
+        Typed DataFrame (OSCAR_DATA_TYPES) with one row per particle record and the columns event and ensemble of the
+        particle block plus block_no (running number of the particle block, i.e. the output time step)."""
+    buf = _binary_buffer(path)
+    _, format_variant, _, offset = _read_binary_header(buf)
+    records, _, p_blocks = _scan_binary_blocks(buf, offset, _binary_particle_dtype(extended=format_variant == 1))
+    del buf
+    df = pd.DataFrame({name: records[name] for name in records.dtype.names})
+    counts = np.asarray([count for _, _, _, count in p_blocks], dtype=np.int64)
+    df["block_no"] = np.repeat(np.arange(len(p_blocks)), counts)
+    df["event"] = np.repeat(np.asarray([event for _, event, _, _ in p_blocks], dtype=np.int64), counts)
+    df["ensemble"] = np.repeat(np.asarray([ensemble for _, _, ensemble, _ in p_blocks], dtype=np.int64), counts)
+    return qol.apply_data_types(df, OSCAR_DATA_TYPES)
+
+## Helper function to check the binary readers against a small Dileptons.bin assembled byte by byte from the SMASH format spec
+def _check_binary_layout() -> None:
+    '''
+    The sample is packed field by field with struct (independent of the dtypes and block headers used by the readers):
+    header "SMSH" + uint16 format version + uint16 format variant + uint32 length + SMASH version, then per block a
+    one-character block type followed by
+    'i': uint32 n_in, uint32 n_out, double density, double weight, double partial weight, uint32 process type,
+    'p': int32 event, int32 ensemble, uint32 number of particles,
+    'f': int32 event, int32 ensemble, double impact parameter, char empty event,
+    and per particle 9 doubles (t x y z mass p0 px py pz) and 3 int32 (pdg ID charge), in the extended variant followed
+    by int32 ncoll, 2 doubles (formation time, cross section factor), 2 int32 (process id/type of origin),
+    double time of last collision and 4 int32 (pdg of both mothers, baryon number, strangeness).
+    '''
+    # Record and block header sizes in bytes as given by the spec
+    assert _binary_particle_dtype(extended=False).itemsize == 9 * 8 + 3 * 4 == 84
+    assert _binary_particle_dtype(extended=True).itemsize == 84 + 4 + 2 * 8 + 2 * 4 + 8 + 4 * 4 == 136
+    assert (_BINARY_INTERACTION_HEADER.size, _BINARY_PARTICLES_HEADER.size, _BINARY_EVENT_END_HEADER.size) == (36, 12, 17)
+
+    def particle(extended: bool, t: float, mass: float, p: tuple, pdg: int, pid: int, charge: int) -> bytes:
+        record = struct.pack("<9d3i", t, 0.1, -0.2, 0.3, mass, *p, pdg, pid, charge)
+        if extended:
+            record += struct.pack("<i2d2id4i", 2, 0.5, 1.0, 7, 42, 1.5, 113, 0, 0, 0)
+        return record
+
+    import tempfile
+    for format_variant in (0, 1):
+        extended = format_variant == 1
+        version = b"SMASH-3.1"
+        sample = b"SMSH" + struct.pack("<HHI", 10, format_variant, len(version)) + version
+        # Event 0: one Dalitz decay rho0 -> e+ e- with weight 2.5e-5 (process type 5)
+        sample += b"i" + struct.pack("<IIdddI", 1, 2, 0.01, 2.5e-5, 1.25e-5, 5)
+        sample += particle(extended, 1.0, 0.775, (0.9, 0.1, 0.2, 0.3), 113, 7, 0)
+        sample += particle(extended, 1.0, 0.000511, (0.45, 0.05, 0.1, 0.15), 11, 8, -1)
+        sample += particle(extended, 1.0, 0.000511, (0.45, 0.05, 0.1, 0.15), -11, 9, 1)
+        sample += b"f" + struct.pack("<iid?", 0, 0, 3.5, False)
+        # Event 1: empty
+        sample += b"f" + struct.pack("<iid?", 1, 0, 4.5, True)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "Dileptons.bin"
+            path.write_bytes(sample)
+            df = read_smash_binary_dilepton_output(path)
+        dileptons = df[df["io_role"] != "NA"]
+        assert dileptons["pdg"].tolist() == [113, 11, -11], dileptons
+        assert dileptons["io_role"].tolist() == ["in", "out", "out"], dileptons
+        assert np.allclose(dileptons["p0"], [0.9, 0.45, 0.45]) and np.allclose(dileptons["mass"], [0.775, 0.000511, 0.000511])
+        assert dileptons["ID"].tolist() == [7, 8, 9] and dileptons["charge"].tolist() == [0, -1, 1]
+        assert (dileptons["block_weight"] == 2.5e-5).all() and (dileptons["block_type"] == 5).all()
+        # One row per event end block (as for the event lines of the text output), carrying its event number
+        assert df.loc[df["io_role"] == "NA", "event"].tolist() == [0, 1], df
+        if extended:
+            assert (dileptons["ncoll"] == 2).all() and (dileptons["pdg_mother1"] == 113).all()
+            assert np.allclose(dileptons["time_last_coll"], 1.5)
+
+## Row-wise/groupby implementation of aggregate_dilepton_pairs (reference for benchmarks)
+def _aggregate_dilepton_pairs_groupby(df: pd.DataFrame) -> pd.DataFrame:
     """
     Aggregates electron-positron pairs into dilepton entries per event and block.
     Inputs:
@@ -229,6 +1120,8 @@ def aggregate_dilepton_pairs(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
     pd.DataFrame
         DataFrame with aggregated dilepton pairs."""
+    # Drop rows without event or block number (MISSING_META; groupby only drops NaN keys)
+    df = df[(df["event"] >= 0) & (df["block_no"] >= 0)]
     # Restrict to columns with time, momenta, pdg, and block metadata for brevity
     df_reduced = df[["t", "p0", "px", "py", "pz", "pdg", "event", "block_no", 
              "in_particles", "out_particles", "io_role", "block_weight", "block_type"]].copy()
@@ -239,7 +1132,7 @@ def aggregate_dilepton_pairs(df: pd.DataFrame) -> pd.DataFrame:
     )
     # Combine electron and positron entries into dilepton pairs per event and block
     df_aggregated = df_reduced.groupby(["t", "p_pdg_id", "event", "block_no", "io_role",
-                      "block_weight", "block_type"]).agg({
+                      "block_weight", "block_type"], observed=True).agg({
         "p0": "sum",
         "px": "sum",
         "py": "sum",
@@ -251,11 +1144,74 @@ def aggregate_dilepton_pairs(df: pd.DataFrame) -> pd.DataFrame:
     # Return the final aggregated DataFrame
     return df_final
 
+## Function to aggregate dilepton pairs from parsed DataFrame
+def aggregate_dilepton_pairs(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggregates electron-positron pairs into dilepton entries per event and block.
+    Rows are grouped by the integer keys (event, block_no, io_role, p_pdg_id) with array reductions: the rows are
+    sorted once by these keys and the momenta of each group are summed with np.add.reduceat (in float64).
+    t, block_weight and block_type are taken from the first row of each group (they are constant within a block).
+    Rows without event or block number (before the first event/interaction line, i.e. MISSING_META or NaN) are dropped,
+    as the groupby did.
+    Inputs:
+    df : pd.DataFrame
+        DataFrame containing parsed dilepton data with block metadata.
+    Returns:
+    pd.DataFrame
+        DataFrame with aggregated dilepton pairs, sorted by event, t, block_no, p_pdg_id and io_role."""
+    # Drop rows without event or block number (MISSING_META, or NaN for untyped frames; groupby drops NaN keys)
+    valid = ((df["event"] >= 0) & (df["block_no"] >= 0)).to_numpy()
+    if not valid.all():
+        df = df[valid]
+    # Pseudo PDG ID: '-1111' for electrons and positrons, so both end up in the same group
+    pdg = df["pdg"].to_numpy().astype(np.int64)
+    p_pdg_id = np.where(np.abs(pdg) == 11, -1111, pdg)
+    event = df["event"].to_numpy()
+    block_no = df["block_no"].to_numpy()
+    role_codes = df["io_role"].astype(IO_ROLE_DTYPE).cat.codes.to_numpy()
+
+    # Sort once by the integer group keys and find the first row of every group
+    order = np.lexsort((p_pdg_id, role_codes, block_no, event))
+    keys = (event[order], block_no[order], role_codes[order], p_pdg_id[order])
+    new_group = np.ones(len(order), dtype=bool)
+    if len(order):
+        new_group[1:] = np.logical_or.reduce([k[1:] != k[:-1] for k in keys])
+    starts = np.flatnonzero(new_group)
+    first = order[starts]
+
+    df_aggregated = pd.DataFrame({
+        "t": df["t"].to_numpy()[first],
+        "p_pdg_id": p_pdg_id[first],
+        "event": event[first],
+        "block_no": block_no[first],
+        "io_role": pd.Categorical.from_codes(role_codes[first], dtype=IO_ROLE_DTYPE),
+        "block_weight": df["block_weight"].to_numpy()[first],
+        "block_type": df["block_type"].to_numpy()[first],
+    })
+    # Combine electron and positron momenta into dilepton pairs
+    for col in ("p0", "px", "py", "pz"):
+        values = df[col].to_numpy(dtype=np.float64)[order]
+        df_aggregated[col] = np.add.reduceat(values, starts) if len(starts) else values
+
+    # Apply data types and sort like the groupby implementation: by event, t and block_no, and within a block by
+    # p_pdg_id and io_role (compared as strings, as the groupby keys were)
+    df_final = qol.apply_data_types(df_aggregated, OSCAR_DATA_TYPES)
+    role_rank = np.argsort(np.argsort(IO_ROLES))[role_codes[first]]
+    sort_order = np.lexsort((role_rank, df_final["p_pdg_id"].to_numpy(), df_final["block_no"].to_numpy(),
+                             df_final["t"].to_numpy(), df_final["event"].to_numpy()))
+    df_final = df_final.take(sort_order).reset_index(drop=True)
+
+    # Return the final aggregated DataFrame
+    return df_final
+
 # -----------------------------
 # MAIN SCRIPT
 # -----------------------------
 if __name__ == "__main__":
     import quality_of_life as qol
+    # Check of the binary record and block layout against a sample assembled from the SMASH format spec
+    _check_binary_layout()
+    print("Binary readers decode a sample written byte by byte after the SMASH format spec.")
     # Example usage of the functions defined above
     data_dir_name = 'Dilepton_Output_Std_Nevents_5_OutInt_NaN/' # Example data subdirectory
     file_name = 'Dileptons.oscar'  # Example SMASH output file name
@@ -263,6 +1219,34 @@ if __name__ == "__main__":
     path_to_smash_data = qol.get_path_to_output_file(file_name, data_dir_name, BASE_PATH_TO_DATA)
     # Read the SMASH data with block metadata
     df = read_smash_dilepton_output(path_to_smash_data)
+    # Parity check of the fast parser engine against the legacy line-by-line parser
+    pd.testing.assert_frame_equal(df, read_smash_dilepton_output(path_to_smash_data, engine="legacy"))
+    print("Parser engines 'fast' and 'legacy' return identical DataFrames.")
+    # Check of the column projection: same values as the full frame, and a corrupted line in the middle of the file
+    # (two fields missing) is reported with and without projection instead of being parsed into shifted columns
+    projected_columns = ["t", "p0", "px", "py", "pz", "pdg"]
+    df_projected = read_smash_dilepton_output(path_to_smash_data, columns=projected_columns)
+    pd.testing.assert_frame_equal(df_projected, df[df_projected.columns])
+    lines = path_to_smash_data.read_text().splitlines()
+    data_rows = [i for i, line in enumerate(lines) if line and not line.startswith("#")]
+    lines[data_rows[len(data_rows) // 2]] = " ".join(lines[data_rows[len(data_rows) // 2]].split()[:-2])
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corrupted_path = Path(tmp_dir) / file_name
+        corrupted_path.write_text("\n".join(lines) + "\n")
+        for columns in (None, projected_columns):
+            try:
+                read_smash_dilepton_output(corrupted_path, columns=columns)
+            except ValueError:
+                continue
+            raise AssertionError(f"Corrupted line not reported (columns={columns})")
+    print("Column projection returns the same values and reports corrupted lines.")
+    # Parity check of the binary reader if the same run was also written in binary format (Format: ["Oscar2013", "Binary"])
+    path_to_binary_data = path_to_smash_data.with_name("Dileptons.bin")
+    if path_to_binary_data.exists():
+        # (the text output is rounded to a few decimals, hence the tolerances)
+        pd.testing.assert_frame_equal(df, read_smash_binary_dilepton_output(path_to_binary_data), rtol=1e-6, atol=1e-6)
+        print("Binary and Oscar2013 text output return identical DataFrames.")
     # Aggregate dilepton pairs
     df = aggregate_dilepton_pairs(df)
     # Print the first few rows of the DataFrame
@@ -2,6 +2,7 @@
 # IMPORTS
 # -----------------------------
 ## Standard libraries
+import argparse
 import numpy as np
 ## Third-party libraries
 
@@ -10,6 +11,7 @@ import quality_of_life as qol
 import io_smash
 import smash_output_functions as sof
 import plotting as plot
+import profiling
 
 # -----------------------------
 # CONSTANTS AND SETTINGS
@@ -21,25 +23,47 @@ DATA_DIR_NAME = 'Dilepton_Out_Std_Nevents_10000_OutInt_NaN/' # Example data subd
 FILE_NAME = 'Dileptons.oscar'  # Example SMASH output file name
 RUN_ON_LOCAL = False  # Whether to run on local or remote data
 SINGLE_RUN = False  # Whether to process a single run or aggregate multiple runs
+PARALLEL = True  # Whether to process the runs (or the parts of a single run) in a process pool (workers: SLURM_CPUS_PER_TASK or all CPUs)
+USE_CACHE = True  # Whether to reuse the enriched per-run DataFrames stored by run_cache (rebuild via --rebuild-cache)
+EVENTS_PER_CHUNK = None  # Stream each Dileptons.oscar in chunks of this many events to bound memory (None: read whole file)
+INCREMENTAL = False  # Whether to only process new/changed run folders and merge them into the stored aggregate (see run_manifest.py)
 # -----------------------------
 # MAIN SCRIPT
 # -----------------------------
-# Determine base path to data
-BASE_PATH_TO_DATA = PATH_TO_DATA_LOCAL if RUN_ON_LOCAL else PATH_TO_DATA_REMOTE
-if SINGLE_RUN:
-    # Process single run
-    path_to_smash_data = qol.get_path_to_output_file(file_name=FILE_NAME, folder_name=DATA_DIR_NAME, root_path=BASE_PATH_TO_DATA)
-    smash_data = io_smash.read_smash_dilepton_output(path_to_smash_data)
-    short_dilepton_data = io_smash.aggregate_dilepton_pairs(smash_data)   
-    dilepton_data_enriched = sof.calculate_invariant_mass(short_dilepton_data, col_energy="p0", col_px="px", col_py="py", col_pz="pz")
-    dilepton_data_enriched = sof.enrich_dilepton_with_parent(dilepton_data_enriched)
-    dilepton_data_enriched = sof.adjust_shining_weights(dilepton_data_enriched)
-else:
-    dilepton_data_enriched = sof.aggregate_runs(root_dir=BASE_PATH_TO_DATA, data_dir=DATA_DIR_NAME, filename=FILE_NAME)
+# Guard needed for the process pool in aggregate_runs (worker processes must not re-run the analysis)
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Analyse SMASH dilepton outputs.")
+    arg_parser.add_argument("--rebuild-cache", action="store_true", help="ignore cached runs and parse them again")
+    args = arg_parser.parse_args()
+    # Determine base path to data
+    BASE_PATH_TO_DATA = PATH_TO_DATA_LOCAL if RUN_ON_LOCAL else PATH_TO_DATA_REMOTE
+    if SINGLE_RUN:
+        # Process single run
+        path_to_smash_data = qol.get_path_to_output_file(file_name=FILE_NAME, folder_name=DATA_DIR_NAME, root_path=BASE_PATH_TO_DATA)
+        # A single (large) file is split at event boundaries and parsed by several worker processes
+        dilepton_data_enriched = sof.process_dilepton_file(path_to_smash_data, events_per_chunk=EVENTS_PER_CHUNK,
+                                                           use_cache=USE_CACHE, rebuild_cache=args.rebuild_cache,
+                                                           n_workers=qol.get_default_workers() if PARALLEL else 1)
+    elif INCREMENTAL:
+        # Array jobs finish in waves: only runs finished since the last call are parsed
+        dilepton_data_enriched = sof.aggregate_runs_incremental(root_dir=BASE_PATH_TO_DATA, data_dir=DATA_DIR_NAME,
+                                                                filename=FILE_NAME, events_per_chunk=EVENTS_PER_CHUNK,
+                                                                parallel=PARALLEL)
+    else:
+        dilepton_data_enriched = sof.aggregate_runs(root_dir=BASE_PATH_TO_DATA, data_dir=DATA_DIR_NAME, filename=FILE_NAME,
+                                                    events_per_chunk=EVENTS_PER_CHUNK, parallel=PARALLEL,
+                                                    use_cache=USE_CACHE, rebuild_cache=args.rebuild_cache)
 
-bin_struct = np.linspace(0,0.7,36)
-plot.plot_hist_multiple(dilepton_data_enriched, col_bin_axis="m_inv", col_weight="block_weight_adj",
-                        bin_edges= bin_struct, save_figure=True, file_name="Hist_np_1.5GeV_10kx10_events.png")
+    bin_struct = np.linspace(0,0.7,36)
+    with profiling.stage("plotting", rows_in=len(dilepton_data_enriched)):
+        plot.plot_hist_multiple(dilepton_data_enriched, col_bin_axis="m_inv", col_weight="block_weight_adj",
+                                bin_edges= bin_struct, save_figure=True, file_name="Hist_np_1.5GeV_10kx10_events.png")
+
+    # Per-stage report of this job (only with SMASH_PROFILE=1, see profiling.py)
+    report_path = profiling.write_report()
+    if report_path is not None:
+        print(f"Profiling report written to {report_path}")
+        profiling.print_report(report_path)
 
 #print(dilepton_data_enriched)
 #print((dilepton_data_enriched["p_pdg_id"]==-1111))
@@ -0,0 +1,110 @@
+# -----------------------------
+# IMPORTS
+# -----------------------------
+## Standard libraries
+import time
+import argparse
+from pathlib import Path
+import numpy as np
+## Third-party libraries
+
+## Custom libraries
+import smash_output_functions as sof
+import figure_batch
+import plotting
+import profiling
+from output_analysis import PATH_TO_DATA_REMOTE, FILE_NAME
+
+# -----------------------------
+# CONSTANTS AND SETTINGS
+# -----------------------------
+# Default binning of the invariant mass spectra (same as output_analysis.py)
+SCAN_BIN_EDGES = np.linspace(0, 0.7, 36)
+# Weight column of the spectra (normalised by the dilepton events in DileptonHistogram.spectrum; the comparison of the
+# datasets uses the "total" normalisation, i.e. per event, as the datasets can have different numbers of runs)
+SCAN_COL_WEIGHT = "block_weight"
+
+# -----------------------------
+# CLASSES AND FUNCTIONS
+# -----------------------------
+## Function to analyse several datasets (e.g. beam energies, systems or decay-mode files) in one invocation
+def run_parameter_scan(data_dirs: list[str], root_dir: str | Path = PATH_TO_DATA_REMOTE, filename: str = FILE_NAME,
+                       bin_edges: np.ndarray = SCAN_BIN_EDGES, col_weight: str = SCAN_COL_WEIGHT,
+                       labels: list[str] | None = None, channels: list[int] | tuple = (), n_workers: int | None = None,
+                       output_dir: str | Path | None = None, figure_dir: str | Path = plotting.FIGURE_DIR,
+                       prefix: str = "Scan") -> dict:
+    '''
+    Histograms the runs of all datasets with sof.histogram_datasets_incremental (one shared process pool, runs
+    already in the stored aggregates and cached frames are reused), stores the per-dataset aggregates and renders
+    one spectrum per dataset plus the comparison of all datasets (all dileptons and each channel in channels)
+    with figure_batch.render_figures.
+
+    :param data_dirs: Names of the dataset directories below root_dir
+    :type data_dirs: list[str]
+    :param (optional, default = None) labels: Legend labels of the datasets (None: the directory names)
+    :type labels: list[str] | None
+    :param (optional, default = ()) channels: Pseudo-parent PDG IDs that get a comparison figure of their own
+    :type channels: list[int] | tuple
+    :param (optional, default = None) output_dir: Directory for copies of the per-dataset histograms
+     (<data_dir>.npz, see DileptonHistogram.load); None: only the stored incremental aggregates are kept
+    :type output_dir: str | Path | None
+    :return: Label -> merged histogram of the dataset
+    :rtype: dict
+    '''
+    start = time.perf_counter()
+    data_dirs = list(dict.fromkeys(data_dir.rstrip("/") for data_dir in data_dirs))
+    labels = data_dirs if labels is None else list(labels)
+    if len(labels) != len(data_dirs):
+        raise ValueError(f"Got {len(labels)} labels for {len(data_dirs)} datasets")
+    with profiling.stage("scan", label=", ".join(data_dirs)):
+        hists_per_dir = sof.histogram_datasets_incremental(root_dir, data_dirs, filename, bin_edges, col_weight=col_weight,
+                                                           parallel=True, n_workers=n_workers)
+    hists = {label: hists_per_dir[data_dir] for label, data_dir in zip(labels, data_dirs) if hists_per_dir[data_dir].n_fills}
+    for label, data_dir in zip(labels, data_dirs):
+        hist = hists_per_dir[data_dir]
+        print(f"{label}: {hist.n_fills} runs, {hist.n_events:,} dilepton events")
+        if output_dir is not None:
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+            hist.save(Path(output_dir) / f"{Path(data_dir).name}.npz")
+    if not hists:
+        print("No dataset contains processed runs, no figures rendered")
+        return hists
+
+    specs = [figure_batch.PlotSpec("hist_accumulated", f"{prefix}_{Path(data_dir).name}.png",
+                                   data=label, options={"title": label})
+             for label, data_dir in zip(labels, data_dirs) if label in hists]
+    for channel in [None, *channels]:
+        suffix = "all" if channel is None else str(channel)
+        specs.append(figure_batch.PlotSpec("dataset_comparison", f"{prefix}_comparison_{suffix}.png", data="comparison",
+                                           options={"channel": channel}))
+    figure_batch.render_figures(specs, {**hists, "comparison": hists}, figure_dir=figure_dir, n_workers=n_workers)
+    print(f"Parameter scan of {len(data_dirs)} datasets done in {time.perf_counter() - start:.1f} s")
+    return hists
+
+# -----------------------------
+# MAIN SCRIPT
+# -----------------------------
+# Guard needed for the process pool (worker processes must not re-run the scan)
+if __name__ == "__main__":
+    # Example: python parameter_scan.py Dilepton_Out_np_1.25GeV Dilepton_Out_np_1.5GeV --labels "1.25 GeV" "1.5 GeV"
+    parser = argparse.ArgumentParser(description="Analyse and compare several SMASH datasets in one invocation.")
+    parser.add_argument("data_dirs", nargs="+", help="dataset directories below --root")
+    parser.add_argument("--root", default=PATH_TO_DATA_REMOTE, help="directory containing the datasets (default: %(default)s)")
+    parser.add_argument("--filename", default=FILE_NAME, help="SMASH output file of every run (default: %(default)s)")
+    parser.add_argument("--labels", nargs="+", help="legend labels of the datasets (default: directory names)")
+    parser.add_argument("--channels", nargs="*", type=int, default=[], help="pseudo-parent PDG IDs compared separately")
+    parser.add_argument("--bins", nargs=3, type=float, metavar=("LOW", "HIGH", "N"),
+                        help="binning of m_inv (default: 0 0.7 35)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: SLURM_CPUS_PER_TASK or all CPUs)")
+    parser.add_argument("--output-dir", help="directory for copies of the per-dataset histograms")
+    parser.add_argument("--figure-dir", default=plotting.FIGURE_DIR, help="directory of the figures (default: %(default)s)")
+    args = parser.parse_args()
+
+    bin_edges = SCAN_BIN_EDGES if args.bins is None else np.linspace(args.bins[0], args.bins[1], int(args.bins[2]) + 1)
+    run_parameter_scan(args.data_dirs, root_dir=args.root, filename=args.filename, bin_edges=bin_edges,
+                       labels=args.labels, channels=args.channels, n_workers=args.workers,
+                       output_dir=args.output_dir, figure_dir=args.figure_dir)
+    report_path = profiling.write_report()
+    if report_path is not None:
+        print(f"Profiling report written to {report_path}")
+# End of script
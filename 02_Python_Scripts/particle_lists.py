@@ -0,0 +1,253 @@
+# -----------------------------
+# IMPORTS
+# -----------------------------
+## Standard libraries
+from __future__ import annotations
+import re
+import mmap
+import time
+import argparse
+from pathlib import Path
+from typing import Iterator
+import pandas as pd
+import numpy as np
+## Third-party libraries
+## Custom libraries
+import io_smash
+import run_cache
+import compressed_io
+
+# -----------------------------
+# CONSTANTS AND SETTINGS
+# -----------------------------
+# File name suffix of the sidecar index, written next to the source file (particle_lists.oscar -> particle_lists.index.npz)
+INDEX_SUFFIX = ".index.npz"
+# Version of the index layout (an index of another version is rebuilt)
+INDEX_VERSION = 2
+# Columns of the index: one row per snapshot ("# event ... in/out N" line and the N particle lines below it)
+INDEX_COLUMNS = ["event", "ensemble", "snapshot", "time", "n_particles", "start", "stop"]
+
+# Snapshot header of Oscar2013 particle lists, e.g. "# event 0 ensemble 0 out 394" (older SMASH: "# event 0 out 394");
+# "in" marks the initial state, "out" the output at every Output_Interval and at the end of the event
+_SNAPSHOT_RE = re.compile(r"#\s*event\s+(?P<event>\d+)(?:\s+ensemble\s+(?P<ensemble>\d+))?\s+(?:in|out)\s+(?P<n>\d+)")
+
+# -----------------------------
+# CLASSES AND FUNCTIONS
+# -----------------------------
+## Function to get the index path belonging to a particle_lists file
+def index_path_for(source_path: str | Path) -> Path:
+    source_path = Path(source_path)
+    return source_path.with_name(source_path.stem + INDEX_SUFFIX)
+
+## Helper function to find all snapshots of a particle_lists file in one pass over its comment lines
+def _scan_snapshots(source_path: Path) -> tuple[pd.DataFrame, list[str]]:
+    '''
+    Only the comment lines are looked at: the file is memory mapped and the next line starting with '#' is found
+    with mmap.find, so the particle lines are never split or decoded. The time of a snapshot is the t value of its
+    first particle line (SMASH writes all particles of a snapshot at the output time). Empty snapshots ("out 0") take
+    the time of the same snapshot number in another event (all events share the output times); if no event has
+    particles in that snapshot, their time stays unknown (NaN).
+    '''
+    colnames: list[str] = []
+    rows = []
+    snapshot_of_event: dict[tuple[int, int], int] = {}
+    with open(source_path, "rb") as f:
+        if source_path.stat().st_size == 0:
+            raise ValueError(f"{source_path} is empty")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            first_comment = 0 if mm[:1] == b"#" else mm.find(b"\n#")
+            pos = size if first_comment < 0 else first_comment + (first_comment > 0)
+            while pos < size:
+                eol = mm.find(b"\n", pos)
+                eol = size if eol < 0 else eol
+                line = mm[pos:eol].decode("utf-8", errors="replace")
+                # The data of this comment line ends where the next comment line starts
+                next_comment = mm.find(b"\n#", eol)
+                stop = size if next_comment < 0 else next_comment + 1
+                start = min(eol + 1, size)
+                if line.startswith("#!"):
+                    # '#!OSCAR2013 particle_lists t x y z ...'
+                    colnames = line.split()[2:]
+                elif (match := _SNAPSHOT_RE.match(line)) is not None:
+                    event, ensemble = int(match["event"]), int(match["ensemble"] or 0)
+                    snapshot = snapshot_of_event.get((event, ensemble), 0)
+                    snapshot_of_event[(event, ensemble)] = snapshot + 1
+                    t = np.nan
+                    if start < stop and "t" in colnames:
+                        line_end = mm.find(b"\n", start, stop)
+                        first_line = mm[start:stop if line_end < 0 else line_end]
+                        t = float(first_line.split()[colnames.index("t")])
+                    rows.append((event, ensemble, snapshot, t, int(match["n"]), start, stop))
+                pos = stop
+    if not colnames:
+        raise ValueError(f"No column names found in {source_path} (missing '#!' header line?)")
+    table = pd.DataFrame(rows, columns=INDEX_COLUMNS).astype(
+        {"event": "int32", "ensemble": "int32", "snapshot": "int32", "time": "float64",
+         "n_particles": "int64", "start": "int64", "stop": "int64"})
+    table["time"] = table["time"].fillna(table.groupby("snapshot")["time"].transform("first"))
+    return table, colnames
+
+## Class giving random access to the events and snapshots of a SMASH particle_lists.oscar file through a sidecar index
+class ParticleListIndex:
+    '''
+    Byte ranges of every snapshot, (event, snapshot) -> [start, stop), found in one scan of the file and stored next
+    to it (see index_path_for, written with run_cache.save_frame). The index is rebuilt when the size or mtime of the
+    file changes. Single events or output times are then read by seeking to their ranges, and all snapshots can be
+    streamed one by one, so files of several GB never have to be loaded at once.
+    Random access needs an uncompressed file (a .gz/.zst/.xz file cannot be indexed).
+    '''
+    def __init__(self, source_path: str | Path, table: pd.DataFrame, colnames: list[str]):
+        self.source_path = Path(source_path)
+        self.table = table
+        self.colnames = colnames
+
+    ## Build the index by scanning the file
+    @classmethod
+    def build(cls, source_path: str | Path) -> ParticleListIndex:
+        source_path = Path(source_path)
+        if compressed_io.detect_compression(source_path) is not None:
+            raise ValueError(f"{source_path} is compressed; random access needs the uncompressed file")
+        table, colnames = _scan_snapshots(source_path)
+        return cls(source_path, table, colnames)
+
+    ## Load the sidecar index if it is up to date, otherwise build it (and store it unless save is False)
+    @classmethod
+    def load_or_build(cls, source_path: str | Path, index_path: str | Path | None = None, rebuild: bool = False,
+                      save: bool = True) -> ParticleListIndex:
+        source_path = Path(source_path)
+        index_path = Path(index_path) if index_path is not None else index_path_for(source_path)
+        stat = source_path.stat()
+        if not rebuild and index_path.exists():
+            try:
+                attrs = run_cache.load_attrs(index_path)
+                if (attrs.get("index_version") == INDEX_VERSION and attrs.get("source_size") == stat.st_size
+                        and attrs.get("source_mtime_ns") == stat.st_mtime_ns):
+                    return cls(source_path, run_cache.load_frame(index_path), attrs["colnames"])
+            except Exception as e:
+                print(f"WARNING: Ignoring unreadable index {index_path} ({type(e).__name__}: {e})")
+        index = cls.build(source_path)
+        if save:
+            index.save(index_path)
+        return index
+
+    ## Store the index as sidecar file
+    def save(self, index_path: str | Path | None = None) -> Path:
+        index_path = Path(index_path) if index_path is not None else index_path_for(self.source_path)
+        stat = self.source_path.stat()
+        attrs = {"index_version": INDEX_VERSION, "source_file": self.source_path.name, "source_size": stat.st_size,
+                 "source_mtime_ns": stat.st_mtime_ns, "colnames": self.colnames}
+        run_cache.save_frame(self.table, index_path, attrs=attrs)
+        return index_path
+
+    @property
+    def events(self) -> np.ndarray:
+        return np.unique(self.table["event"].to_numpy())
+
+    @property
+    def times(self) -> np.ndarray:
+        return np.unique(self.table["time"].dropna().to_numpy())
+
+    ## Select index rows by event, snapshot number within the event and/or output time
+    def select(self, events=None, snapshots=None, times=None, atol: float = 1e-6) -> pd.DataFrame:
+        '''
+        :param (optional, default = None) events: Event number or list of event numbers (None: all)
+        :param (optional, default = None) snapshots: Snapshot number(s) within each event; negative numbers count from
+         the end (-1: final state of every event) (None: all)
+        :param (optional, default = None) times: Output time(s) in fm, matched within atol (None: all)
+        :return: Selected rows of the index, in file order
+        :rtype: pd.DataFrame
+        '''
+        table = self.table
+        keep = np.ones(len(table), dtype=bool)
+        if events is not None:
+            keep &= table["event"].isin(np.atleast_1d(events)).to_numpy()
+        if snapshots is not None:
+            snapshots = np.atleast_1d(snapshots)
+            n_per_event = table.groupby(["event", "ensemble"])["snapshot"].transform("size").to_numpy()
+            snapshot = table["snapshot"].to_numpy()
+            keep &= np.isin(snapshot, snapshots[snapshots >= 0]) | np.isin(snapshot - n_per_event, snapshots[snapshots < 0])
+        if times is not None:
+            t = table["time"].to_numpy()
+            keep &= np.any(np.abs(t[:, None] - np.atleast_1d(times)[None, :]) <= atol, axis=1)
+        return table[keep]
+
+    ## Helper function to get the typed columns of a snapshot frame (particle columns, then event, snapshot and time)
+    def _dtypes(self, usecols: list[int] | None) -> list[tuple[str, np.dtype]]:
+        selected = self.colnames if usecols is None else [self.colnames[i] for i in usecols]
+        return ([(col, np.dtype(io_smash.OSCAR_DATA_TYPES.get(col, "float64"))) for col in selected]
+                + [("event", np.dtype("int32")), ("snapshot", np.dtype("int32")), ("time", np.dtype("float32"))])
+
+    ## Helper function to build an empty snapshot frame with the typed columns
+    def _empty_frame(self, usecols: list[int] | None) -> pd.DataFrame:
+        return pd.DataFrame({col: np.empty(0, dtype=dtype) for col, dtype in self._dtypes(usecols)})
+
+    ## Parse the particle lines of one snapshot (index row) into typed columns with event, snapshot and time attached
+    def _read_range(self, f, row, usecols: list[int] | None) -> pd.DataFrame:
+        if row.n_particles == 0:
+            # Empty snapshot ("out 0"): nothing to parse
+            return self._empty_frame(usecols)
+        f.seek(row.start)
+        lines = f.read(row.stop - row.start).decode("utf-8", errors="replace").splitlines()
+        if len(lines) != row.n_particles:
+            raise ValueError(f"{self.source_path}: event {row.event} snapshot {row.snapshot} has {len(lines)} particle lines, "
+                             f"expected {row.n_particles} (file truncated or modified after indexing?)")
+        dtype = self._dtypes(usecols)[:-3]
+        records = np.loadtxt(lines, dtype=dtype, usecols=usecols, comments=None, ndmin=1)
+        df = pd.DataFrame({col: records[col] for col, _ in dtype})
+        df["event"] = np.int32(row.event)
+        df["snapshot"] = np.int32(row.snapshot)
+        df["time"] = np.float32(row.time)
+        return df
+
+    ## Helper function to map the requested column names to column positions (None: all columns)
+    def _usecols(self, columns: list[str] | None) -> list[int] | None:
+        if columns is None:
+            return None
+        unknown = [col for col in columns if col not in self.colnames]
+        if unknown:
+            raise ValueError(f"Unknown columns {unknown}: available are {self.colnames}")
+        return sorted(self.colnames.index(col) for col in columns)
+
+    ## Stream the selected snapshots one by one (arguments as for select)
+    def iter_snapshots(self, events=None, snapshots=None, times=None, columns: list[str] | None = None) -> Iterator[pd.DataFrame]:
+        '''
+        Yields one DataFrame per snapshot with the (selected) particle columns in the compact dtypes of
+        io_smash.OSCAR_DATA_TYPES and the columns "event", "snapshot" and "time". Only one snapshot is held in memory.
+        '''
+        usecols = self._usecols(columns)
+        with open(self.source_path, "rb") as f:
+            for row in self.select(events, snapshots, times).itertuples(index=False):
+                yield self._read_range(f, row, usecols)
+
+    ## Read the selected snapshots into one DataFrame (arguments as for select)
+    def read(self, events=None, snapshots=None, times=None, columns: list[str] | None = None) -> pd.DataFrame:
+        parts = list(self.iter_snapshots(events, snapshots, times, columns))
+        if not parts:
+            return self._empty_frame(self._usecols(columns))
+        return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+
+## Function to open a particle_lists file for random access (loads or builds its sidecar index)
+def open_particle_lists(source_path: str | Path, rebuild: bool = False) -> ParticleListIndex:
+    return ParticleListIndex.load_or_build(source_path, rebuild=rebuild)
+
+# -----------------------------
+# MAIN SCRIPT
+# -----------------------------
+if __name__ == "__main__":
+    # Example: python particle_lists.py <run_dir>/particle_lists.oscar (builds the index and prints a summary)
+    parser = argparse.ArgumentParser(description="Build the snapshot index of SMASH particle_lists.oscar files.")
+    parser.add_argument("paths", nargs="+", help="particle_lists.oscar files")
+    parser.add_argument("--rebuild", action="store_true", help="ignore an existing index")
+    args = parser.parse_args()
+
+    for path in map(Path, args.paths):
+        start = time.perf_counter()
+        index = open_particle_lists(path, rebuild=args.rebuild)
+        elapsed = time.perf_counter() - start
+        print(f"{path}: {len(index.events):,} events, {len(index.table):,} snapshots at t = {index.times.tolist()} fm, "
+              f"{int(index.table['n_particles'].sum()):,} particle lines (index in {elapsed:.2f} s)")
+        start = time.perf_counter()
+        final = index.read(events=index.events[-1], snapshots=-1)
+        print(f"final state of event {index.events[-1]}: {len(final):,} particles read in {time.perf_counter() - start:.3f} s")
+# End of script
@@ -7,10 +7,14 @@ import numpy as np
 import pandas as pd
 
 import quality_of_life as qol
+from histogramming import grouped_bincount, RunHistogramTensor
+from density_estimation import binned_kde
 
 # Define directory to save figures
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 FIGURE_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..', '06_Figures'))
+# Above this number of samples plot_distribution uses the binned FFT KDE instead of scipy's exact gaussian_kde
+KDE_EXACT_MAX_SAMPLES = 20000
 
 # Functions
 ## Define a function to fill small gaps in histogram data. Maximum number of empty bins to bridge linearly
@@ -33,10 +37,16 @@ def _plot_dilepton_hist_line(ax, df, col_bin_axis, col_weight, bin_edges,
     col_plot_value = qol.resolve_col(df, col_bin_axis, 5)
     col_plot_weight = qol.resolve_col(df, col_weight, None)
     counts, edges = np.histogram(df[col_plot_value], bins=bin_edges, weights=df[col_plot_weight],)
+    _plot_counts_line(ax, counts, edges, label, color=color, linewidth=linewidth, alpha=alpha,
+                      gap_filling=gap_filling, max_gap_bins=max_gap_bins)
+
+## Function to plot already histogrammed counts as line (optionally bridging small gaps)
+def _plot_counts_line(ax, counts, edges, label, color=None, linewidth=1.5, alpha=0.9,
+                      gap_filling=False, max_gap_bins=2):
     centers = 0.5 * (edges[1:] + edges[:-1])
     if gap_filling:
         counts = fill_small_gaps(counts, centers, max_gap_bins=max_gap_bins)
-    ax.plot(
+    line, = ax.plot(
         centers,
         counts,
         color=color,
@@ -44,10 +54,21 @@ def _plot_dilepton_hist_line(ax, df, col_bin_axis, col_weight, bin_edges,
         alpha=alpha,
         label=label,
     )
+    return line
 
-## Function to plot multiple histograms of a given value including different subsets (e.g. all dileptons and their decay channels)
-def plot_hist_multiple(input_data: pd.DataFrame, col_bin_axis, col_weight, bin_edges: np.ndarray,
-                       save_figure=False, file_name=None, gap_filling = False, in_max_gap_bins = 2):
+## Define a function to draw an uncertainty band (e.g. from histogramming.RunHistogramTensor.uncertainty_bands) around a line
+def _plot_band(ax, lower, upper, edges, color, alpha=0.25):
+    centers = 0.5 * (edges[1:] + edges[:-1])
+    ax.fill_between(centers, lower, upper, color=color, alpha=alpha, linewidth=0)
+
+## Function to draw multiple histograms of a given value including different subsets onto given axes (returns the number of events)
+def draw_hist_multiple(ax, input_data: pd.DataFrame, col_bin_axis, col_weight, bin_edges: np.ndarray,
+                       gap_filling = False, in_max_gap_bins = 2, uncertainty=None, run_tensor=None, n_replicas=1000,
+                       band_level=0.68, channels=None, x_label=None):
+    # uncertainty: None (no bands), "bootstrap" or "jackknife" (resampling over the run folders, told apart by the columns
+    # "run_id" and "task_id" of aggregate_runs, or a precomputed run_tensor, e.g. from
+    # smash_output_functions.histogram_runs_per_run with the same binning and weights; at least 2 runs are needed)
+    # channels: pseudo-parent PDG IDs of the decay channels to draw (None: all); x_label: axis label (None: m_inv label)
     # Preprocessing data to separate different pseudo-parent PDG IDs and map to names for legend
     # First, filter only dilepton entries
     dilepton_only = input_data[input_data["p_pdg_id"]==-1111]
@@ -56,39 +77,77 @@ def plot_hist_multiple(input_data: pd.DataFrame, col_bin_axis, col_weight, bin_e
     # Remove 0 (if present) which indicates no parent 
     # (should not be the case but would also be useful to cover the potential case of mutliple "parents" (in-going particles) per dilepton block)
     p_parent_pdg_ids = [id for id in p_parent_pdg_ids if id != 0]  # remove 0 if present
+    if channels is not None:
+        p_parent_pdg_ids = [id for id in p_parent_pdg_ids if id in channels]
     # Map PDG IDs to names
-    pdg_name_map = {id: qol.get_pdg_name(id) for id in p_parent_pdg_ids}
+    pdg_name_map = qol.get_pdg_names(p_parent_pdg_ids)
 
     # Get total number of events for title
     n_events = int(input_data['event'].max()) + 1
 
-    # Start plotting
-    fig, ax = plt.subplots(figsize=(8,5))
-    # Get data for all dileptons
-    all_dileptons = dilepton_only
-    _plot_dilepton_hist_line(ax, all_dileptons, col_bin_axis=col_bin_axis, col_weight=col_weight, bin_edges = bin_edges, 
-                             label="all dileptons", color="black", linewidth=2.0, alpha=0.9,
+    # Histogram all decay channels in one pass: m_inv is digitized once and one weighted bincount
+    # over the combined (channel, bin) index gives the counts of all channels
+    col_plot_value = qol.resolve_col(dilepton_only, col_bin_axis, 5)
+    col_plot_weight = qol.resolve_col(dilepton_only, col_weight, None)
+    channel_ids, channel_counts, _ = grouped_bincount(dilepton_only[col_plot_value].to_numpy(),
+                                                      dilepton_only["p_parent_pdg_id"].to_numpy(), bin_edges,
+                                                      weights=dilepton_only[col_plot_weight].to_numpy())
+    counts_per_channel = dict(zip(channel_ids.tolist(), channel_counts))
+    # The total of all dileptons is the sum over all channels (including parent 0)
+    all_counts = channel_counts.sum(axis=0) if len(channel_ids) else np.zeros(len(bin_edges) - 1)
+
+    # Uncertainty bands of the summed counts from resampling the runs (one matrix product for all replicas)
+    bands = {}
+    if uncertainty is not None:
+        if run_tensor is None:
+            run_tensor = RunHistogramTensor.from_frame(dilepton_only, bin_edges, col_bin_axis=col_plot_value,
+                                                       col_weight=col_plot_weight)
+        if not np.array_equal(run_tensor.bin_edges, np.asarray(bin_edges, dtype=np.float64)):
+            raise ValueError("run_tensor must have the same bin edges as the plot.")
+        # Bands from other columns (e.g. block_weight instead of block_weight_adj) would not belong to the line
+        if (run_tensor.col_bin_axis, run_tensor.col_weight) != (col_plot_value, col_plot_weight):
+            raise ValueError(f"run_tensor histograms {run_tensor.col_bin_axis!r} weighted by {run_tensor.col_weight!r}, "
+                             f"the plot {col_plot_value!r} weighted by {col_plot_weight!r}.")
+        bands = run_tensor.uncertainty_bands(method=uncertainty, n_replicas=n_replicas, level=band_level,
+                                             normalize=False, per_bin_width=False)
+
+    # Plot all dileptons
+    line = _plot_counts_line(ax, all_counts, bin_edges, label="all dileptons", color="black", linewidth=2.0, alpha=0.9,
                              gap_filling=gap_filling, max_gap_bins=in_max_gap_bins,
                              )
+    if None in bands:
+        _plot_band(ax, bands[None][1], bands[None][2], bin_edges, color=line.get_color())
     # Plot subsets for individual decay channels producing dileptons
     for id in p_parent_pdg_ids:
-        sub = input_data[input_data["p_parent_pdg_id"] == id]
-        _plot_dilepton_hist_line(ax, sub, bin_edges=bin_edges, col_bin_axis=col_bin_axis, col_weight=col_weight,
+        line = _plot_counts_line(ax, counts_per_channel.get(id, np.zeros(len(bin_edges) - 1)), bin_edges,
                                  label=pdg_name_map.get(id, str(id)), linewidth=1.5, alpha=0.9,
                                  gap_filling=gap_filling, max_gap_bins=in_max_gap_bins,
                                  )
+        if int(id) in bands:
+            _plot_band(ax, bands[int(id)][1], bands[int(id)][2], bin_edges, color=line.get_color())
     # Set overall properties
     ax.set_yscale("log")
     ax.set_ylim(bottom=0)
     ax.set_xscale("linear")
     x_limits = (0,bin_edges[-1])
     ax.set_xlim(x_limits)
-    ax.set_xlabel("$m_{inv}$ (GeV/$c^2$)")
-    y_label = r'$\frac{dN}{d m_{inv}}$'
+    ax.set_xlabel("$m_{inv}$ (GeV/$c^2$)" if x_label is None else x_label)
+    y_label = r'$\frac{dN}{d m_{inv}}$' if x_label is None else f"dN/d({x_label})"
     ax.set_ylabel(y_label)
     ax.set_title(f"np @ 1.5 GeV, ({n_events:,} events, 100 runs)")
     ax.legend()
     ax.grid(True, alpha=0.3)
+    return n_events
+
+## Function to plot multiple histograms of a given value including different subsets (e.g. all dileptons and their decay channels)
+def plot_hist_multiple(input_data: pd.DataFrame, col_bin_axis, col_weight, bin_edges: np.ndarray,
+                       save_figure=False, file_name=None, gap_filling = False, in_max_gap_bins = 2,
+                       uncertainty=None, run_tensor=None, n_replicas=1000, band_level=0.68):
+    # Start plotting (see draw_hist_multiple for the parameters)
+    fig, ax = plt.subplots(figsize=(8,5))
+    n_events = draw_hist_multiple(ax, input_data, col_bin_axis, col_weight, bin_edges, gap_filling=gap_filling,
+                                  in_max_gap_bins=in_max_gap_bins, uncertainty=uncertainty, run_tensor=run_tensor,
+                                  n_replicas=n_replicas, band_level=band_level)
     fig.tight_layout()
 
     # Save or show the figure
@@ -102,6 +161,78 @@ def plot_hist_multiple(input_data: pd.DataFrame, col_bin_axis, col_weight, bin_e
     else:
         plt.show()
 
+## Function to draw the normalised spectra of a histogramming.DileptonHistogram onto given axes
+def draw_hist_accumulated(ax, hist, title=None, normalization="per_run"):
+    # normalization: "per_run" (as plot_hist_multiple with block_weight_adj) or "total" (per event of all runs),
+    # see histogramming.NORMALIZATIONS
+    # Map pseudo-parent PDG IDs (without 0, i.e. no parent) to names for the legend
+    channels = [id for id in hist.channels if id != 0]
+    pdg_name_map = qol.get_pdg_names(channels)
+
+    centers, values, errors = hist.spectrum(normalization=normalization)
+    ax.errorbar(centers, values, yerr=errors, color="black", linewidth=2.0, alpha=0.9, label="all dileptons")
+    for id in channels:
+        centers, values, errors = hist.spectrum(id, normalization=normalization)
+        ax.errorbar(centers, values, yerr=errors, linewidth=1.5, alpha=0.9, label=pdg_name_map.get(id, str(id)))
+    # Set overall properties
+    ax.set_yscale("log")
+    ax.set_xlim((0, hist.bin_edges[-1]))
+    ax.set_xlabel("$m_{inv}$ (GeV/$c^2$)")
+    ax.set_ylabel(r'$\frac{dN}{d m_{inv}}$' + (" (per event)" if normalization == "total" else ""))
+    ax.set_title(title if title is not None else f"{hist.n_events:,} dilepton events, {hist.n_fills} runs")
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+
+## Function to draw the normalised spectra of several datasets (label -> histogramming.DileptonHistogram) onto given axes for comparison
+def draw_dataset_comparison(ax, hists, channel=None, title=None, normalization="total"):
+    # channel: pseudo-parent PDG ID to compare (None: all dileptons)
+    # normalization: "total" by default, so datasets with different numbers of runs are compared per event
+    # ("per_run" grows with the number of runs, see histogramming.NORMALIZATIONS)
+    for label, hist in hists.items():
+        centers, values, errors = hist.spectrum(channel, normalization=normalization)
+        ax.errorbar(centers, values, yerr=errors, linewidth=1.5, alpha=0.9, label=f"{label} ({hist.n_fills} runs)")
+    first = next(iter(hists.values()))
+    ax.set_yscale("log")
+    ax.set_xlim((min(0, first.bin_edges[0]), first.bin_edges[-1]))
+    ax.set_xlabel("$m_{inv}$ (GeV/$c^2$)" if first.col_bin_axis == "m_inv" else first.col_bin_axis)
+    per_event = " (per event)" if normalization == "total" else ""
+    ax.set_ylabel((r'$\frac{dN}{d m_{inv}}$' if first.col_bin_axis == "m_inv" else f"dN/d({first.col_bin_axis})") + per_event)
+    if title is None:
+        title = "all dileptons" if channel is None else qol.get_pdg_names([channel]).get(channel, str(channel))
+    ax.set_title(title)
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+
+## Function to plot the normalised spectra of a histogramming.DileptonHistogram (all dileptons and decay channels) with error bars
+def plot_hist_accumulated(hist, save_figure=False, file_name=None, title=None, normalization="per_run"):
+    fig, ax = plt.subplots(figsize=(8,5))
+    draw_hist_accumulated(ax, hist, title=title, normalization=normalization)
+    fig.tight_layout()
+
+    # Save or show the figure
+    if save_figure:
+        if file_name is None:
+            file_name = f"Hist_InvMass_accumulated_{hist.n_events}.png"
+        save_path = qol.get_save_path(FIGURE_DIR, file_name)
+        fig.savefig(save_path, bbox_inches='tight')
+        plt.close(fig)
+        print(f"Figure saved as {file_name} to {save_path}")
+    else:
+        plt.show()
+
+# Function to draw the histogram of a given distribution for a specific PDG ID onto given axes
+def draw_histogram(ax, df, pdg_id, column_name, density=False, bins=50):
+    # Filter the DataFrame for the specified PDG ID
+    filtered_data = df[df[9] == pdg_id]  # Assuming PDG ID is in column 9
+    data_to_plot = filtered_data[column_name]
+
+    ax.hist(data_to_plot, density=density, bins=bins, alpha=0.7, color='blue', edgecolor='black')
+    ax.set_title(f'Histogram of {column_name} for PDG ID {pdg_id}')
+    ax.set_xlabel(column_name)
+    y_axis_label = r'$\frac{dN}{d%s}$' % column_name
+    ax.set_ylabel(y_axis_label)
+    ax.grid(True)
+
 # Function to plot histogram of a given distribution for a specific PDG ID
 def plot_histogram(df, pdg_id, column_name, save_figure=False, file_name=None, density=False, bins=50):
     '''
@@ -115,18 +246,9 @@ def plot_histogram(df, pdg_id, column_name, save_figure=False, file_name=None, d
     Output:
         Displays a histogram of the specified distribution for the given PDG ID and saves it if requested.
     '''
-    # Filter the DataFrame for the specified PDG ID
-    filtered_data = df[df[9] == pdg_id]  # Assuming PDG ID is in column 9
-    data_to_plot = filtered_data[column_name]
-
     # Plot the histogram
-    plt.figure(figsize=(10, 6))
-    plt.hist(data_to_plot, density=density, bins=bins, alpha=0.7, color='blue', edgecolor='black')
-    plt.title(f'Histogram of {column_name} for PDG ID {pdg_id}')
-    plt.xlabel(column_name)
-    y_axis_label = r'$\frac{dN}{d%s}$' % column_name
-    plt.ylabel(y_axis_label)
-    plt.grid(True)
+    fig, ax = plt.subplots(figsize=(10, 6))
+    draw_histogram(ax, df, pdg_id, column_name, density=density, bins=bins)
     # Save the figure
     if save_figure:
         if file_name is None:
@@ -139,7 +261,8 @@ def plot_histogram(df, pdg_id, column_name, save_figure=False, file_name=None, d
         plt.show()
 
 # Function to plot KDE of a given distribution for a specific PDG ID
-def plot_distribution(df, pdg_id, column_name, save_figure=False, file_name=None, bins=50):
+def plot_distribution(df, pdg_id, column_name, save_figure=False, file_name=None, bins=50,
+                      weight_column=None, kde_engine="auto", bandwidth="scott"):
     '''
     Input:
         "df" is the DataFrame containing the data
@@ -148,6 +271,10 @@ def plot_distribution(df, pdg_id, column_name, save_figure=False, file_name=None
         "save_figure" is a boolean indicating whether to save the figure (default is False)
         "file_name" is the name of the file to save the figure as (if save_figure is True)
         "bins" is the number of bins for the histogram (default is 50)
+        "weight_column" is the column with the weights of histogram and KDE, e.g. 'block_weight_adj' (default is None, unweighted)
+        "kde_engine" is "binned" (grid + FFT, see density_estimation.binned_kde), "exact" (scipy.stats.gaussian_kde)
+            or "auto" (default: exact up to KDE_EXACT_MAX_SAMPLES samples, binned above)
+        "bandwidth" is the bandwidth rule "scott" or "silverman" or a factor of the standard deviation (default is "scott")
     Output:
         Displays a histogram of the specified distribution for the given PDG ID and saves it if requested.
     '''
@@ -157,11 +284,12 @@ def plot_distribution(df, pdg_id, column_name, save_figure=False, file_name=None
     # Filter the DataFrame for the specified PDG ID
     filtered_data = df[df[9] == pdg_id]  # Assuming PDG ID is in column 9
     data_to_plot = filtered_data[column_name]
+    weights = filtered_data[weight_column] if weight_column is not None else None
 
     fig, ax1 = plt.subplots(figsize=(10, 6))
     # Plot settings for histogram (left y-axis)
     color_hist = 'steelblue'
-    counts, bins, patches = ax1.hist(data_to_plot, bins=bins, alpha=0.6, color=color_hist, label='Histogram')
+    counts, bins, patches = ax1.hist(data_to_plot, bins=bins, weights=weights, alpha=0.6, color=color_hist, label='Histogram')
     ax1.set_xlabel(column_name)
     ax1.set_ylabel('Counts', color=color_hist)
     ax1.tick_params(axis='y', labelcolor=color_hist)
@@ -169,9 +297,16 @@ def plot_distribution(df, pdg_id, column_name, save_figure=False, file_name=None
     # Create a second y-axis for the KDE (right y-axis)
     ax2 = ax1.twinx()
     # Kernel Density Estimation using Gaussian kernels
-    kde = gaussian_kde(data_to_plot)
     x_vals = np.linspace(data_to_plot.min(), data_to_plot.max(), 500)
-    kde_vals = kde(x_vals)
+    if kde_engine == "auto":
+        kde_engine = "exact" if len(data_to_plot) <= KDE_EXACT_MAX_SAMPLES else "binned"
+    if kde_engine == "exact":
+        kde = gaussian_kde(data_to_plot, bw_method=bandwidth, weights=weights)
+        kde_vals = kde(x_vals)
+    elif kde_engine == "binned":
+        _, kde_vals = binned_kde(data_to_plot, weights=weights, bandwidth=bandwidth, x=x_vals)
+    else:
+        raise ValueError(f"Unknown KDE engine: {kde_engine!r} (expected 'auto', 'exact' or 'binned')")
 
     color_kde = 'darkorange'
     ax2.plot(x_vals, kde_vals, color=color_kde, label='KDE')
@@ -0,0 +1,188 @@
+# -----------------------------
+# IMPORTS
+# -----------------------------
+## Standard libraries
+import os
+import csv
+import json
+import time
+import resource
+from pathlib import Path
+from typing import Iterable, Iterator
+## Third-party libraries
+## Custom libraries
+
+# -----------------------------
+# CONSTANTS AND SETTINGS
+# -----------------------------
+## Profiling is switched on with SMASH_PROFILE=1 (read once at import; worker processes inherit the environment)
+PROFILE_ENABLED = os.environ.get("SMASH_PROFILE", "0").strip().lower() in ("1", "true", "yes", "on")
+## Directory for the per-process spool files and the final per-job report
+PROFILE_DIR = Path(os.environ.get("SMASH_PROFILE_DIR", "profiles"))
+## Columns of one stage record (CSV column order)
+REPORT_FIELDS = ["job_id", "pid", "stage", "label", "start", "wall_s", "cpu_s", "rows_in", "rows_out", "bytes_read",
+                 "rss_before_mb", "rss_delta_mb", "max_rss_mb", "failed"]
+
+# -----------------------------
+# CLASSES AND FUNCTIONS
+# -----------------------------
+## Helper function to build the job id: SLURM job (and array task) id, otherwise the pid of the main process
+def _default_job_id() -> str:
+    job_id = os.environ.get("SLURM_JOB_ID")
+    if job_id is None:
+        return f"local_{os.getpid()}"
+    task_id = os.environ.get("SLURM_ARRAY_TASK_ID")
+    return f"{job_id}_{task_id}" if task_id is not None else job_id
+
+# Shared by all processes of a job: the main process sets it, worker processes inherit it
+JOB_ID = os.environ.setdefault("SMASH_PROFILE_JOB", _default_job_id()) if PROFILE_ENABLED else None
+
+## Helper function to get the current resident set size in bytes (Linux: /proc, otherwise the peak RSS)
+def current_rss() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return max_rss()
+
+## Helper function to get the peak resident set size of this process in bytes
+def max_rss() -> int:
+    # ru_maxrss is given in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+## Helper function to append one record to the spool file of this process
+def _spool(record: dict) -> None:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(PROFILE_DIR / f"{JOB_ID}.{os.getpid()}.jsonl", "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+## Class to measure one pipeline stage (context manager)
+class Stage:
+    '''
+    Measures wall time, CPU time (of this process) and the change of the resident set size of the enclosed code.
+    rows_in and bytes_read are given when entering, rows_out can be set inside the with block. The record is written
+    to the spool file of the process right away, so stages finished before a job is killed (e.g. OOM) are kept.
+    '''
+    def __init__(self, name: str, label: str | None = None, rows_in: int | None = None, bytes_read: int | None = None):
+        self.name = name
+        self.label = label
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.bytes_read = bytes_read
+
+    def __enter__(self) -> "Stage":
+        self._start = time.time()
+        self._rss = current_rss()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        mb = 1024**2
+        _spool({
+            "job_id": JOB_ID, "pid": os.getpid(), "stage": self.name, "label": self.label, "start": self._start,
+            "wall_s": wall, "cpu_s": cpu, "rows_in": self.rows_in, "rows_out": self.rows_out,
+            "bytes_read": self.bytes_read, "rss_before_mb": self._rss / mb,
+            "rss_delta_mb": (current_rss() - self._rss) / mb, "max_rss_mb": max_rss() / mb,
+            "failed": exc_type is not None,
+        })
+        return False
+
+## Class standing in for Stage when profiling is off (no measurements, attributes are ignored)
+class _NullStage:
+    def __enter__(self) -> "_NullStage":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+    def __setattr__(self, name, value) -> None:
+        pass
+
+_NULL_STAGE = _NullStage()
+
+## Function to measure a pipeline stage: with stage("parse", label=path, bytes_read=size) as st: ...; st.rows_out = len(df)
+def stage(name: str, label: str | None = None, rows_in: int | None = None, bytes_read: int | None = None):
+    if not PROFILE_ENABLED:
+        return _NULL_STAGE
+    return Stage(name, label=label, rows_in=rows_in, bytes_read=bytes_read)
+
+## Generator measuring every step of an iterator (e.g. parsing the chunks of iter_smash_dilepton_chunks) as stage
+def _profiled_iter(name: str, iterable: Iterable, label: str | None) -> Iterator:
+    iterator = iter(iterable)
+    while True:
+        with Stage(name, label=label) as st:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                st.rows_out = 0
+                return
+            st.rows_out = len(item) if hasattr(item, "__len__") else None
+        yield item
+
+## Function to profile every step of an iterable (returns the iterable itself when profiling is off)
+def profile_iter(name: str, iterable: Iterable, label: str | None = None) -> Iterable:
+    if not PROFILE_ENABLED:
+        return iterable
+    return _profiled_iter(name, iterable, label)
+
+## Function to collect the spool files of this job into one JSON and one CSV report
+def write_report(report_dir: str | Path | None = None) -> Path | None:
+    '''
+    Merges the stage records of all processes of this job (sorted by start time) and writes <job_id>.json
+    (records plus totals per stage) and <job_id>.csv (records) to report_dir (default: PROFILE_DIR).
+    The spool files are removed afterwards. Returns the path of the JSON report (None if profiling is off).
+    '''
+    if not PROFILE_ENABLED:
+        return None
+    spool_files = sorted(PROFILE_DIR.glob(f"{JOB_ID}.*.jsonl"))
+    records = []
+    for spool_file in spool_files:
+        with open(spool_file) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    records.sort(key=lambda record: record["start"])
+
+    totals: dict[str, dict] = {}
+    for record in records:
+        total = totals.setdefault(record["stage"], {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "rows_in": 0,
+                                                    "rows_out": 0, "bytes_read": 0, "max_rss_mb": 0.0})
+        total["calls"] += 1
+        for key in ("wall_s", "cpu_s", "rows_in", "rows_out", "bytes_read"):
+            total[key] += record[key] or 0
+        total["max_rss_mb"] = max(total["max_rss_mb"], record["max_rss_mb"])
+
+    report_dir = Path(report_dir) if report_dir is not None else PROFILE_DIR
+    report_dir.mkdir(parents=True, exist_ok=True)
+    json_path = report_dir / f"{JOB_ID}.json"
+    with open(json_path, "w") as f:
+        json.dump({"job_id": JOB_ID, "stages": records, "totals": totals}, f, indent=2)
+    with open(report_dir / f"{JOB_ID}.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+    for spool_file in spool_files:
+        spool_file.unlink()
+    return json_path
+
+## Function to print the totals per stage of a report written by write_report
+def print_report(json_path: str | Path) -> None:
+    with open(json_path) as f:
+        report = json.load(f)
+    print(f"{'stage':<20} {'calls':>6} {'wall [s]':>9} {'cpu [s]':>9} {'rows in':>12} {'rows out':>12} "
+          f"{'MB read':>9} {'max RSS [MB]':>13}")
+    for name, total in report["totals"].items():
+        print(f"{name:<20} {total['calls']:>6} {total['wall_s']:>9.3f} {total['cpu_s']:>9.3f} {total['rows_in']:>12,} "
+              f"{total['rows_out']:>12,} {total['bytes_read'] / 1024**2:>9.1f} {total['max_rss_mb']:>13.1f}")
+
+# -----------------------------
+# MAIN SCRIPT
+# -----------------------------
+if __name__ == "__main__":
+    import sys
+    # Print the totals of one or more reports, e.g. python profiling.py profiles/123456_7.json
+    for report_path in sys.argv[1:]:
+        print(report_path)
+        print_report(report_path)
+# End of script
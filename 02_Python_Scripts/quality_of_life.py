@@ -2,11 +2,24 @@
 # IMPORTS
 # -----------------------------
 ## Standard libraries
+import os
+import json
 from pathlib import Path
 import pandas as pd
 ## Third-party libraries
-import pdg
 ## Custom libraries
+import compressed_io
+
+# -----------------------------
+# CONSTANTS AND SETTINGS
+# -----------------------------
+## Local directory for cached data (override via environment variable SMASH_CACHE_DIR, e.g. node-local scratch on the cluster)
+CACHE_DIR = Path(os.environ.get("SMASH_CACHE_DIR", Path.home() / ".cache" / "bachelor-thesis-physics"))
+## Persisted lookup table PDG ID -> PDG particle description, built once from the (offline) pdg package database
+PDG_NAME_TABLE_FILE = Path(os.environ.get("SMASH_PDG_NAME_FILE", CACHE_DIR / "pdg_names.json"))
+UNKNOWN_PARTICLE_NAME = "Unknown particle"
+# Process-wide lookup table, loaded on first use
+_PDG_NAME_TABLE: dict[int, str] | None = None
 
 # -----------------------------
 # CLASSES AND FUNCTIONS
@@ -16,10 +29,11 @@ import pdg
 def get_path_to_output_file(file_name, root_path, folder_name="")-> Path:
     # Define file information (paths, names)
     full_path_to_file = Path(root_path) / folder_name / file_name  # full path to the file
-    # Check file exists before attempting to read
-    if not full_path_to_file.exists():
+    # Check file exists before attempting to read, otherwise fall back to a compressed variant (.gz/.zst/.xz)
+    existing_file = compressed_io.find_existing_variant(full_path_to_file)
+    if existing_file is None:
         raise FileNotFoundError(f"File not found: {full_path_to_file}")
-    return full_path_to_file
+    return existing_file
 
 ## Function to get the save path for figures
 def get_save_path(directory: str | Path, filename: str) -> Path:
@@ -31,20 +45,64 @@ def get_save_path(directory: str | Path, filename: str) -> Path:
     directory.mkdir(parents=True, exist_ok=True)
     return directory / filename
 
-## Function to get PDG name from PDG ID
-def get_pdg_name(pdg_id, long_name = False)-> str:
-    # Connect to PDG API
+## Function to build the lookup table PDG ID -> particle description from the pdg package (bundled SQLite database, no network needed)
+def build_pdg_name_table() -> dict[int, str]:
+    # Import necessary library (only needed once to build the table)
+    import pdg
+
     api = pdg.connect()
+    table: dict[int, str] = {}
+    for particle_list in api.get_particles():
+        for particle in particle_list:
+            if particle.mcid is not None:
+                table.setdefault(int(particle.mcid), str(particle))
+    return table
 
-    particle = api.get_particle_by_mcid(int(pdg_id))
-    if particle is not None:
+## Function to get the process-wide PDG name lookup table (loaded from PDG_NAME_TABLE_FILE or built and persisted on first use)
+def get_pdg_name_table() -> dict[int, str]:
+    global _PDG_NAME_TABLE
+    if _PDG_NAME_TABLE is None:
+        try:
+            with open(PDG_NAME_TABLE_FILE, "r", encoding="utf-8") as f:
+                _PDG_NAME_TABLE = {int(k): v for k, v in json.load(f).items()}
+        except (OSError, ValueError):
+            _PDG_NAME_TABLE = build_pdg_name_table()
+            try:
+                PDG_NAME_TABLE_FILE.parent.mkdir(parents=True, exist_ok=True)
+                tmp_file = PDG_NAME_TABLE_FILE.with_name(f"{PDG_NAME_TABLE_FILE.name}.{os.getpid()}.tmp")
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    json.dump(_PDG_NAME_TABLE, f)
+                os.replace(tmp_file, PDG_NAME_TABLE_FILE)
+            except OSError as e:
+                print(f"WARNING: Could not persist PDG name table to {PDG_NAME_TABLE_FILE} ({e})")
+    return _PDG_NAME_TABLE
+
+## Function to get PDG name from PDG ID
+def get_pdg_name(pdg_id, long_name = False)-> str:
+    description = get_pdg_name_table().get(int(pdg_id))
+    if description is not None:
         if long_name:
-            return str(particle)
+            return description
         else:
         # Keep only the part after the colon (particle short name).
-            return str(particle).split(":", 1)[-1].strip()
+            return description.split(":", 1)[-1].strip()
     else:
-        return "Unknown particle"
+        return UNKNOWN_PARTICLE_NAME
+
+## Function to get PDG names for many PDG IDs; every unique ID is resolved only once
+def get_pdg_names(pdg_ids, long_name = False)-> dict[int, str]:
+    return {int(pdg_id): get_pdg_name(pdg_id, long_name=long_name) for pdg_id in pd.unique(pd.Series(pdg_ids))}
+
+## Function to map a column of PDG IDs to PDG names (vectorized over the unique IDs)
+def map_pdg_names(pdg_ids: pd.Series, long_name = False)-> pd.Series:
+    return pdg_ids.map(get_pdg_names(pdg_ids, long_name=long_name))
+
+## Function to get the default number of worker processes (CPUs granted by SLURM, otherwise all CPUs of the machine)
+def get_default_workers() -> int:
+    slurm_cpus = os.environ.get("SLURM_CPUS_PER_TASK")
+    if slurm_cpus:
+        return max(int(slurm_cpus), 1)
+    return os.cpu_count() or 1
 
 ## Function to apply data types to DataFrame columns
 def apply_data_types(df: pd.DataFrame, data_typ_def: dict[str, str]) -> pd.DataFrame:
@@ -0,0 +1,260 @@
+# -----------------------------
+# IMPORTS
+# -----------------------------
+## Standard libraries
+import os
+import json
+import shutil
+import zipfile
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Callable
+import pandas as pd
+import numpy as np
+## Third-party libraries
+## Custom libraries
+import quality_of_life as qol
+
+# -----------------------------
+# CONSTANTS AND SETTINGS
+# -----------------------------
+## Cache directory for the DataFrames (below qol.CACHE_DIR, which honours SMASH_CACHE_DIR)
+CACHE_DIR = qol.CACHE_DIR / "frames"
+## Maximum total size of the cache directory in bytes before the least recently used entries are evicted
+CACHE_MAX_BYTES = int(os.environ.get("SMASH_CACHE_MAX_BYTES", 20 * 1024**3))
+CACHE_SUFFIX = ".npz"
+# Name of the array holding column names and dtypes inside a cache file (and of the optional attributes)
+_META_KEY = "__columns__"
+_ATTRS_KEY = "__attrs__"
+
+# -----------------------------
+# CLASSES AND FUNCTIONS
+# -----------------------------
+## Function to build the cache key of a source file (path, size, mtime) for a given kind of frame and version tag
+def cache_key(source_path: str | Path, kind: str, version: str) -> str:
+    source_path = Path(source_path).resolve()
+    stat = source_path.stat()
+    raw = f"{source_path}|{stat.st_size}|{stat.st_mtime_ns}|{kind}|{version}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+## Function to write a DataFrame column by column to an .npz file (uncompressed unless compressed is True)
+def save_frame(df: pd.DataFrame, file_path: str | Path, compressed: bool = False, attrs: dict | None = None) -> None:
+    '''
+    Stores each column of df as its own numpy array. String-like columns (object/"string") are stored as fixed-width
+    unicode arrays and categorical columns as their integer codes plus a unicode array of the categories, so loading
+    never needs pickle. The column order and pandas dtypes are kept in a small JSON header.
+    The file is written to a temporary name first and then moved into place, so parallel workers never see partial files.
+    attrs (JSON serialisable) are stored next to the columns and can be read without the columns (load_attrs).
+    '''
+    file_path = Path(file_path)
+    arrays = {}
+    columns = []
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        dtype = str(series.dtype)
+        if dtype in ("object", "string"):
+            values = series.astype(str).to_numpy(dtype=str)
+        elif dtype == "category":
+            values = series.cat.codes.to_numpy()
+            arrays[f"c{i}_categories"] = np.asarray(series.cat.categories, dtype=str)
+        else:
+            values = series.to_numpy()
+        arrays[f"c{i}"] = values
+        columns.append([str(col), dtype])
+    arrays[_META_KEY] = np.array(json.dumps(columns))
+    if attrs is not None:
+        arrays[_ATTRS_KEY] = np.array(json.dumps(attrs))
+    tmp_path = file_path.with_name(f"{file_path.stem}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        (np.savez_compressed if compressed else np.savez)(f, **arrays)
+    os.replace(tmp_path, file_path)
+
+## Function to read a DataFrame written by save_frame
+def load_frame(file_path: str | Path) -> pd.DataFrame:
+    with np.load(file_path, allow_pickle=False) as data:
+        columns = json.loads(str(data[_META_KEY]))
+        frame = {}
+        for i, (col, dtype) in enumerate(columns):
+            values = data[f"c{i}"]
+            if dtype in ("object", "string"):
+                frame[col] = pd.Series(values, dtype=dtype)
+            elif dtype == "category":
+                frame[col] = pd.Categorical.from_codes(values, categories=data[f"c{i}_categories"].tolist())
+            else:
+                frame[col] = values
+    return pd.DataFrame(frame)
+
+## Function to read the attributes stored with save_frame (empty dict if none were given)
+def load_attrs(file_path: str | Path) -> dict:
+    with np.load(file_path, allow_pickle=False) as data:
+        return json.loads(str(data[_ATTRS_KEY])) if _ATTRS_KEY in data.files else {}
+
+## Class to write a DataFrame in the format of save_frame chunk by chunk, without holding all rows in memory
+class FrameWriter:
+    '''
+    Every appended chunk is written to one raw temporary file per column next to file_path; finish packs these
+    files into the .npz file (streamed in blocks, compressed if compressed is True) and moves it into place.
+    All chunks must have the same columns and dtypes (categorical columns: the same categories); string-like
+    columns are not supported (their fixed-width arrays need the longest value of all chunks, use save_frame).
+    Used as context manager, the temporary files are removed in any case and nothing is written on an error.
+    '''
+    def __init__(self, file_path: str | Path, compressed: bool = False):
+        self.file_path = Path(file_path)
+        self.compressed = compressed
+        self.columns: list[list[str]] | None = None
+        self.categories: dict[int, np.ndarray] = {}
+        self.dtypes: list[np.dtype] = []
+        self.n_rows = 0
+        self._tmp_paths: list[Path] = []
+        self._files = []
+
+    def __enter__(self) -> "FrameWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._cleanup()
+
+    ## Append the rows of a chunk
+    def append(self, df: pd.DataFrame) -> None:
+        columns = [[str(col), str(df[col].dtype)] for col in df.columns]
+        if self.columns is None:
+            for i, (col, dtype) in enumerate(columns):
+                if dtype in ("object", "string"):
+                    raise ValueError(f"Column {col} has dtype {dtype}: string columns are not supported, use save_frame")
+                if dtype == "category":
+                    self.categories[i] = np.asarray(df[col].cat.categories, dtype=str)
+                self.dtypes.append(np.dtype(df[col].cat.codes.dtype if dtype == "category" else df[col].dtype))
+                tmp_path = self.file_path.with_name(f"{self.file_path.stem}.{os.getpid()}.c{i}.tmp")
+                self._tmp_paths.append(tmp_path)
+                self._files.append(open(tmp_path, "wb"))
+            self.columns = columns
+        elif columns != self.columns:
+            raise ValueError(f"Columns of the chunk {columns} differ from the first chunk {self.columns}")
+        for i, (col, dtype) in enumerate(columns):
+            series = df[col]
+            if dtype == "category":
+                if not np.array_equal(np.asarray(series.cat.categories, dtype=str), self.categories[i]):
+                    raise ValueError(f"Categories of column {col} differ from the first chunk")
+                values = series.cat.codes.to_numpy()
+            else:
+                values = series.to_numpy()
+            self._files[i].write(np.ascontiguousarray(values, dtype=self.dtypes[i]).tobytes())
+        self.n_rows += len(df)
+
+    ## Pack the columns into file_path (attrs as for save_frame)
+    def finish(self, attrs: dict | None = None) -> Path:
+        if self.columns is None:
+            raise ValueError(f"No chunk was appended to {self.file_path}")
+        for f in self._files:
+            f.close()
+        tmp_path = self.file_path.with_name(f"{self.file_path.stem}.{os.getpid()}.tmp")
+        self._tmp_paths.append(tmp_path)
+        compression = zipfile.ZIP_DEFLATED if self.compressed else zipfile.ZIP_STORED
+        with zipfile.ZipFile(tmp_path, "w", compression=compression, allowZip64=True) as archive:
+            for i, (dtype, column_path) in enumerate(zip(self.dtypes, self._tmp_paths)):
+                with archive.open(f"c{i}.npy", "w", force_zip64=True) as member, open(column_path, "rb") as column:
+                    header = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (self.n_rows,)}
+                    np.lib.format.write_array_header_2_0(member, header)
+                    shutil.copyfileobj(column, member, 16 * 1024**2)
+            small_arrays = {f"c{i}_categories": categories for i, categories in self.categories.items()}
+            small_arrays[_META_KEY] = np.array(json.dumps(self.columns))
+            if attrs is not None:
+                small_arrays[_ATTRS_KEY] = np.array(json.dumps(attrs))
+            for name, values in small_arrays.items():
+                with archive.open(f"{name}.npy", "w", force_zip64=True) as member:
+                    np.lib.format.write_array(member, values, allow_pickle=False)
+        os.replace(tmp_path, self.file_path)
+        return self.file_path
+
+    ## Helper function to close and remove the temporary files
+    def _cleanup(self) -> None:
+        for f in self._files:
+            f.close()
+        for tmp_path in self._tmp_paths:
+            tmp_path.unlink(missing_ok=True)
+
+## Function to evict least recently used cache files until the cache fits into max_bytes
+def evict(cache_dir: str | Path = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES) -> int:
+    '''
+    Deletes the cache files with the oldest modification time (cache hits refresh it) until the total size of the
+    cache directory is at most max_bytes. Returns the number of deleted files.
+    '''
+    entries = []
+    for p in Path(cache_dir).glob(f"*{CACHE_SUFFIX}"):
+        try:
+            stat = p.stat()
+        except FileNotFoundError:
+            continue  # removed by another worker in the meantime
+        entries.append((stat.st_mtime, stat.st_size, p))
+    total = sum(size for _, size, _ in entries)
+    deleted = 0
+    for _, size, p in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            p.unlink()
+            deleted += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+    return deleted
+
+## Function to return a cached DataFrame for a source file or build (and store) it on a cache miss
+def load_or_build(source_path: str | Path, kind: str, version: str, build: Callable[[], pd.DataFrame],
+                  rebuild: bool = False, cache_dir: str | Path = CACHE_DIR) -> pd.DataFrame:
+    '''
+    Cache layer for frames derived from a single SMASH output file.
+
+    :param source_path: Path to the SMASH output file the frame is derived from (its size and mtime are part of the key)
+    :type source_path: str | Path
+    :param kind: Kind of the cached frame (e.g. "parsed", "enriched")
+    :type kind: str
+    :param version: Version tag of the code producing the frame; bump it whenever the produced frame changes
+    :type version: str
+    :param build: Function without arguments returning the DataFrame on a cache miss
+    :type build: Callable[[], pd.DataFrame]
+    :param (optional, default = False) rebuild: If True, the cached entry is ignored and rebuilt
+    :type rebuild: bool
+    :param (optional, default = CACHE_DIR) cache_dir: Directory holding the cache files
+    :type cache_dir: str | Path
+    :return: The cached or freshly built DataFrame
+    :rtype: DataFrame
+    '''
+    cache_dir = Path(cache_dir)
+    cache_file = cache_dir / f"{kind}_{cache_key(source_path, kind, version)}{CACHE_SUFFIX}"
+    if not rebuild and cache_file.exists():
+        try:
+            df = load_frame(cache_file)
+            os.utime(cache_file)  # mark as recently used for the eviction policy
+            return df
+        except (OSError, ValueError, KeyError) as e:
+            print(f"WARNING: Ignoring unreadable cache file {cache_file} ({e})")
+
+    df = build()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    save_frame(df, cache_file)
+    evict(cache_dir)
+    return df
+
+## Function to delete all cache files
+def clear(cache_dir: str | Path = CACHE_DIR) -> int:
+    return evict(cache_dir, max_bytes=-1)
+
+# -----------------------------
+# MAIN SCRIPT
+# -----------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the cache of parsed SMASH outputs.")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="cache directory (default: %(default)s)")
+    parser.add_argument("--clear", action="store_true", help="delete all cache files")
+    parser.add_argument("--max-bytes", type=int, default=None, help="evict least recently used files down to this size")
+    args = parser.parse_args()
+
+    if args.clear:
+        print(f"Deleted {clear(args.cache_dir)} cache files from {args.cache_dir}")
+    elif args.max_bytes is not None:
+        print(f"Evicted {evict(args.cache_dir, args.max_bytes)} cache files from {args.cache_dir}")
+    files = list(Path(args.cache_dir).glob(f"*{CACHE_SUFFIX}"))
+    print(f"{len(files)} cache files, {sum(p.stat().st_size for p in files) / 1024**2:.1f} MB in {args.cache_dir}")
+# End of script
@@ -0,0 +1,279 @@
+# -----------------------------
+# IMPORTS
+# -----------------------------
+## Standard libraries
+import os
+import time
+import sqlite3
+import hashlib
+import argparse
+from pathlib import Path
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+## Third-party libraries
+## Custom libraries
+import quality_of_life as qol
+import compressed_io
+import dilepton_shards
+
+# -----------------------------
+# CONSTANTS AND SETTINGS
+# -----------------------------
+# Catalog database (below qol.CACHE_DIR, which honours SMASH_CACHE_DIR)
+CATALOG_PATH = qol.CACHE_DIR / "run_catalog.sqlite"
+# Version of the per-run summary (runs scanned with another version are scanned again)
+CATALOG_VERSION = 1
+# Files of a run folder whose content hashes are stored (SMASH copies its config into the output directory)
+CONFIG_FILE_NAME = "config.yaml"
+DECAY_FILE_NAME = "decaymodes.txt"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    dataset TEXT NOT NULL,
+    run_name TEXT NOT NULL,
+    run_id INTEGER,
+    task_id INTEGER,
+    file_name TEXT NOT NULL,
+    file_size INTEGER,
+    file_mtime_ns INTEGER,
+    source TEXT,
+    n_events INTEGER,
+    n_empty_events INTEGER,
+    n_blocks INTEGER,
+    n_rows INTEGER,
+    n_leptons INTEGER,
+    n_dileptons INTEGER,
+    weight_sum REAL,
+    config_hash TEXT,
+    decay_hash TEXT,
+    catalog_version INTEGER,
+    scanned TEXT,
+    PRIMARY KEY (dataset, run_name, file_name)
+);
+CREATE TABLE IF NOT EXISTS run_weights (
+    dataset TEXT NOT NULL,
+    run_name TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key INTEGER NOT NULL,
+    weight_sum REAL,
+    PRIMARY KEY (dataset, run_name, file_name, kind, key)
+);
+CREATE INDEX IF NOT EXISTS runs_by_run_id ON runs (dataset, run_id);
+"""
+
+# -----------------------------
+# CLASSES AND FUNCTIONS
+# -----------------------------
+## Helper function to hash a (small) file of a run folder (None if the file does not exist)
+def _file_hash(path: Path) -> str | None:
+    if not path.exists():
+        return None
+    return hashlib.sha1(path.read_bytes()).hexdigest()
+
+## Helper function to parse run folder names run_<run_id>_<suffix> (None for other names)
+def _parse_run_name(name: str) -> tuple[int | None, int | None]:
+    parts = name.split("_")
+    try:
+        return int(parts[1]), int(parts[2])
+    except (IndexError, ValueError):
+        return None, None
+
+## Worker function summarising one run: from the shard metadata where it is complete, otherwise by a projected scan
+def _summarize_run(run_file: Path) -> tuple[dict | None, str | None]:
+    try:
+        shard = dilepton_shards.shard_path_for(run_file)
+        summary = None
+        if shard.exists():
+            meta = dilepton_shards.read_shard_metadata(shard)
+            if run_file.exists():
+                # The shard metadata is used only if the shard was written from the current text file
+                if "weight_sum_per_parent" in meta and dilepton_shards.is_current(shard, run_file):
+                    summary, source = meta, "shard"
+            elif "weight_sum_per_parent" in meta:
+                summary, source = meta, "shard"
+            else:
+                # Shard written before the parent/empty-event summary and no text file left: summarise the shard
+                summary, source = dilepton_shards.summarize_dilepton_shard(shard), "shard"
+        if summary is None:
+            summary, source = dilepton_shards.summarize_dilepton_file(run_file), "scan"
+    except Exception as e:
+        return None, f"skip failed: {run_file} ({type(e).__name__}: {e})"
+    summary["source"] = source
+    return summary, None
+
+## Class of the SQLite catalog of the runs of several datasets (one row per run folder and output file)
+class RunCatalog:
+    '''
+    Per run: run and array task id, size/mtime of the output file, numbers of events, empty events, blocks, rows,
+    leptons and dileptons, the sum of the block weights (total, per process type and per pseudo-parent PDG ID of
+    the dileptons, table run_weights) and the hashes of config.yaml and decaymodes.txt of the run folder.
+    update scans only runs that are new or whose output file changed; the summary comes from the shard metadata
+    (dilepton_shards.py) where possible, otherwise from a scan parsing only the metadata columns.
+    Runs are selected with SQL conditions on the runs table, e.g. "n_events >= 10000 AND config_hash = ?".
+    '''
+    def __init__(self, path: str | Path = CATALOG_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "RunCatalog":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    ## Bring the entries of the datasets up to date with their run folders
+    def update(self, root_dir: str | Path, data_dirs: list[str] | None = None, filename: str = "Dileptons.oscar",
+               parallel: bool = False, n_workers: int | None = None) -> dict:
+        '''
+        :param root_dir: Root path containing the data directories (e.g. smash_outputs/)
+        :type root_dir: str | Path
+        :param (optional, default = None) data_dirs: Names of the datasets below root_dir (None: all directories
+         containing run_* folders)
+        :type data_dirs: list[str] | None
+        :param (optional, default = "Dileptons.oscar") filename: Output file of every run (or its compressed variant)
+        :type filename: str
+        :param (optional, default = False) parallel: If True, the runs to scan are processed in a process pool
+        :type parallel: bool
+        :param (optional, default = None) n_workers: Number of worker processes (see qol.get_default_workers)
+        :type n_workers: int | None
+        :return: Numbers of scanned, unchanged, removed and failed runs
+        :rtype: dict
+        '''
+        root_dir = Path(root_dir)
+        if data_dirs is None:
+            data_dirs = sorted(p.name for p in root_dir.iterdir() if p.is_dir() and any(p.glob("run_*")))
+        counts = {"scanned": 0, "unchanged": 0, "removed": 0, "failed": 0}
+        todo = []
+        # Datasets are stored by their directory name relative to root_dir (without trailing slash)
+        for data_dir in map(str, map(Path, data_dirs)):
+            stored = {row[0]: row[1:] for row in self.connection.execute(
+                "SELECT run_name, file_size, file_mtime_ns, catalog_version, config_hash, decay_hash FROM runs "
+                "WHERE dataset = ? AND file_name = ?", (data_dir, filename))}
+            present = set()
+            for run_dir in sorted(p for p in (root_dir / data_dir).glob("run_*") if p.is_dir()):
+                run_file = compressed_io.find_existing_variant(run_dir / filename)
+                shard = dilepton_shards.shard_path_for(run_dir / filename)
+                if run_file is None and not shard.exists():
+                    continue
+                present.add(run_dir.name)
+                stat = (run_file or shard).stat()
+                hashes = (_file_hash(run_dir / CONFIG_FILE_NAME), _file_hash(run_dir / DECAY_FILE_NAME))
+                if stored.get(run_dir.name) == (stat.st_size, stat.st_mtime_ns, CATALOG_VERSION, *hashes):
+                    counts["unchanged"] += 1
+                    continue
+                todo.append((data_dir, run_dir, run_file or run_dir / filename, stat, hashes))
+            for run_name in set(stored) - present:
+                self._delete(data_dir, run_name, filename)
+                counts["removed"] += 1
+
+        run_files = [run_file for _, _, run_file, _, _ in todo]
+        if parallel and len(run_files) > 1:
+            with ProcessPoolExecutor(max_workers=min(n_workers or qol.get_default_workers(), len(run_files))) as pool:
+                results = list(pool.map(_summarize_run, run_files))
+        else:
+            results = list(map(_summarize_run, run_files))
+        for (data_dir, run_dir, run_file, stat, hashes), (summary, message) in zip(todo, results):
+            if message is not None:
+                print(message)
+                self._delete(data_dir, run_dir.name, filename)
+                counts["failed"] += 1
+                continue
+            self._insert(data_dir, run_dir.name, filename, stat, hashes, summary)
+            counts["scanned"] += 1
+        self.connection.commit()
+        return counts
+
+    ## Remove the entries of one run
+    def _delete(self, dataset: str, run_name: str, filename: str) -> None:
+        for table in ("runs", "run_weights"):
+            self.connection.execute(f"DELETE FROM {table} WHERE dataset = ? AND run_name = ? AND file_name = ?",
+                                    (dataset, run_name, filename))
+
+    ## Store the summary of one run (replacing an older entry)
+    def _insert(self, dataset: str, run_name: str, filename: str, stat: os.stat_result, hashes: tuple, summary: dict) -> None:
+        self._delete(dataset, run_name, filename)
+        run_id, task_id = _parse_run_name(run_name)
+        self.connection.execute(
+            "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (dataset, run_name, run_id, task_id, filename, stat.st_size, stat.st_mtime_ns, summary["source"],
+             summary["n_events"], summary["n_empty_events"], summary["n_blocks"], summary["n_rows"], summary["n_leptons"],
+             summary["n_dileptons"], summary["weight_sum"], *hashes, CATALOG_VERSION, time.strftime("%Y-%m-%d %H:%M:%S")))
+        weights = [(dataset, run_name, filename, "block_type", int(key), value)
+                   for key, value in summary["weight_sum_per_type"].items()]
+        weights += [(dataset, run_name, filename, "parent_pdg", int(key), value)
+                    for key, value in summary["weight_sum_per_parent"].items()]
+        self.connection.executemany("INSERT INTO run_weights VALUES (?, ?, ?, ?, ?, ?)", weights)
+
+    ## Select runs (rows of the runs table) of one or all datasets by an SQL condition
+    def select_runs(self, dataset: str | None = None, where: str | None = None, params: tuple = (),
+                    filename: str = "Dileptons.oscar") -> pd.DataFrame:
+        '''
+        :param (optional, default = None) dataset: Name of the dataset (None: all datasets)
+        :type dataset: str | None
+        :param (optional, default = None) where: SQL condition on the columns of the runs table, e.g.
+         "n_events >= ? AND n_empty_events < 0.5 * n_events" (None: all runs)
+        :type where: str | None
+        :param (optional, default = ()) params: Values of the ? placeholders in where
+        :type params: tuple
+        :return: Selected runs ordered by dataset, run_id and task_id
+        :rtype: pd.DataFrame
+        '''
+        conditions, values = ["file_name = ?"], [filename]
+        if dataset is not None:
+            conditions.append("dataset = ?")
+            values.append(str(Path(dataset)))
+        if where:
+            conditions.append(f"({where})")
+            values.extend(params)
+        query = f"SELECT * FROM runs WHERE {' AND '.join(conditions)} ORDER BY dataset, run_id, task_id, run_name"
+        return pd.read_sql_query(query, self.connection, params=values)
+
+    ## Sums of the selected runs (numbers of runs, events, dileptons and weights) for the normalisation
+    def totals(self, dataset: str | None = None, where: str | None = None, params: tuple = (),
+               filename: str = "Dileptons.oscar") -> dict:
+        runs = self.select_runs(dataset, where, params, filename)
+        totals = {"n_runs": len(runs)}
+        for col in ("n_events", "n_empty_events", "n_blocks", "n_dileptons", "weight_sum"):
+            totals[col] = runs[col].sum().item() if len(runs) else 0
+        return totals
+
+    ## Weight sums of the selected runs per process type ("block_type") or per pseudo-parent PDG ID ("parent_pdg")
+    def weight_sums(self, kind: str = "parent_pdg", dataset: str | None = None, where: str | None = None,
+                    params: tuple = (), filename: str = "Dileptons.oscar") -> pd.Series:
+        runs = self.select_runs(dataset, where, params, filename)[["dataset", "run_name"]]
+        weights = pd.read_sql_query("SELECT dataset, run_name, key, weight_sum FROM run_weights WHERE kind = ? AND file_name = ?",
+                                    self.connection, params=(kind, filename))
+        return weights.merge(runs, on=["dataset", "run_name"]).groupby("key")["weight_sum"].sum()
+
+# -----------------------------
+# MAIN SCRIPT
+# -----------------------------
+# Guard needed for the process pool (worker processes must not re-run the update)
+if __name__ == "__main__":
+    # Example: python run_catalog.py /lustre/hyihp/sostrows/smash_outputs --where "n_events >= 10000"
+    parser = argparse.ArgumentParser(description="Update and query the catalog of SMASH runs.")
+    parser.add_argument("root", help="directory containing the datasets")
+    parser.add_argument("data_dirs", nargs="*", help="datasets to update (default: all)")
+    parser.add_argument("--filename", default="Dileptons.oscar", help="output file of every run (default: %(default)s)")
+    parser.add_argument("--catalog", default=CATALOG_PATH, help="catalog database (default: %(default)s)")
+    parser.add_argument("--where", help="SQL condition to select runs, e.g. \"n_empty_events > 0.5 * n_events\"")
+    parser.add_argument("--workers", type=int, help="worker processes (default: SLURM_CPUS_PER_TASK or all CPUs)")
+    args = parser.parse_args()
+
+    with RunCatalog(args.catalog) as catalog:
+        start = time.perf_counter()
+        counts = catalog.update(args.root, args.data_dirs or None, filename=args.filename, parallel=True, n_workers=args.workers)
+        print(f"Catalog {catalog.path} updated in {time.perf_counter() - start:.1f} s: {counts}")
+        for dataset in args.data_dirs or [None]:
+            runs = catalog.select_runs(dataset, where=args.where, filename=args.filename)
+            print(runs[["dataset", "run_name", "source", "n_events", "n_empty_events", "n_blocks", "n_dileptons", "weight_sum"]]
+                  .to_string(index=False))
+            print(f"Totals: {catalog.totals(dataset, where=args.where, filename=args.filename)}")
+# End of script
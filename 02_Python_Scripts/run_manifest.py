@@ -0,0 +1,123 @@
+# -----------------------------
+# IMPORTS
+# -----------------------------
+## Standard libraries
+import os
+import json
+import hashlib
+import argparse
+from pathlib import Path
+## Third-party libraries
+## Custom libraries
+import quality_of_life as qol
+
+# -----------------------------
+# CONSTANTS AND SETTINGS
+# -----------------------------
+## Directory holding the state (manifest, per-run partial results, aggregate) of incrementally analysed datasets
+STATE_DIR = qol.CACHE_DIR / "incremental"
+MANIFEST_FILE_NAME = "manifest.json"
+# Version of the manifest layout
+MANIFEST_VERSION = 1
+
+# -----------------------------
+# CLASSES AND FUNCTIONS
+# -----------------------------
+## Function to get the signature (size, mtime) of a run file, which changes whenever the file is rewritten
+def file_signature(run_file: str | Path) -> list[int]:
+    stat = Path(run_file).stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+## Class to keep track of the runs of a dataset that are already part of an incrementally updated aggregate
+class RunManifest:
+    '''
+    Manifest of the processed run_<run_id>_<suffix> folders of one dataset and one kind of aggregate.
+    For every processed run the signature of its output file and the path of its partial result (e.g. enriched
+    DataFrame or histogram of this run) are kept in state_dir/manifest.json, next to the partial results and the
+    aggregate of all runs. The state directory is derived from the dataset path and params, so different kinds of
+    aggregates (and e.g. different binnings) of the same dataset are kept apart.
+    '''
+    def __init__(self, state_dir: str | Path, params: dict):
+        self.state_dir = Path(state_dir)
+        self.params = params
+        self.runs: dict[str, dict] = {}
+        # True if a manifest with other parameters was found: its aggregate is stale and has to be rebuilt
+        self.discarded = False
+        manifest_path = self.state_dir / MANIFEST_FILE_NAME
+        if manifest_path.exists():
+            with open(manifest_path) as f:
+                stored = json.load(f)
+            # A manifest written with other parameters (or layout) is not reused
+            if stored.get("version") == MANIFEST_VERSION and stored.get("params") == params:
+                self.runs = stored["runs"]
+            else:
+                self.discarded = True
+
+    ## Create the manifest of a dataset (root_dir/data_dir) for one kind of aggregate
+    @classmethod
+    def for_dataset(cls, root_dir: str | Path, data_dir: str, filename: str, params: dict,
+                    state_dir: str | Path | None = None) -> "RunManifest":
+        params = {"dataset": str((Path(root_dir) / data_dir).resolve()), "filename": filename, **params}
+        if state_dir is None:
+            key = hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+            state_dir = STATE_DIR / f"{Path(data_dir).name}_{key}"
+        return cls(state_dir, params)
+
+    ## Path of the partial result of one run
+    def partial_path(self, run_name: str, suffix: str = ".npz") -> Path:
+        return self.state_dir / "runs" / f"{run_name}{suffix}"
+
+    ## Path of the aggregate of all runs in the manifest
+    def aggregate_path(self, suffix: str = ".npz") -> Path:
+        return self.state_dir / f"aggregate{suffix}"
+
+    ## Compare the current run files with the manifest
+    def diff(self, run_files: dict[str, Path]) -> tuple[list[str], list[str], list[str]]:
+        '''
+        :param run_files: Output file of every run folder currently present (folder name -> file path, existing files only)
+        :type run_files: dict[str, Path]
+        :return: Names of new runs, of changed runs (signature differs from the manifest) and of removed runs
+        :rtype: tuple[list[str], list[str], list[str]]
+        '''
+        new, changed = [], []
+        for name, run_file in run_files.items():
+            if name not in self.runs:
+                new.append(name)
+            elif self.runs[name]["signature"] != file_signature(run_file):
+                changed.append(name)
+        removed = [name for name in self.runs if name not in run_files]
+        return new, changed, removed
+
+    ## Record a processed run
+    def record(self, run_name: str, run_file: Path, **info) -> None:
+        self.runs[run_name] = {"signature": file_signature(run_file), **info}
+
+    ## Remove a run (and its partial result) from the manifest
+    def forget(self, run_name: str, suffix: str = ".npz") -> None:
+        self.runs.pop(run_name, None)
+        self.partial_path(run_name, suffix).unlink(missing_ok=True)
+
+    ## Write the manifest (atomically, so an interrupted update keeps the previous manifest)
+    def save(self) -> None:
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        manifest_path = self.state_dir / MANIFEST_FILE_NAME
+        tmp_path = manifest_path.with_name(f"{MANIFEST_FILE_NAME}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "params": self.params, "runs": self.runs}, f, indent=1)
+        os.replace(tmp_path, manifest_path)
+
+# -----------------------------
+# MAIN SCRIPT
+# -----------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the incrementally analysed datasets.")
+    parser.add_argument("--state-dir", default=STATE_DIR, help="state directory (default: %(default)s)")
+    args = parser.parse_args()
+
+    for manifest_path in sorted(Path(args.state_dir).glob(f"*/{MANIFEST_FILE_NAME}")):
+        with open(manifest_path) as f:
+            stored = json.load(f)
+        params = stored["params"]
+        print(f"{manifest_path.parent.name}: {len(stored['runs'])} runs of {params['dataset']}/*/{params['filename']} "
+              f"({params.get('kind', '?')})")
+# End of script
@@ -3,12 +3,27 @@
 # Import necessary libraries
 from pathlib import Path
 from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 
 import io_smash
 import quality_of_life as qol
-# Define constants if needed (currently none)
+import run_cache
+import profiling
+import dilepton_shards
+import compressed_io
+import kinematics
+from run_manifest import RunManifest
+from histogramming import DileptonHistogram, RunHistogramTensor
+# Define constants
+## Version tag of the enriched per-run DataFrame (part of the cache key, bump when process_dilepton_file changes its output)
+PIPELINE_VERSION = "2"
+## Columns of the parsed file used by the pipeline (the other columns are skipped while parsing)
+PIPELINE_COLUMNS = dilepton_shards.SHARD_COLUMNS
+## Columns added by aggregate_runs to tell the run folders run_<run_id>_<task_id> apart (SLURM array job and task id;
+## all tasks of one array job share the run_id, so only the pair identifies a folder)
+RUN_KEY_COLUMNS = ["run_id", "task_id"]
 
 # Define functions
 ## Function to calculate rapidity values for data in a DataFrame
@@ -19,15 +34,13 @@ def calculate_rapidity(df, col_energy=None, col_beam=None)-> pd.DataFrame:
         "col_energy" is the column that contains the energy (aka p0, default value is "5" in standard SMASH output)
         "col_beam" is the column that contains the momentum in beam direction (aka pz for z-beam, default value is "8" in standard SMASH output)
     Output: 
-        Original DataFrame enriched by a column containing the rapidity values (named 'y')
+        Original DataFrame enriched by a column containing the rapidity values (named 'y', float32, NaN where p0 <= |pz|)
     '''
     p0_label = qol.resolve_col(df, col_energy, 5)  # Energy column
     pz_label = qol.resolve_col(df, col_beam, 8)  # pz column
     
-    p0 = df[p0_label]
-    pz = df[pz_label]
-
-    df['y'] = 0.5 * np.log((p0 + pz) / (p0 - pz))
+    # Fused float32 kernel: no float64 temporaries, NaN instead of a division by zero for p0 <= |pz|
+    df['y'] = kinematics.compute_kinematics(df[p0_label], None, None, df[pz_label], observables=("y",))["y"]
     return df
 
 ## Function to calculate invariant mass for data in a DataFrame
@@ -40,19 +53,16 @@ def calculate_invariant_mass(df, col_energy=None, col_px=None, col_py=None, col_
         "col_py" is the column containing the momentum in y direction (default value is "7" in standard SMASH output)
         "col_pz" is the column containing the momentum in z direction (default value is "8" in standard SMASH output)
     Output: 
-        Original DataFrame enriched by a column containing the invariant mass values (named 'm_inv')
+        Original DataFrame enriched by a column containing the invariant mass values (named 'm_inv', float32)
     '''
     p0_label = qol.resolve_col(df, col_energy, 5)  # Energy column
     px_label = qol.resolve_col(df, col_px, 6)      # px column
     py_label = qol.resolve_col(df, col_py, 7)      # py column
     pz_label = qol.resolve_col(df, col_pz, 8)      # pz column
 
-    p0 = df[p0_label]
-    px = df[px_label]
-    py = df[py_label]
-    pz = df[pz_label]
-    m2 = p0**2 - (px**2 + py**2 + pz**2)
-    df['m_inv'] = np.sqrt(np.clip(m2, 0, None))
+    # Fused float32 kernel: m^2 is computed block by block without full-length temporaries (negative m^2 -> 0)
+    df['m_inv'] = kinematics.compute_kinematics(df[p0_label], df[px_label], df[py_label], df[pz_label],
+                                                observables=("m_inv",))["m_inv"]
     return df
 
 ## Function to add PDG names to the DataFrame based on PDG IDs
@@ -72,11 +82,8 @@ def add_pdg_names(df, pdg_column=None, long_name = False)-> pd.DataFrame:
     :rtype: pd.DataFrame
     '''
     pdg_id_label = qol.resolve_col(df, pdg_column, 9)
-    # Add PDG names to the DataFrame
-    ## Create wrapper function
-    get_pdg_name_wrap = partial(qol.get_pdg_name, long_name=long_name)
-    ## Apply wrapper function to the specified PDG ID column
-    df['pdg_name'] = df[pdg_id_label].apply(get_pdg_name_wrap)
+    # Add PDG names to the DataFrame (only the unique PDG IDs are resolved, then mapped onto the column)
+    df['pdg_name'] = qol.map_pdg_names(df[pdg_id_label], long_name=long_name)
 
     return df
 
@@ -101,18 +108,22 @@ def enrich_dilepton_with_parent(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 ## Function to adjust shining weights for number of dilepton events
-def adjust_shining_weights(input_data: pd.DataFrame)-> pd.DataFrame:
+def adjust_shining_weights(input_data: pd.DataFrame, no_events: int | None = None)-> pd.DataFrame:
     '''
     Function adjusts shining weights in the dataset for total number of dilepton events in this data set.
     
     :param input_data: Expected to be a Pandas DataFrame with at least the columns "p_pdg_id" is correctly
      filled via io_smash.aggregate_dilepton_pairs function executed before, and "block_weight"
     :type input_data: pd.DataFrame
+    :param (optional, default = None) no_events: Number of dilepton events used for the normalisation. If None, it is
+     counted in input_data. Pass the total of the whole run when input_data is only one chunk of it.
+    :type no_events: int | None
     :return: Pandas DataFrame with an additional column called "block_weight_adj" that contains the number-adjusted shining weight to be used in histogram 
     :rtype: DataFrame
     '''
     # Get the number of events for this simulation run
-    no_events = int((input_data["p_pdg_id"] == -1111).sum())
+    if no_events is None:
+        no_events = int((input_data["p_pdg_id"] == -1111).sum())
     # New column created to adjust shining weights for number of events 
     input_data["block_weight_adj"] = input_data["block_weight"] / no_events
     # Apply OSCAR dtypes again to ensure correct types
@@ -120,53 +131,452 @@ def adjust_shining_weights(input_data: pd.DataFrame)-> pd.DataFrame:
 
     return input_data
 
+## Function to run the dilepton pipeline (read, pair aggregation, invariant mass, parent enrichment, weight adjustment) on one file
+def process_dilepton_file(path: str | Path, events_per_chunk: int | None = None, use_cache: bool = False,
+                          rebuild_cache: bool = False, n_workers: int = 1) -> pd.DataFrame:
+    '''
+    Reads one Dileptons.oscar file and returns the enriched dilepton DataFrame of this run.
+    
+    :param path: Path to the Dileptons.oscar file or to a shard of it (see dilepton_shards, read at once)
+    :type path: str | Path
+    :param (optional, default = None) events_per_chunk: If given, the file is streamed via io_smash.iter_smash_dilepton_chunks
+     and only one chunk of raw rows is held in memory at a time. The shining weights are adjusted once all chunks are reduced,
+     so the result is the same as for the full read.
+    :type events_per_chunk: int | None
+    :param (optional, default = False) use_cache: If True, the enriched DataFrame is loaded from / stored in the run_cache
+    :type use_cache: bool
+    :param (optional, default = False) rebuild_cache: If True, an existing cache entry is ignored and rebuilt
+    :type rebuild_cache: bool
+    :param (optional, default = 1) n_workers: Number of worker processes parsing the file in parallel (ignored when streaming chunks)
+    :type n_workers: int
+    :return: Pandas DataFrame with aggregated dilepton pairs, "m_inv", "p_parent_pdg_id" and "block_weight_adj"
+    :rtype: DataFrame
+    '''
+    if use_cache:
+        version = f"{io_smash.PARSER_VERSION}-{PIPELINE_VERSION}"
+        return run_cache.load_or_build(path, "enriched", version,
+                                       partial(process_dilepton_file, path, events_per_chunk=events_per_chunk,
+                                               n_workers=n_workers),
+                                       rebuild=rebuild_cache)
+
+    # Every stage is measured with profiling.stage (no-op unless SMASH_PROFILE is set)
+    label = str(path)
+    if dilepton_shards.is_shard(path):
+        with profiling.stage("parse", label=label, bytes_read=Path(path).stat().st_size) as st:
+            chunks = [dilepton_shards.read_dilepton_shard(path)]
+            st.rows_out = len(chunks[0])
+    elif events_per_chunk is None:
+        with profiling.stage("parse", label=label, bytes_read=Path(path).stat().st_size) as st:
+            chunks = [io_smash.read_smash_dilepton_output(path, n_workers=n_workers, columns=PIPELINE_COLUMNS)]
+            st.rows_out = len(chunks[0])
+    else:
+        chunks = profiling.profile_iter("parse", io_smash.iter_smash_dilepton_chunks(path, events_per_chunk=events_per_chunk,
+                                                                                    columns=PIPELINE_COLUMNS),
+                                        label=label)
+
+    reduced = []
+    for chunk in chunks:
+        with profiling.stage("pair_aggregation", label=label, rows_in=len(chunk)) as st:
+            short_data = io_smash.aggregate_dilepton_pairs(chunk)
+            st.rows_out = len(short_data)
+        with profiling.stage("invariant_mass", label=label, rows_in=len(short_data)) as st:
+            df = calculate_invariant_mass(short_data, col_energy="p0", col_px="px", col_py="py", col_pz="pz")
+            st.rows_out = len(df)
+        with profiling.stage("parent_enrichment", label=label, rows_in=len(df)) as st:
+            reduced.append(enrich_dilepton_with_parent(df))
+            st.rows_out = len(reduced[-1])
+    with profiling.stage("concat", label=label, rows_in=sum(len(part) for part in reduced)) as st:
+        df = reduced[0] if len(reduced) == 1 else pd.concat(reduced, ignore_index=True)
+        st.rows_out = len(df)
+
+    with profiling.stage("weight_adjustment", label=label, rows_in=len(df)) as st:
+        df = adjust_shining_weights(df)
+        st.rows_out = len(df)
+    return df
+
+## Function to parse run folder names of the form run_<run_id>_<suffix> (SLURM array job id and task id)
+def parse_run_dir_name(name: str) -> tuple[int, int]:
+    parts = name.split("_")
+    # parts[0] == "run", parts[1] == run_id, parts[2] == suffix
+    return int(parts[1]), int(parts[2])
+
+## Function to list the run folders below a data directory, sorted by (run_id, suffix)
+def list_run_dirs(root_dir: str | Path, data_dir: str) -> list[Path]:
+    # Create path to root folder containing the different simulation runs
+    base_path = Path(root_dir) / data_dir
+    # Create sorted list of non-empty subdirectories below base_path
+    return sorted([p for p in base_path.iterdir() if p.is_dir()],
+                  key=lambda p: parse_run_dir_name(p.name),
+                  )
+
+## Helper function to get the file of a run to analyse: the shard of filename if present, current (and preferred), else filename
+def _resolve_run_file(run_dir: Path, filename: str, prefer_shards: bool = True) -> Path:
+    # Compressed output (e.g. Dileptons.oscar.gz) is used if the plain file does not exist
+    run_file = compressed_io.find_existing_variant(run_dir / filename) or run_dir / filename
+    shard = dilepton_shards.shard_path_for(run_file)
+    if prefer_shards and shard.exists():
+        # A shard left over from an earlier simulation or copy of the run is ignored in favour of the text file
+        if dilepton_shards.is_current(shard, run_file):
+            return shard
+        print(f"ignoring stale shard: {shard} (written from another {run_file.name})")
+    return run_file
+
+## Worker function running the per-run pipeline; errors are returned instead of raised so one bad run does not abort the others
+def _process_run(run_dir: Path, filename: str, events_per_chunk: int | None = None, use_cache: bool = False,
+                 rebuild_cache: bool = False, prefer_shards: bool = True) -> tuple[pd.DataFrame | None, str | None]:
+    run_file = _resolve_run_file(run_dir, filename, prefer_shards)
+    if not run_file.exists():
+        return None, f"skip missing: {run_file}"
+    try:
+        df = process_dilepton_file(run_file, events_per_chunk=events_per_chunk, use_cache=use_cache,
+                                   rebuild_cache=rebuild_cache)
+    except Exception as e:
+        return None, f"skip failed: {run_file} ({type(e).__name__}: {e})"
+    df["run_id"], df["task_id"] = parse_run_dir_name(run_dir.name)
+    return df, None
+
+## Helper function to apply a per-run worker to run folders, optionally in a process pool (results in the order of run_dirs)
+def _map_runs(worker, run_dirs: list[Path], parallel: bool = False, n_workers: int | None = None) -> list:
+    if parallel and len(run_dirs) > 1:
+        n_workers = min(n_workers or qol.get_default_workers(), len(run_dirs))
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            # map keeps the order of run_dirs, so the result is deterministic
+            return list(pool.map(worker, run_dirs))
+    return list(map(worker, run_dirs))
+
+## Helper function to restrict run folders to the runs of the run catalog matching an SQL condition
+def _select_run_dirs(run_dirs: list[Path], root_dir: str | Path, data_dir: str, filename: str, where: str,
+                     where_params: tuple = (), catalog_path: str | Path | None = None, parallel: bool = False,
+                     n_workers: int | None = None) -> list[Path]:
+    # Imported here: run_catalog is only needed for selections by query
+    from run_catalog import RunCatalog, CATALOG_PATH
+    with RunCatalog(catalog_path or CATALOG_PATH) as catalog:
+        catalog.update(root_dir, [data_dir], filename=filename, parallel=parallel, n_workers=n_workers)
+        selected = set(catalog.select_runs(data_dir, where, where_params, filename)["run_name"])
+    print(f"{len(selected)} of {len(run_dirs)} runs selected by: {where}")
+    return [p for p in run_dirs if p.name in selected]
+
 ## Function to aggregate multiple different simulation runs
-def aggregate_runs(root_dir: str | Path, data_dir: str, filename: str) -> pd.DataFrame:
+def aggregate_runs(root_dir: str | Path, data_dir: str, filename: str, events_per_chunk: int | None = None,
+                   parallel: bool = False, n_workers: int | None = None, use_cache: bool = False,
+                   rebuild_cache: bool = False, prefer_shards: bool = True, where: str | None = None,
+                   where_params: tuple = (), catalog_path: str | Path | None = None) -> pd.DataFrame:
     '''
-    Docstring for aggregate_runs
+    Reads all run_<run_id>_<suffix> folders below root_dir/data_dir, runs the dilepton pipeline on each of them
+    and concatenates the results (ordered by run folder) into one DataFrame with the additional columns "run_id"
+    and "task_id" (RUN_KEY_COLUMNS; together they identify the run folder).
+    Missing or unreadable files are reported per run and skipped. If a run folder contains a shard of filename
+    (written on the cluster by dilepton_shards.py) that is current (dilepton_shards.is_current), the shard is read
+    instead of the text file. Compressed output
+    (filename + .gz/.zst/.xz) is used when the plain file is missing and decompressed while parsing.
     
-    :param root_dir: Description
+    :param root_dir: Root path containing the data directories
     :type root_dir: str | Path
-    :param data_dir: Description
+    :param data_dir: Name of the data directory containing the run folders
     :type data_dir: str
-    :param filename: Description
+    :param filename: File name of the SMASH output inside each run folder (e.g. "Dileptons.oscar")
     :type filename: str
-    :return: Description
+    :param (optional, default = None) events_per_chunk: Stream each run in chunks of this many events (see process_dilepton_file)
+    :type events_per_chunk: int | None
+    :param (optional, default = False) parallel: If True, the runs are processed in a process pool
+    :type parallel: bool
+    :param (optional, default = None) n_workers: Number of worker processes for parallel mode. If None, 
+     SLURM_CPUS_PER_TASK or the number of CPUs is used (see qol.get_default_workers)
+    :type n_workers: int | None
+    :param (optional, default = False) use_cache: If True, the enriched per-run DataFrames are taken from / stored in the run_cache
+    :type use_cache: bool
+    :param (optional, default = False) rebuild_cache: If True, existing cache entries are ignored and rebuilt
+    :type rebuild_cache: bool
+    :param (optional, default = True) prefer_shards: If True, shards (<stem>.shard.npz) are read instead of filename where present
+    :type prefer_shards: bool
+    :param (optional, default = None) where: SQL condition selecting the runs from the run catalog (see
+     run_catalog.RunCatalog.select_runs, e.g. "n_events >= ?"); the catalog is updated for this dataset first.
+     None: all runs
+    :type where: str | None
+    :param (optional, default = ()) where_params: Values of the ? placeholders in where
+    :type where_params: tuple
+    :param (optional, default = None) catalog_path: Catalog database (None: run_catalog.CATALOG_PATH)
+    :type catalog_path: str | Path | None
+    :return: Concatenated DataFrame of all runs (empty DataFrame if no run could be processed)
     :rtype: DataFrame
     '''
-    # Create path to root folder containing the different simulation runs 
-    base_path = Path(root_dir) / data_dir
-    # Create sorted list of non-empty subdirectories below base_path
-    # Expected folder names: run_<run_id>_<suffix>
-    def _parse_run_dir_name(name: str) -> tuple[int, int]:
-        parts = name.split("_")
-        # parts[0] == "run", parts[1] == run_id, parts[2] == suffix
-        return int(parts[1]), int(parts[2])
-
-    run_dirs = sorted([p for p in base_path.iterdir() if p.is_dir()],
-                      key=lambda p: _parse_run_dir_name(p.name),
-                      )
+    run_dirs = list_run_dirs(root_dir, data_dir)
+    if where is not None:
+        run_dirs = _select_run_dirs(run_dirs, root_dir, data_dir, filename, where, where_params, catalog_path,
+                                    parallel=parallel, n_workers=n_workers)
+    worker = partial(_process_run, filename=filename, events_per_chunk=events_per_chunk, use_cache=use_cache,
+                     rebuild_cache=rebuild_cache, prefer_shards=prefer_shards)
+    results = _map_runs(worker, run_dirs, parallel=parallel, n_workers=n_workers)
 
     aggregated = []
-    for run_dir in run_dirs:
-        run_file = run_dir / filename
-        if not run_file.exists():
-            print(f"skip missing: {run_file}")
+    for df, message in results:
+        if message is not None:
+            print(message)
             continue
-
-        full_data = io_smash.read_smash_dilepton_output(run_file)
-        short_data = io_smash.aggregate_dilepton_pairs(full_data)
-        df = calculate_invariant_mass(short_data, col_energy="p0", col_px="px", col_py="py", col_pz="pz")
-        df = enrich_dilepton_with_parent(df)
-        df = adjust_shining_weights(df)
-        df["run_id"] = _parse_run_dir_name(run_dir.name)[0]
         aggregated.append(df)
 
     if not aggregated:
         return pd.DataFrame()
 
-    return pd.concat(aggregated, ignore_index=True)
+    with profiling.stage("concat", label=str(Path(root_dir) / data_dir), rows_in=sum(len(df) for df in aggregated)) as st:
+        df_all = pd.concat(aggregated, ignore_index=True)
+        st.rows_out = len(df_all)
+    return df_all
+
+
+## Worker function filling the histogram of one run (only the small histogram is sent back to the parent process)
+def _histogram_run(run_dir: Path, filename: str, bin_edges: np.ndarray, col_bin_axis: str = "m_inv",
+                   col_weight: str = "block_weight", **process_kwargs) -> tuple[DileptonHistogram | None, str | None]:
+    df, message = _process_run(run_dir, filename, **process_kwargs)
+    if df is None:
+        return None, message
+    return DileptonHistogram(bin_edges, col_bin_axis=col_bin_axis, col_weight=col_weight).fill(df), None
+
+## Function to histogram multiple simulation runs with constant memory (one run in memory per worker)
+def histogram_runs(root_dir: str | Path, data_dir: str, filename: str, bin_edges: np.ndarray, col_bin_axis: str = "m_inv",
+                   col_weight: str = "block_weight", events_per_chunk: int | None = None, parallel: bool = False,
+                   n_workers: int | None = None, use_cache: bool = False, rebuild_cache: bool = False) -> DileptonHistogram:
+    '''
+    Same run selection and per-run pipeline as aggregate_runs, but instead of concatenating the runs every run is
+    filled into a DileptonHistogram and the histograms are merged. Every run is one fill, so the spectrum matches
+    summing block_weight_adj as plotting.plot_hist_multiple does ("per_run" normalisation, the default of
+    DileptonHistogram.spectrum) or gives the average per event of all runs ("total").
+    
+    :param bin_edges: Bin edges of the histogram
+    :type bin_edges: np.ndarray
+    :param (optional, default = "m_inv") col_bin_axis: Column to histogram
+    :type col_bin_axis: str
+    :param (optional, default = "block_weight") col_weight: Column with the (not yet normalised) weights
+    :type col_weight: str
+    :return: Merged histogram of all runs (the remaining parameters are the same as for aggregate_runs)
+    :rtype: DileptonHistogram
+    '''
+    run_dirs = list_run_dirs(root_dir, data_dir)
+    worker = partial(_histogram_run, filename=filename, bin_edges=bin_edges, col_bin_axis=col_bin_axis,
+                     col_weight=col_weight, events_per_chunk=events_per_chunk, use_cache=use_cache,
+                     rebuild_cache=rebuild_cache)
+
+    hist = DileptonHistogram(bin_edges, col_bin_axis=col_bin_axis, col_weight=col_weight)
+    for run_hist, message in _map_runs(worker, run_dirs, parallel=parallel, n_workers=n_workers):
+        if message is not None:
+            print(message)
+            continue
+        hist.merge(run_hist)
+
+    return hist
+
+## Function to histogram every simulation run separately into a run x channel x bin tensor (input of bootstrap/jackknife bands)
+def histogram_runs_per_run(root_dir: str | Path, data_dir: str, filename: str, bin_edges: np.ndarray,
+                           col_bin_axis: str = "m_inv", col_weight: str = "block_weight", events_per_chunk: int | None = None,
+                           parallel: bool = False, n_workers: int | None = None, use_cache: bool = False,
+                           rebuild_cache: bool = False) -> RunHistogramTensor:
+    '''
+    Same per-run histograms as histogram_runs, but instead of merging them they are stacked into a
+    RunHistogramTensor (one entry per run folder), from which the uncertainty bands are resampled over the runs
+    without touching the data again (see RunHistogramTensor.uncertainty_bands). The parameters are the same as for
+    histogram_runs.
+
+    :return: Weighted counts per run folder, channel and bin
+    :rtype: RunHistogramTensor
+    '''
+    run_dirs = list_run_dirs(root_dir, data_dir)
+    worker = partial(_histogram_run, filename=filename, bin_edges=bin_edges, col_bin_axis=col_bin_axis,
+                     col_weight=col_weight, events_per_chunk=events_per_chunk, use_cache=use_cache,
+                     rebuild_cache=rebuild_cache)
+    histograms = {}
+    for run_dir, (run_hist, message) in zip(run_dirs, _map_runs(worker, run_dirs, parallel=parallel, n_workers=n_workers)):
+        if message is not None:
+            print(message)
+            continue
+        histograms[run_dir.name] = run_hist
+    return RunHistogramTensor.from_histograms(histograms)
+
+## Helper function to find the runs of a dataset that have to be (re)processed for an incremental aggregate
+def _manifest_todo(manifest: RunManifest, run_dirs: list[Path], filename: str) -> tuple[dict, list[str], tuple]:
+    '''
+    Returns the output file of every run folder present (folder name -> path), the names of the new and changed runs
+    to process and the result of manifest.diff (new, changed, removed).
+    '''
+    # Resolved once per folder (every call stats and globs on the file system)
+    run_files = {p.name: f for p in run_dirs if (f := _resolve_run_file(p, filename)).exists()}
+    for p in run_dirs:
+        if p.name not in run_files:
+            print(f"skip missing: {p / filename}")
+    new, changed, removed = manifest.diff(run_files)
+    todo = [name for name in run_files if name in new or name in changed]
+    return run_files, todo, (new, changed, removed)
+
+## Helper function to record the results of the processed runs in the manifest of an incremental aggregate
+def _record_manifest_results(manifest: RunManifest, run_files: dict, todo: list[str], results: list, diff: tuple,
+                             save_partial) -> tuple[dict, bool]:
+    new, changed, removed = diff
+    added = {}
+    for name, (result, message) in zip(todo, results):
+        if message is not None:
+            print(message)
+            manifest.forget(name)
+            continue
+        manifest.partial_path(name).parent.mkdir(parents=True, exist_ok=True)
+        save_partial(result, manifest.partial_path(name))
+        manifest.record(name, run_files[name])
+        added[name] = result
+    for name in removed:
+        manifest.forget(name)
+    print(f"{len(new)} new, {len(changed)} changed, {len(removed)} removed runs; "
+          f"{len(manifest.runs)} runs in {manifest.state_dir}")
+    return added, bool(changed or removed or manifest.discarded)
+
+## Helper function to bring the manifest of an incremental aggregate up to date with the run folders
+def _update_manifest(manifest: RunManifest, run_dirs: list[Path], filename: str, worker, save_partial,
+                     parallel: bool = False, n_workers: int | None = None) -> tuple[dict, bool]:
+    '''
+    Processes only the new and changed runs with worker (returning (result, message) like _process_run), stores their
+    partial results with save_partial(result, path) and records them in the manifest. Removed runs (and changed runs
+    that fail now) are dropped from the manifest.
+    Returns the results of the processed runs (run folder name -> result) and whether runs already contained in the
+    aggregate changed or were removed, or the stored state belongs to other parameters (then the aggregate has to be
+    rebuilt from the partial results).
+    '''
+    run_files, todo, diff = _manifest_todo(manifest, run_dirs, filename)
+    results = _map_runs(worker, [run_files[name].parent for name in todo], parallel=parallel, n_workers=n_workers)
+    return _record_manifest_results(manifest, run_files, todo, results, diff, save_partial)
+
+## Function to aggregate multiple simulation runs incrementally (only new or changed runs are processed)
+def aggregate_runs_incremental(root_dir: str | Path, data_dir: str, filename: str, events_per_chunk: int | None = None,
+                               parallel: bool = False, n_workers: int | None = None,
+                               state_dir: str | Path | None = None) -> pd.DataFrame:
+    '''
+    Incremental variant of aggregate_runs for array jobs finishing in waves. A RunManifest keeps the enriched
+    DataFrame of every processed run and the concatenated aggregate. On each call only the run folders that are new
+    or whose output file changed (size or mtime) are processed, and their rows are appended to the stored aggregate,
+    so the parsing time is proportional to the new runs. If runs changed or disappeared, the aggregate is rebuilt
+    from the stored per-run frames (without parsing again) in run folder order.
+    Rows of runs added later are appended at the end, so the row order equals the one of aggregate_runs only as
+    long as the runs finish in folder order (the content is the same).
+
+    :param (optional, default = None) state_dir: Directory of the manifest, the per-run frames and the aggregate.
+     If None, a directory below run_manifest.STATE_DIR derived from the dataset path is used
+    :type state_dir: str | Path | None
+    :return: Concatenated DataFrame of all processed runs (the remaining parameters are the same as for aggregate_runs)
+    :rtype: DataFrame
+    '''
+    params = {"kind": "enriched_frame", "version": f"{io_smash.PARSER_VERSION}-{PIPELINE_VERSION}",
+              "run_columns": RUN_KEY_COLUMNS}
+    manifest = RunManifest.for_dataset(root_dir, data_dir, filename, params, state_dir=state_dir)
+    run_dirs = list_run_dirs(root_dir, data_dir)
+    worker = partial(_process_run, filename=filename, events_per_chunk=events_per_chunk)
+    added, rebuild = _update_manifest(manifest, run_dirs, filename, worker, run_cache.save_frame,
+                                      parallel=parallel, n_workers=n_workers)
+
+    aggregate_path = manifest.aggregate_path()
+    if rebuild or not aggregate_path.exists():
+        names = [p.name for p in run_dirs if p.name in manifest.runs]
+        frames = [added[name] if name in added else run_cache.load_frame(manifest.partial_path(name)) for name in names]
+    else:
+        frames = [run_cache.load_frame(aggregate_path)] + list(added.values())
+    frames = [df for df in frames if not df.empty]
+
+    df_all = pd.concat(frames, ignore_index=True) if len(frames) > 1 else (frames[0] if frames else pd.DataFrame())
+    if rebuild or added or not aggregate_path.exists():
+        run_cache.save_frame(df_all, aggregate_path)
+    manifest.save()
+    return df_all
+
+## Function to histogram multiple simulation runs incrementally (only new or changed runs are processed)
+def histogram_runs_incremental(root_dir: str | Path, data_dir: str, filename: str, bin_edges: np.ndarray,
+                               col_bin_axis: str = "m_inv", col_weight: str = "block_weight",
+                               events_per_chunk: int | None = None, parallel: bool = False,
+                               n_workers: int | None = None, state_dir: str | Path | None = None) -> DileptonHistogram:
+    '''
+    Incremental variant of histogram_runs: the histogram of every processed run and the merged histogram are kept
+    with a RunManifest (per binning and columns). New or changed runs are histogrammed and merged into the stored
+    histogram, so both time and memory are proportional to the new runs. If runs changed or disappeared, the merged
+    histogram is rebuilt from the stored per-run histograms.
+
+    :return: Merged histogram of all processed runs (the parameters are the same as for histogram_runs and
+     aggregate_runs_incremental)
+    :rtype: DileptonHistogram
+    '''
+    bin_edges = np.asarray(bin_edges, dtype=np.float64)
+    manifest = _histogram_manifest(root_dir, data_dir, filename, bin_edges, col_bin_axis, col_weight, state_dir)
+    run_dirs = list_run_dirs(root_dir, data_dir)
+    worker = partial(_histogram_run, filename=filename, bin_edges=bin_edges, col_bin_axis=col_bin_axis,
+                     col_weight=col_weight, events_per_chunk=events_per_chunk)
+    added, rebuild = _update_manifest(manifest, run_dirs, filename, worker, _save_histogram,
+                                      parallel=parallel, n_workers=n_workers)
+    return _merge_manifest_histograms(manifest, run_dirs, added, rebuild, bin_edges, col_bin_axis, col_weight)
+
+## Helper function to create the manifest of the incremental histogram of a dataset (per binning and columns)
+def _histogram_manifest(root_dir: str | Path, data_dir: str, filename: str, bin_edges: np.ndarray, col_bin_axis: str,
+                        col_weight: str, state_dir: str | Path | None = None) -> RunManifest:
+    params = {"kind": "histogram", "version": f"{io_smash.PARSER_VERSION}-{PIPELINE_VERSION}",
+              "bin_edges": bin_edges.tolist(), "col_bin_axis": col_bin_axis, "col_weight": col_weight,
+              "per_run_sums": True}
+    return RunManifest.for_dataset(root_dir, data_dir, filename, params, state_dir=state_dir)
+
+## Helper function to store the histogram of one run as partial result of a manifest
+def _save_histogram(hist: DileptonHistogram, path: Path) -> None:
+    hist.save(path)
+
+## Helper function to merge the stored and the newly filled run histograms of a manifest and store the aggregate
+def _merge_manifest_histograms(manifest: RunManifest, run_dirs: list[Path], added: dict, rebuild: bool,
+                               bin_edges: np.ndarray, col_bin_axis: str, col_weight: str) -> DileptonHistogram:
+    aggregate_path = manifest.aggregate_path()
+    hist = DileptonHistogram(bin_edges, col_bin_axis=col_bin_axis, col_weight=col_weight)
+    if rebuild or not aggregate_path.exists():
+        for name in [p.name for p in run_dirs if p.name in manifest.runs]:
+            hist.merge(added[name] if name in added else DileptonHistogram.load(manifest.partial_path(name)))
+    else:
+        hist.merge(DileptonHistogram.load(aggregate_path))
+        for run_hist in added.values():
+            hist.merge(run_hist)
+    if rebuild or added or not aggregate_path.exists():
+        hist.save(aggregate_path)
+    manifest.save()
+    return hist
+
+## Function to histogram several datasets (e.g. of a parameter scan) incrementally with one shared pool for all their runs
+def histogram_datasets_incremental(root_dir: str | Path, data_dirs: list[str], filename: str, bin_edges: np.ndarray,
+                                   col_bin_axis: str = "m_inv", col_weight: str = "block_weight",
+                                   events_per_chunk: int | None = None, parallel: bool = False,
+                                   n_workers: int | None = None, use_cache: bool = True) -> dict[str, DileptonHistogram]:
+    '''
+    Same result per dataset as histogram_runs_incremental (and the same manifests, so both share their stored
+    histograms), but the new and changed runs of all datasets are collected first and processed in one process pool,
+    so the workers stay busy across dataset boundaries instead of waiting for the slowest run of every dataset.
+    Runs already in a manifest are not processed again; with use_cache the enriched per-run frames are also taken
+    from the run_cache, so a new binning or weight column does not parse the files again.
+
+    :param data_dirs: Names of the data directories below root_dir (duplicates are processed once)
+    :type data_dirs: list[str]
+    :param (optional, default = True) use_cache: If True, the enriched per-run DataFrames are taken from / stored in the run_cache
+    :type use_cache: bool
+    :return: Merged histogram per data directory (the remaining parameters are the same as for histogram_runs)
+    :rtype: dict[str, DileptonHistogram]
+    '''
+    bin_edges = np.asarray(bin_edges, dtype=np.float64)
+    data_dirs = list(dict.fromkeys(data_dirs))
+    datasets = {}
+    for data_dir in data_dirs:
+        manifest = _histogram_manifest(root_dir, data_dir, filename, bin_edges, col_bin_axis, col_weight)
+        run_dirs = list_run_dirs(root_dir, data_dir)
+        datasets[data_dir] = (manifest, run_dirs, *_manifest_todo(manifest, run_dirs, filename))
+
+    # All runs to process, largest files first, so the longest runs do not start last
+    tasks = [(data_dir, name, run_files[name]) for data_dir, (_, _, run_files, todo, _) in datasets.items() for name in todo]
+    tasks.sort(key=lambda task: task[2].stat().st_size, reverse=True)
+    worker = partial(_histogram_run, filename=filename, bin_edges=bin_edges, col_bin_axis=col_bin_axis,
+                     col_weight=col_weight, events_per_chunk=events_per_chunk, use_cache=use_cache)
+    results = _map_runs(worker, [run_file.parent for _, _, run_file in tasks], parallel=parallel, n_workers=n_workers)
+    results_per_run = {(data_dir, name): result for (data_dir, name, _), result in zip(tasks, results)}
 
+    hists = {}
+    for data_dir, (manifest, run_dirs, run_files, todo, diff) in datasets.items():
+        print(f"{data_dir}: ", end="")
+        added, rebuild = _record_manifest_results(manifest, run_files, todo, [results_per_run[(data_dir, name)] for name in todo],
+                                                  diff, _save_histogram)
+        hists[data_dir] = _merge_manifest_histograms(manifest, run_dirs, added, rebuild, bin_edges, col_bin_axis, col_weight)
+    return hists
 
 ## (To be deleted as not used) Function to print basic statistics of the DataFrame
 def print_basic_statistics(df):
@@ -0,0 +1,178 @@
+# -----------------------------
+# IMPORTS
+# -----------------------------
+## Standard libraries
+import argparse
+from pathlib import Path
+import numpy as np
+## Third-party libraries
+## Custom libraries
+
+# -----------------------------
+# CONSTANTS AND SETTINGS
+# -----------------------------
+# Header lines of a SMASH Dileptons.oscar file (Oscar2013 format)
+OSCAR_HEADER = [
+    "#!OSCAR2013 Dileptons t x y z mass p0 px py pz pdg ID charge",
+    "# Units: fm fm fm fm GeV GeV GeV GeV GeV none none e",
+    "# SMASH-3.2",
+]
+# Format of one data line (t x y z mass p0 px py pz pdg ID charge)
+DATA_LINE_FORMAT = " ".join(["%.9g"] * 9 + ["%d"] * 3)
+
+# Dilepton producing channels: (incoming PDG IDs, outgoing PDG IDs)
+DECAY_CHANNELS = [
+    ([111], [22, 11, -11]),     # pi0 Dalitz
+    ([221], [22, 11, -11]),     # eta Dalitz
+    ([2214], [2212, 11, -11]),  # Delta+ Dalitz
+    ([113], [11, -11]),         # rho0 direct decay
+    ([223], [11, -11]),         # omega direct decay
+]
+# SMASH process type of the interaction blocks (5: decay)
+PROCESS_TYPE_DECAY = 5
+
+# Masses [GeV] and charges [e] of the particles used above (unlisted particles get DEFAULT_MASS and charge 0)
+PARTICLE_MASSES = {11: 0.000511, -11: 0.000511, 22: 0.0, 2212: 0.938}
+PARTICLE_CHARGES = {11: -1, -11: 1, 2212: 1, 2214: 1, 211: 1, -211: -1}
+DEFAULT_MASS = 0.14
+
+# -----------------------------
+# CLASSES AND FUNCTIONS
+# -----------------------------
+## Helper function to look up a per-PDG-ID property for an array of PDG IDs
+def _lookup(pdg: np.ndarray, table: dict, default) -> np.ndarray:
+    ids, inverse = np.unique(pdg, return_inverse=True)
+    return np.asarray([table.get(int(i), default) for i in ids], dtype=np.float64)[inverse]
+
+## Function to write a synthetic Dileptons.oscar file in the SMASH output format
+def write_synthetic_dilepton_file(path: str | Path, n_events: int = 1000, empty_fraction: float = 0.3,
+                                  blocks_per_event: tuple[int, int] = (1, 3), channels: list = DECAY_CHANNELS,
+                                  weight_range: tuple[float, float] = (1e-8, 1e-5), t_max: float = 30.0,
+                                  seed: int = 0) -> dict:
+    '''
+    Writes a file with the structure described in 07_Doc_Codedesign/Dilepton_output_specifics.md: per event a number
+    of interaction blocks ('# interaction in N out M ... weight ... partial ... type 5' followed by N incoming and
+    M outgoing particles) and the closing '# event ... end' line; empty events only consist of the event line.
+    The outgoing particles are on-shell, the incoming particles carry the summed four-momentum of the block, so
+    the invariant masses of the e+e- pairs are physical.
+
+    :param path: Path of the file to write
+    :type path: str | Path
+    :param (optional, default = 1000) n_events: Number of events
+    :type n_events: int
+    :param (optional, default = 0.3) empty_fraction: Probability of an event without any dilepton block
+    :type empty_fraction: float
+    :param (optional, default = (1, 3)) blocks_per_event: Minimum and maximum number of blocks of a non-empty event (uniform)
+    :type blocks_per_event: tuple[int, int]
+    :param (optional, default = DECAY_CHANNELS) channels: List of (incoming PDG IDs, outgoing PDG IDs) chosen uniformly per block,
+     which sets the in/out multiplicities of the blocks
+    :type channels: list
+    :param (optional, default = (1e-8, 1e-5)) weight_range: Range of the (log-uniform) shining weights of the blocks
+    :type weight_range: tuple[float, float]
+    :param (optional, default = 30.0) t_max: Maximum production time [fm]
+    :type t_max: float
+    :param (optional, default = 0) seed: Seed of the random number generator
+    :type seed: int
+    :return: Summary with the numbers of events, empty events, blocks, data rows and bytes written
+    :rtype: dict
+    '''
+    rng = np.random.default_rng(seed)
+    n_blocks_event = rng.integers(blocks_per_event[0], blocks_per_event[1] + 1, size=n_events)
+    n_blocks_event[rng.random(n_events) < empty_fraction] = 0
+    n_blocks = int(n_blocks_event.sum())
+
+    # Block properties: channel, multiplicities, production time (ascending within an event) and weights
+    channel = rng.integers(len(channels), size=n_blocks)
+    n_in = np.asarray([len(c_in) for c_in, _ in channels])[channel]
+    n_out = np.asarray([len(c_out) for _, c_out in channels])[channel]
+    block_len = n_in + n_out
+    block_event = np.repeat(np.arange(n_events), n_blocks_event)
+    t_block = rng.uniform(0.0, t_max, size=n_blocks)
+    t_block = t_block[np.lexsort((t_block, block_event))]
+    weight = np.exp(rng.uniform(np.log(weight_range[0]), np.log(weight_range[1]), size=n_blocks))
+    partial = weight * rng.uniform(1.0, 20.0, size=n_blocks)
+
+    # Row properties: PDG ID from the channel table, "in" rows first within each block
+    n_rows = int(block_len.sum())
+    starts = np.cumsum(block_len) - block_len
+    row_block = np.repeat(np.arange(n_blocks), block_len)
+    row_pos = np.arange(n_rows) - starts[row_block]
+    width = max((len(c_in) + len(c_out) for c_in, c_out in channels), default=0)
+    pdg_table = np.asarray([c_in + c_out + [0] * (width - len(c_in) - len(c_out)) for c_in, c_out in channels])
+    pdg = pdg_table[channel[row_block], row_pos] if n_rows else np.zeros(0, dtype=np.int64)
+    is_in = row_pos < n_in[row_block]
+
+    # Kinematics: on-shell outgoing particles, incoming particles share the summed four-momentum of their block
+    mass = _lookup(pdg, PARTICLE_MASSES, DEFAULT_MASS)
+    p = rng.normal(scale=0.4, size=(n_rows, 3))
+    p[is_in] = 0.0
+    energy = np.sqrt(mass**2 + (p**2).sum(axis=1))
+    energy[is_in] = 0.0
+    if n_blocks:
+        p_sum = np.add.reduceat(p, starts, axis=0) / n_in[:, None]
+        e_sum = np.add.reduceat(energy, starts) / n_in
+        p[is_in] = p_sum[row_block[is_in]]
+        energy[is_in] = e_sum[row_block[is_in]]
+        mass[is_in] = np.sqrt(np.maximum(energy[is_in]**2 - (p[is_in]**2).sum(axis=1), 0.0))
+    vertex = rng.normal(scale=3.0, size=(n_blocks, 3))[row_block] if n_blocks else np.zeros((0, 3))
+    charge = _lookup(pdg, PARTICLE_CHARGES, 0).astype(np.int64)
+
+    columns = [t_block[row_block], vertex[:, 0], vertex[:, 1], vertex[:, 2], mass, energy, p[:, 0], p[:, 1], p[:, 2],
+               pdg, np.arange(n_rows), charge]
+    data_lines = [DATA_LINE_FORMAT % row for row in zip(*(c.tolist() for c in columns))]
+
+    lines = list(OSCAR_HEADER)
+    block = 0
+    for event in range(n_events):
+        for _ in range(n_blocks_event[event]):
+            lines.append(f"# interaction in {n_in[block]} out {n_out[block]} rho 0.0000000 weight {weight[block]:.6e} "
+                         f"partial {partial[block]:.7f} type {PROCESS_TYPE_DECAY}")
+            lines.extend(data_lines[starts[block] : starts[block] + block_len[block]])
+            block += 1
+        lines.append(f"# event {event} ensemble 0 end 0 impact   0.000 scattering_projectile_target yes")
+    text = "\n".join(lines) + "\n"
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return {"path": str(path), "n_events": n_events, "n_empty_events": int((n_blocks_event == 0).sum()),
+            "n_blocks": n_blocks, "n_rows": n_rows, "n_bytes": len(text)}
+
+## Function to write a synthetic data directory with run_<run_id>_<suffix> folders (layout expected by aggregate_runs)
+def write_synthetic_dataset(root_dir: str | Path, data_dir: str, n_runs: int, filename: str = "Dileptons.oscar",
+                            run_id: int = 1000, seed: int = 0, **kwargs) -> list[dict]:
+    '''
+    Writes n_runs synthetic files root_dir/data_dir/run_<run_id>_<suffix>/filename with different seeds
+    (seed + suffix). Further keyword arguments are passed to write_synthetic_dilepton_file.
+    '''
+    return [write_synthetic_dilepton_file(Path(root_dir) / data_dir / f"run_{run_id}_{suffix}" / filename,
+                                          seed=seed + suffix, **kwargs)
+            for suffix in range(n_runs)]
+
+# -----------------------------
+# MAIN SCRIPT
+# -----------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic SMASH Dileptons.oscar files.")
+    parser.add_argument("path", help="output file (or data directory if --runs is given)")
+    parser.add_argument("--events", type=int, default=1000, help="number of events per file")
+    parser.add_argument("--empty-fraction", type=float, default=0.3, help="fraction of events without dileptons")
+    parser.add_argument("--blocks-per-event", type=int, nargs=2, default=(1, 3), metavar=("MIN", "MAX"),
+                        help="number of blocks of a non-empty event")
+    parser.add_argument("--weight-range", type=float, nargs=2, default=(1e-8, 1e-5), metavar=("MIN", "MAX"),
+                        help="range of the log-uniform block weights")
+    parser.add_argument("--runs", type=int, default=None, help="write this many run_<id>_<suffix> folders")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+
+    options = dict(n_events=args.events, empty_fraction=args.empty_fraction,
+                   blocks_per_event=tuple(args.blocks_per_event), weight_range=tuple(args.weight_range), seed=args.seed)
+    if args.runs is None:
+        summaries = [write_synthetic_dilepton_file(args.path, **options)]
+    else:
+        target = Path(args.path)
+        summaries = write_synthetic_dataset(target.parent, target.name, args.runs, **options)
+    for summary in summaries:
+        print(f"{summary['path']}: {summary['n_events']:,} events ({summary['n_empty_events']:,} empty), "
+              f"{summary['n_blocks']:,} blocks, {summary['n_rows']:,} rows, {summary['n_bytes'] / 1024**2:.1f} MB")
+# End of script
@@ -15,6 +15,9 @@ LOCAL_TARGET="$HOME/dev/python/bachelor-thesis-physics/05_Files_from_Virgo"
 # dry run flag: true -> nur anzeigen, false -> wirklich kopieren
 DRY_RUN=false
 
+# Nur die Shards (Dileptons.shard.npz, siehe dilepton_shards.py) statt der Textdateien kopieren
+SHARDS_ONLY=false
+
 # Mehrere Ordner: einfach Liste pflegen
 FOLDERS_TO_COPY=(
   "Dilepton_Out_Std_Nevents_1m_OutInt_NaN"
@@ -26,6 +29,10 @@ FOLDERS_TO_COPY=(
 RSYNC_OPTS="-avz --info=progress2"
 
 # DO NOT TOUCH!
+if [[ "$SHARDS_ONLY" == true ]]; then
+    # Ordnerstruktur behalten, nur *.shard.npz übertragen (bereits komprimiert, daher ohne -z)
+    RSYNC_OPTS="${RSYNC_OPTS/-avz/-av} --include=*/ --include=*.shard.npz --exclude=* --prune-empty-dirs"
+fi
 if [[ "$DRY_RUN" == true ]]; then
     RSYNC_OPTS="$RSYNC_OPTS --dry-run"
     echo "[DRY-RUN] Es werden keine Daten kopiert"
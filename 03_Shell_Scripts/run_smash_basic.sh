@@ -42,6 +42,15 @@ CONTAINER=/lustre/hyihp/AG-Elfner/Containers/Production/smash-3.3-max.sif
 RUN_ID_BASE=Dilepton_Out_Std_Nevents_10000x100_OutInt_NaN
 OUTPUT_ROOT=$SLURM_WORKING_DIR/smash_outputs
 
+# Post-step: Dileptons.oscar in einen komprimierten, typisierten Shard umwandeln (02_Python_Scripts/dilepton_shards.py),
+# damit nur noch Dileptons.shard.npz kopiert und gelesen werden muss (copy_smash_data.sh mit SHARDS_ONLY=true).
+# Standardmäßig aus (REDUCE_TO_SHARD=true zum Einschalten); ein Fehler im Post-Step lässt den Task nicht fehlschlagen
+REDUCE_TO_SHARD=${REDUCE_TO_SHARD:-false}
+# Textdatei nach erfolgreicher Umwandlung löschen
+DELETE_TEXT_AFTER_SHARD=${DELETE_TEXT_AFTER_SHARD:-false}
+ANALYSIS_REPO=${ANALYSIS_REPO:-$SLURM_WORKING_DIR/bachelor-thesis-physics}
+PYTHON_CONTAINER=${PYTHON_CONTAINER:-$ANALYSIS_REPO/../python_container/python312.sif}
+
 usage() {
     echo "Usage: $0 [-c config.yaml] [-d decay.txt] [-C container.sif] [-o output_root] [-r run_id_base] [-- smash_args]"
 }
@@ -88,4 +97,23 @@ echo "Extra SMASH args:   ${SMASH_EXTRA_ARGS[*]:-<none>}"
 # Run SMASH
 singularity exec "$CONTAINER" smash -i "$CONFIG_FILE" -d "$DECAY_FILE" -o "$run_out_dir/" -n "${SMASH_EXTRA_ARGS[@]}"
 
-echo "SMASH run completed. Outputs are in $run_out_dir/"
\ No newline at end of file
+echo "SMASH run completed. Outputs are in $run_out_dir/"
+
+# Post-step (im Python-Container, Repo als /work eingebunden)
+if [[ "$REDUCE_TO_SHARD" == true && -f "$run_out_dir/Dileptons.oscar" ]]; then
+    SHARD_ARGS=("$run_out_dir/Dileptons.oscar")
+    if [[ "$DELETE_TEXT_AFTER_SHARD" == true ]]; then
+        SHARD_ARGS+=("--delete-source")
+    fi
+    # Nicht fatal: die SMASH-Ausgabe ist bereits vollständig, der Shard kann später nachgebaut werden
+    if apptainer exec --bind "$ANALYSIS_REPO:/work" --bind "$run_out_dir" "$PYTHON_CONTAINER" bash -lc '
+      set -euo pipefail
+      cd /work
+      source .venv/bin/activate
+      python3 ./02_Python_Scripts/dilepton_shards.py "$@"
+    ' _ "${SHARD_ARGS[@]}"; then
+        echo "Shard written: $run_out_dir/Dileptons.shard.npz"
+    else
+        echo "WARNING: shard failed for $run_out_dir/Dileptons.oscar (SMASH output kept)" >&2
+    fi
+fi
\ No newline at end of file